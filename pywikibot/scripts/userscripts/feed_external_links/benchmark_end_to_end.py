@@ -0,0 +1,808 @@
+#!/usr/bin/env python
+"""benchmark_end_to_end.py
+
+This script runs feed_external_links.py end to end against a local HTTP
+server that serves synthetic RSS 2.0 and Atom feeds and a stand-in for the
+MediaWiki API, and outputs the time of each stage, the pages edited per
+second, and the peak memory of each run as JSON.
+
+Each run starts a new Python process with a temporary Pywikibot directory
+whose family points to the local server, so no wiki is edited.
+
+SCRIPT OPTIONS
+==============
+(Arguments available for this script)
+
+-sources:n[,n...]       How many sources to serve. A list of values is swept.
+
+-queries:n[,n...]       How many queries to write to the config. A list of
+                        values is swept.
+
+-pages:n[,n...]         How many pages the queries add links to. A list of
+                        values is swept.
+
+-entries:n              How many entries to serve in each feed.
+
+-content-size:n         How many bytes of text to write to the description
+                        or summary of each entry.
+
+-delay:n                How many milliseconds to wait before responding to
+                        each feed request.
+
+-output-path:x          File path to write the JSON results to. They are
+                        output to the console by default.
+
+Other arguments are passed to feed_external_links.py. For example,
+`-pipeline` or `-section-edit` can be benchmarked.
+"""
+"""
+Copyright 2020 David Wong
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import itertools
+import subprocess
+from copy import deepcopy
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypedDict
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import resource
+except ImportError:
+    resource = None  # type: ignore
+
+
+class BenchmarkOptionTypedDict(TypedDict, total=False):
+    sources: List[int]
+    queries: List[int]
+    pages: List[int]
+    entries: int
+    content_size: int
+    delay: float
+    output_path: str
+    bot_args: List[str]
+
+
+class StageTimeTypedDict(TypedDict):
+    calls: int
+    busy_seconds: float
+    wall_seconds: float
+
+
+class RunResultTypedDict(TypedDict, total=False):
+    sources: int
+    queries: int
+    pages: int
+    entries: int
+    delay: float
+    seconds: float
+    pages_edited: int
+    pages_per_second: float
+    peak_memory: Optional[int]
+    stages: Dict[str, StageTimeTypedDict]
+    api_requests: int
+    exit_code: int
+
+
+BENCHMARK_OPTION: BenchmarkOptionTypedDict = {
+    "sources": [10],
+    "queries": [10],
+    "pages": [10],
+    "entries": 100,
+    "content_size": 0,
+    "delay": 0,
+    "bot_args": []
+}
+
+FAMILY_NAME: str = "feedbench"
+USERNAME: str = "Benchmark"
+CHILD_ARG: str = "-benchmark-child"
+
+SITE_NAMESPACES: Dict[int, Tuple[str, str]] = {
+    -2: ("Media", "first-letter"),
+    -1: ("Special", "first-letter"),
+    0: ("", "first-letter"),
+    1: ("Talk", "first-letter"),
+    2: ("User", "first-letter"),
+    3: ("User talk", "first-letter"),
+    4: ("Project", "first-letter"),
+    5: ("Project talk", "first-letter"),
+    6: ("File", "first-letter"),
+    7: ("File talk", "first-letter"),
+    8: ("MediaWiki", "first-letter"),
+    9: ("MediaWiki talk", "first-letter"),
+    10: ("Template", "first-letter"),
+    11: ("Template talk", "first-letter"),
+    12: ("Help", "first-letter"),
+    13: ("Help talk", "first-letter"),
+    14: ("Category", "first-letter"),
+    15: ("Category talk", "first-letter")
+}
+
+USER_RIGHTS: List[str] = ["read", "edit", "createpage", "writeapi", "bot", "apihighlimits", "noratelimit", "autoconfirmed", "minoredit"]
+
+# The API modules that the stand-in describes to Pywikibot, and the prefixes of their parameters.
+ACTION_MODULES: Dict[str, str] = {
+    "query": "",
+    "parse": "",
+    "edit": "",
+    "login": "lg",
+    "clientlogin": "login",
+    "logout": "",
+    "paraminfo": ""
+}
+QUERY_MODULES: Dict[str, Dict[str, str]] = {
+    "prop": {"info": "in", "revisions": "rv", "categoryinfo": "ci", "pageprops": "pp", "langlinks": "ll", "templates": "tl", "imageinfo": "ii"},
+    "list": {"allpages": "ap"},
+    "meta": {"siteinfo": "si", "userinfo": "ui", "tokens": ""}
+}
+GENERATOR_MODULES: List[str] = ["allpages", "templates"]
+TOKEN_TYPES: List[str] = ["csrf", "login", "patrol", "rollback", "userrights", "watch"]
+POSTED_MODULES: List[str] = ["edit", "login", "clientlogin", "logout"]
+
+PAGE_TEXT: str = (
+    "Lorem ipsum dolor sit amet, '''consectetur''' adipiscing elit, [[sed do]] eiusmod tempor incididunt.\n"
+    "\n"
+    "== History ==\n"
+    "Ut enim ad minim veniam, quis nostrud [[exercitation]] ullamco.<ref>Reference</ref>\n"
+    "\n"
+    "== External links ==\n"
+    "* [http://domain.tld/old Old link]\n"
+    "\n"
+    "[[Category:Pages]]"
+)
+CONTENT_TEXT: str = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. "
+
+
+def get_keyword(q: int) -> str:
+    return f"topic{q}"
+
+
+def get_page_title(p: int) -> str:
+    return f"Page {p}"
+
+
+def get_entry_content(content_size: int) -> str:
+    return (CONTENT_TEXT * (content_size // len(CONTENT_TEXT) + 1))[:content_size]
+
+
+def write_rss_feed(source: int, number_of_entries: int, number_of_queries: int, content_size: int = 0) -> bytes:
+    buffer: List[str] = ['<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0">\n<channel>\n<title>RSS</title>\n<link>http://domain.tld/</link>\n']
+    description = (f"<description>{get_entry_content(content_size)}</description>" if content_size > 0 else "")
+    for i in range(number_of_entries):
+        published = formatdate(1577836800 - (i * 60), usegmt=True)
+        buffer.append(
+            f"<item><title>Entry {i} about {get_keyword((source + i) % number_of_queries)}</title>"
+            f"<link>http://domain.tld/{source}/{i}</link><guid>rss-{source}-{i}</guid><pubDate>{published}</pubDate>{description}</item>\n"
+        )
+
+    buffer.append("</channel>\n</rss>\n")
+    return "".join(buffer).encode("utf8")
+
+
+def write_atom_feed(source: int, number_of_entries: int, number_of_queries: int, content_size: int = 0) -> bytes:
+    buffer: List[str] = ['<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n<title>Atom</title>\n<id>urn:feed</id>\n']
+    summary = (f"<summary>{get_entry_content(content_size)}</summary>" if content_size > 0 else "")
+    for i in range(number_of_entries):
+        published = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1577836800 - (i * 60)))
+        buffer.append(
+            f"<entry><title>Entry {i} about {get_keyword((source + i) % number_of_queries)}</title>"
+            f'<link href="http://domain.tld/{source}/{i}"/><id>atom-{source}-{i}</id><published>{published}</published>{summary}</entry>\n'
+        )
+
+    buffer.append("</feed>\n")
+    return "".join(buffer).encode("utf8")
+
+
+def write_config(path: str, base_url: str, number_of_sources: int, number_of_queries: int, number_of_pages: int) -> None:
+    config = {
+        "sources": [f"{base_url}/feeds/{s}.xml" for s in range(number_of_sources)],
+        "queries": [
+            {
+                "keywords": [get_keyword(q)],
+                "pages": [get_page_title(p) for p in range(q % number_of_pages, number_of_pages, max(number_of_queries, 1))]
+            }
+            for q in range(number_of_queries)
+        ]
+    }
+    with open(path, "w", encoding="utf8") as file:
+        json.dump(config, file, indent=4)
+
+
+class FakeWiki:
+    """Pages and counters of the MediaWiki API stand-in."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.texts: Dict[str, str] = {}
+        self.revisions: Dict[str, int] = {}
+        self.next_revision = 1
+        self.api_requests = 0
+        self.edits = 0
+
+    def get_text(self, title: str) -> str:
+        if title not in self.texts:
+            self.texts[title] = PAGE_TEXT
+            self.revisions[title] = self.next_revision
+            self.next_revision += 1
+
+        return self.texts[title]
+
+    def save_text(self, title: str, text: str) -> int:
+        self.texts[title] = text
+        self.revisions[title] = self.next_revision
+        self.next_revision += 1
+        self.edits += 1
+        return self.revisions[title]
+
+
+def get_section_bounds(text: str, section: int) -> Tuple[int, int]:
+    """Get the start and end of a section by its index, counting only line headings."""
+
+    index = 0
+    start = 0
+    offset = 0
+    level = 0
+    for line in text.split("\n"):
+        stripped_line = line.rstrip()
+        if stripped_line.startswith("=") and stripped_line.endswith("=") and len(stripped_line.strip("=")) > 0:
+            line_level = min(len(stripped_line) - len(stripped_line.lstrip("=")), len(stripped_line) - len(stripped_line.rstrip("=")))
+            if index == section and line_level <= level:
+                return start, offset - 1
+
+            index += 1
+            if index == section:
+                start = offset
+                level = line_level
+
+        offset += len(line) + 1
+
+    return start, len(text)
+
+
+def get_sections(text: str) -> List[Dict[str, Any]]:
+    sections: List[Dict[str, Any]] = []
+    for line in text.split("\n"):
+        stripped_line = line.rstrip()
+        if stripped_line.startswith("=") and stripped_line.endswith("=") and len(stripped_line.strip("=")) > 0:
+            level = min(len(stripped_line) - len(stripped_line.lstrip("=")), len(stripped_line) - len(stripped_line.rstrip("=")))
+            sections.append({
+                "toclevel": level - 1,
+                "level": str(level),
+                "line": stripped_line[level:-level].strip(),
+                "number": str(len(sections) + 1),
+                "index": str(len(sections) + 1),
+                "fromtitle": "",
+                "anchor": ""
+            })
+
+    return sections
+
+
+class BenchmarkServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, number_of_entries: int, number_of_queries: int, delay: float, content_size: int = 0) -> None:
+        super().__init__(("127.0.0.1", 0), BenchmarkRequestHandler)
+        self.number_of_entries = number_of_entries
+        self.number_of_queries = number_of_queries
+        self.content_size = content_size
+        self.delay = delay
+        self.feeds: Dict[str, bytes] = {}
+        self.wiki = FakeWiki()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class BenchmarkRequestHandler(BaseHTTPRequestHandler):
+    server: BenchmarkServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path.startswith("/feeds/"):
+            self.send_feed(url.path)
+        elif url.path.endswith("/api.php"):
+            self.send_api(parse_qs(url.query))
+        else:
+            self.send_body(b"Not found", "text/plain", 404)
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf8")
+        if self.headers.get("Content-Type", "").startswith("multipart/form-data"):
+            self.send_body(b"Multipart requests are not supported.", "text/plain", 400)
+            return
+
+        parameters = parse_qs(url.query)
+        parameters.update(parse_qs(body, keep_blank_values=True))
+        self.send_api(parameters)
+
+    def send_feed(self, path: str) -> None:
+        server = self.server
+        if server.delay > 0:
+            time.sleep(server.delay)
+
+        name = os.path.basename(path)
+        if name not in server.feeds:
+            source = int(os.path.splitext(name)[0])
+            write_feed = (write_rss_feed if source % 2 == 0 else write_atom_feed)
+            server.feeds[name] = write_feed(source, server.number_of_entries, server.number_of_queries, server.content_size)
+
+        self.send_body(server.feeds[name], "application/xml")
+
+    def send_api(self, query: Dict[str, List[str]]) -> None:
+        parameters: Dict[str, str] = {key: values[-1] for key, values in query.items()}
+        wiki = self.server.wiki
+        with wiki.lock:
+            wiki.api_requests += 1
+            result = get_api_result(wiki, parameters, self.server.base_url)
+
+        self.send_body(json.dumps(result).encode("utf8"), "application/json; charset=utf-8")
+
+
+def get_siteinfo(parameters: Dict[str, str], base_url: str) -> Dict[str, Any]:
+    siteinfo: Dict[str, Any] = {}
+    for siprop in parameters.get("siprop", "general").split("|"):
+        if siprop == "general":
+            siteinfo["general"] = {
+                "mainpage": "Main Page",
+                "base": f"{base_url}/wiki/Main_Page",
+                "sitename": "Feed benchmark",
+                "generator": "MediaWiki 1.35.0",
+                "phpversion": "7.4.0",
+                "phpsapi": "cli",
+                "dbtype": "sqlite",
+                "dbversion": "3",
+                "case": "first-letter",
+                "lang": "en",
+                "fallback": [],
+                "fallback8bitEncoding": "windows-1252",
+                "writeapi": True,
+                "timezone": "UTC",
+                "timeoffset": 0,
+                "articlepath": "/wiki/$1",
+                "scriptpath": "/w",
+                "script": "/w/index.php",
+                "server": base_url,
+                "servername": "127.0.0.1",
+                "wikiid": FAMILY_NAME,
+                "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "maxarticlesize": 2097152,
+                "legaltitlechars": " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+",
+                "invalidusernamechars": "@:",
+                "maxuploadsize": 104857600,
+                "linkprefixcharset": "",
+                "linktrail": "/^([a-z]+)(.*)$/sD",
+                "rights": "",
+                "variantarticlepath": False,
+                "interwikimagic": True,
+                "readonly": False,
+                "thumblimits": {"0": 120, "1": 150},
+                "imagelimits": {"0": {"width": 320, "height": 240}},
+                "magiclinks": {"ISBN": False, "PMID": False, "RFC": False},
+                "categorycollation": "uppercase"
+            }
+        elif siprop == "namespaces":
+            siteinfo["namespaces"] = {
+                str(namespace_id): {
+                    "id": namespace_id,
+                    "case": case,
+                    "name": name,
+                    "canonical": name,
+                    "content": (namespace_id == 0),
+                    "subpages": (namespace_id > 0),
+                    "nonincludable": False
+                }
+                for namespace_id, (name, case) in SITE_NAMESPACES.items()
+            }
+        elif siprop in ("namespacealiases", "extensions", "interwikimap", "magicwords", "specialpagealiases", "languages", "skins", "extensiontags", "functionhooks", "showhooks", "protocols", "restrictions", "fileextensions"):
+            siteinfo[siprop] = []
+        else:
+            siteinfo[siprop] = {}
+
+    return siteinfo
+
+
+def get_module_info(path: str) -> Dict[str, Any]:
+    """Describe an API module for `action=paraminfo`."""
+
+    name = path.rsplit("+", 1)[-1]
+    module: Dict[str, Any] = {"name": name, "path": path, "parameters": []}
+    if path == "main":
+        module["prefix"] = ""
+        module["parameters"] = [
+            {"name": "action", "type": list(ACTION_MODULES), "submodules": {action: action for action in ACTION_MODULES}},
+            {"name": "format", "type": ["json"]}
+        ]
+    elif path == "query":
+        module["prefix"] = ""
+        module["parameters"] = [
+            {"name": group, "type": list(modules), "multi": True, "limit": 50, "highlimit": 500, "submodules": {module_name: f"query+{module_name}" for module_name in modules}}
+            for group, modules in QUERY_MODULES.items()
+        ] + [
+            {"name": "generator", "type": GENERATOR_MODULES, "submodules": {module_name: f"query+{module_name}" for module_name in GENERATOR_MODULES}},
+            {"name": "titles", "type": "string", "multi": True, "limit": 50, "highlimit": 500},
+            {"name": "pageids", "type": "integer", "multi": True, "limit": 50, "highlimit": 500},
+            {"name": "revids", "type": "integer", "multi": True, "limit": 50, "highlimit": 500},
+            {"name": "redirects", "type": "boolean"},
+            {"name": "continue", "type": "string"}
+        ]
+    elif path.startswith("query+"):
+        group = next((group for group, modules in QUERY_MODULES.items() if name in modules), None)
+        if group is None:
+            return {"name": name, "path": path, "missing": True}
+
+        module["prefix"] = QUERY_MODULES[group][name]
+        module["group"] = group
+        if name in GENERATOR_MODULES:
+            module["generator"] = True
+
+        module["parameters"] = [
+            {"name": "prop", "type": ["ids", "content", "timestamp"], "multi": True, "limit": 50, "highlimit": 500},
+            {"name": "limit", "type": "limit", "min": 1, "max": 500, "highmax": 5000},
+            {"name": "continue", "type": "string"}
+        ]
+        if name == "tokens":
+            module["parameters"].append({"name": "type", "type": TOKEN_TYPES, "multi": True, "limit": 50, "highlimit": 500})
+    elif path in ACTION_MODULES:
+        module["prefix"] = ACTION_MODULES[path]
+        if path in POSTED_MODULES:
+            module["mustbeposted"] = True
+    else:
+        return {"name": name, "path": path, "missing": True}
+
+    return module
+
+
+def get_page_result(wiki: FakeWiki, title: str, parameters: Dict[str, str], page_id: int) -> Dict[str, Any]:
+    page: Dict[str, Any] = {
+        "pageid": page_id,
+        "ns": 0,
+        "title": title,
+        "contentmodel": "wikitext",
+        "pagelanguage": "en",
+        "pagelanguagehtmlcode": "en",
+        "pagelanguagedir": "ltr",
+        "touched": "2020-01-01T00:00:00Z",
+        "length": 0,
+        "protection": [],
+        "restrictiontypes": ["edit", "move"]
+    }
+    if ":" in title and not title.startswith("Page"):
+        page["missing"] = ""
+        return page
+
+    text = wiki.get_text(title)
+    page["lastrevid"] = wiki.revisions[title]
+    page["length"] = len(text.encode("utf8"))
+    if "revisions" in parameters.get("prop", "").split("|"):
+        rvprop = parameters.get("rvprop", "ids|timestamp").split("|")
+        if "rvsection" in parameters:
+            start, end = get_section_bounds(text, int(parameters["rvsection"]))
+            text = text[start:end]
+
+        revision: Dict[str, Any] = {
+            "revid": wiki.revisions[title],
+            "parentid": 0,
+            "user": USERNAME,
+            "userid": 1,
+            "timestamp": "2020-01-01T00:00:00Z",
+            "comment": "",
+            "minor": False,
+            "sha1": ""
+        }
+        if "content" in rvprop:
+            if "rvslots" in parameters:
+                revision["slots"] = {"main": {"contentmodel": "wikitext", "contentformat": "text/x-wiki", "content": text, "*": text}}
+            else:
+                revision["contentmodel"] = "wikitext"
+                revision["contentformat"] = "text/x-wiki"
+                revision["content"] = text
+                revision["*"] = text
+
+        page["revisions"] = [revision]
+
+    return page
+
+
+def get_api_result(wiki: FakeWiki, parameters: Dict[str, str], base_url: str = "") -> Dict[str, Any]:
+    """Get the result of an API request for the few modules that the bot uses."""
+
+    action = parameters.get("action", "")
+    is_formatversion_2 = (parameters.get("formatversion") == "2")
+    if action == "query":
+        result: Dict[str, Any] = {"batchcomplete": True, "query": {}}
+        if "curtimestamp" in parameters:
+            result["curtimestamp"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+        for meta in parameters.get("meta", "").split("|"):
+            if meta == "siteinfo":
+                result["query"].update(get_siteinfo(parameters, base_url))
+            elif meta == "userinfo":
+                result["query"]["userinfo"] = {
+                    "id": 1,
+                    "name": USERNAME,
+                    "groups": ["*", "user", "autoconfirmed", "bot"],
+                    "rights": USER_RIGHTS,
+                    "ratelimits": {},
+                    "messages": False
+                }
+            elif meta == "tokens":
+                result["query"]["tokens"] = {f"{token_type}token": "benchmark+\\" for token_type in parameters.get("type", "csrf").split("|")}
+
+        titles = [title for title in parameters.get("titles", "").split("|") if len(title) > 0]
+        if len(titles) > 0:
+            pages = [get_page_result(wiki, title, parameters, -(i + 1) if ":" in title else (i + 1)) for i, title in enumerate(titles)]
+            result["query"]["pages"] = (pages if is_formatversion_2 else {str(page["pageid"]): page for page in pages})
+
+        return result
+    elif action == "paraminfo":
+        return {"paraminfo": {"modules": [get_module_info(path) for path in parameters.get("modules", "").split("|") if len(path) > 0]}}
+    elif action == "parse":
+        text = wiki.get_text(parameters.get("page", ""))
+        return {"parse": {"title": parameters.get("page", ""), "pageid": 1, "sections": get_sections(text)}}
+    elif action in ("login", "clientlogin"):
+        if action == "login":
+            return {"login": {"result": "Success", "lguserid": 1, "lgusername": USERNAME}}
+
+        return {"clientlogin": {"status": "PASS", "username": USERNAME}}
+    elif action == "edit":
+        title = parameters["title"]
+        text = wiki.get_text(title)
+        if "appendtext" in parameters:
+            text = text + parameters["appendtext"]
+        elif "section" in parameters and parameters["section"].isdigit():
+            start, end = get_section_bounds(text, int(parameters["section"]))
+            text = text[:start] + parameters["text"] + text[end:]
+        else:
+            text = parameters.get("text", "")
+
+        old_revision = wiki.revisions[title]
+        new_revision = wiki.save_text(title, text)
+        return {"edit": {
+            "result": "Success",
+            "pageid": 1,
+            "title": title,
+            "contentmodel": "wikitext",
+            "oldrevid": old_revision,
+            "newrevid": new_revision,
+            "newtimestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }}
+    elif action == "logout":
+        return {}
+
+    return {"error": {"code": "badvalue", "info": f"Unrecognized value for parameter \"action\": {action}."}}
+
+
+def write_pywikibot_dir(path: str, base_url: str) -> None:
+    with open(os.path.join(path, "user-config.py"), "w", encoding="utf8") as file:
+        file.write(
+            f"family = {FAMILY_NAME!r}\n"
+            f"mylang = {FAMILY_NAME!r}\n"
+            f"family_files[{FAMILY_NAME!r}] = {base_url + '/w/api.php'!r}\n"
+            f"usernames[{FAMILY_NAME!r}]['*'] = {USERNAME!r}\n"
+            "put_throttle = 0\n"
+            "minthrottle = 0\n"
+            "maxthrottle = 0\n"
+            "maxlag = 0\n"
+            "console_encoding = 'utf-8'\n"
+            "noisysleep = float('inf')\n"
+        )
+
+
+def run_child(result_path: str, args: List[Any]) -> None:
+    """Run the bot in this process, time its stages, and write the result."""
+
+    stages: Dict[str, StageTimeTypedDict] = {}
+    stage_bounds: Dict[str, List[float]] = {}
+    stage_lock = threading.Lock()
+
+    def add_time(stage_name: str, start: float, end: float, calls: int) -> None:
+        # The wall time spans the start of the first call to the end of the last.
+        with stage_lock:
+            stage = stages.setdefault(stage_name, {"calls": 0, "busy_seconds": 0, "wall_seconds": 0})
+            stage["calls"] += calls
+            stage["busy_seconds"] += (end - start)
+            bounds = stage_bounds.setdefault(stage_name, [start, end])
+            bounds[0] = min(bounds[0], start)
+            bounds[1] = max(bounds[1], end)
+            stage["wall_seconds"] = bounds[1] - bounds[0]
+
+    def timed(stage_name: str, function: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*function_args: Any, **function_kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return function(*function_args, **function_kwargs)
+            finally:
+                add_time(stage_name, start, time.perf_counter(), 1)
+
+        return wrapper
+
+    def timed_generator(stage_name: str, function: Callable[..., Iterator[Any]]) -> Callable[..., Iterator[Any]]:
+        """Wrap a generator function to add the time of each item to a stage."""
+
+        def wrapper(*function_args: Any, **function_kwargs: Any) -> Iterator[Any]:
+            iterator = iter(function(*function_args, **function_kwargs))
+            calls = 1
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    add_time(stage_name, start, time.perf_counter(), calls)
+                    return
+
+                add_time(stage_name, start, time.perf_counter(), calls)
+                calls = 0
+                yield item
+
+        return wrapper
+
+    import pywikibot
+    import feed_external_links
+
+    feed_external_links.fetch_feed = timed("fetch", feed_external_links.fetch_feed)
+    feed_external_links.match_source = timed("match", feed_external_links.match_source)
+    feed_external_links.save_external_links = timed("save", feed_external_links.save_external_links)
+    feed_external_links.save_external_links_section = timed("save", feed_external_links.save_external_links_section)
+    # With `-async-save`, the pages are saved on the put thread instead.
+    feed_external_links.PageSaver.run_save = timed("save", feed_external_links.PageSaver.run_save)  # type: ignore
+    pywikibot.site.APISite.preloadpages = timed_generator("preload", pywikibot.site.APISite.preloadpages)
+
+    start = time.perf_counter()
+    exit_code = 0
+    try:
+        feed_external_links.main(*args)
+    except SystemExit as exception:
+        exit_code = (exception.code if isinstance(exception.code, int) else 1)
+
+    result: RunResultTypedDict = {
+        "seconds": time.perf_counter() - start,
+        # Linux reports the max resident set size in kilobytes.
+        "peak_memory": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource is not None else None),
+        "stages": stages,
+        "exit_code": exit_code
+    }
+    with open(result_path, "w", encoding="utf8") as file:
+        json.dump(result, file)
+
+
+def run_once(benchmark_option: BenchmarkOptionTypedDict, number_of_sources: int, number_of_queries: int, number_of_pages: int) -> RunResultTypedDict:
+    server = BenchmarkServer(benchmark_option["entries"], number_of_queries, benchmark_option["delay"], benchmark_option["content_size"])
+    server_thread = threading.Thread(target=server.serve_forever, name="benchmark_server", daemon=True)
+    server_thread.start()
+
+    run_dir = tempfile.mkdtemp(prefix="feed_benchmark_")
+    try:
+        base_url = server.base_url
+        write_pywikibot_dir(run_dir, base_url)
+        config_path = os.path.join(run_dir, "config.json")
+        write_config(config_path, base_url, number_of_sources, number_of_queries, number_of_pages)
+        result_path = os.path.join(run_dir, "result.json")
+
+        environment = dict(os.environ)
+        environment["PYWIKIBOT_DIR"] = run_dir
+        environment.pop("PYWIKIBOT_NO_USER_CONFIG", None)
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        environment["PYTHONPATH"] = os.pathsep.join([script_dir] + ([environment["PYTHONPATH"]] if "PYTHONPATH" in environment else []))
+        arguments = [
+            sys.executable,
+            os.path.abspath(__file__),
+            CHILD_ARG,
+            result_path,
+            f"-config-path:{config_path}",
+            f"-history-path:{os.path.join(run_dir, 'history.sqlite3')}"
+        ] + benchmark_option["bot_args"]
+        completed_process = subprocess.run(arguments, cwd=run_dir, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        result: RunResultTypedDict = {}
+        if os.path.exists(result_path):
+            with open(result_path, encoding="utf8") as file:
+                result = json.load(file)
+        else:
+            result = {"exit_code": completed_process.returncode}
+            sys.stderr.write(completed_process.stderr.decode("utf8", "replace"))
+
+        seconds = result.get("seconds", 0)
+        result.update({
+            "pages_edited": server.wiki.edits,
+            "pages_per_second": (server.wiki.edits / seconds if seconds > 0 else 0),
+            "sources": number_of_sources,
+            "queries": number_of_queries,
+            "pages": number_of_pages,
+            "entries": benchmark_option["entries"],
+            "delay": benchmark_option["delay"],
+            "api_requests": server.wiki.api_requests
+        })
+        return result
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def run_benchmark(benchmark_option: BenchmarkOptionTypedDict) -> List[RunResultTypedDict]:
+    results: List[RunResultTypedDict] = []
+    for number_of_sources, number_of_queries, number_of_pages in itertools.product(benchmark_option["sources"], benchmark_option["queries"], benchmark_option["pages"]):
+        sys.stderr.write(f"Running with {number_of_sources} sources, {number_of_queries} queries, and {number_of_pages} pages...\n")
+        results.append(run_once(benchmark_option, number_of_sources, number_of_queries, number_of_pages))
+
+    return results
+
+
+def parse_values(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if len(item.strip()) > 0]
+
+
+def main(*args: str) -> None:
+    benchmark_option: BenchmarkOptionTypedDict = deepcopy(BENCHMARK_OPTION)
+
+    for arg in args:
+        key, seperator, value = arg.partition(":")
+        stripped_value = value.strip()
+        if key == "-sources":
+            benchmark_option["sources"] = parse_values(stripped_value)
+        elif key == "-queries":
+            benchmark_option["queries"] = parse_values(stripped_value)
+        elif key == "-pages":
+            benchmark_option["pages"] = parse_values(stripped_value)
+        elif key == "-entries":
+            benchmark_option["entries"] = int(stripped_value)
+        elif key == "-content-size":
+            benchmark_option["content_size"] = int(stripped_value)
+        elif key == "-delay":
+            benchmark_option["delay"] = float(stripped_value) / 1000
+        elif key == "-output-path":
+            benchmark_option["output_path"] = stripped_value
+        else:
+            benchmark_option["bot_args"].append(arg)
+
+    results = run_benchmark(benchmark_option)
+    output = json.dumps(results, indent=4)
+    if "output_path" in benchmark_option:
+        with open(benchmark_option["output_path"], "w", encoding="utf8") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == CHILD_ARG:
+        run_child(sys.argv[2], sys.argv[3:])
+    else:
+        main(*sys.argv[1:])
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""benchmark_feed_parser.py
+
+This script compares the streaming feed parser of feed_external_links.py with
+feedparser on large local RSS 2.0 and Atom fixtures, and outputs the time and
+peak memory of each parser.
+
+SCRIPT OPTIONS
+==============
+(Arguments available for this script)
+
+-entries:n              How many entries to write to each fixture.
+
+-repeat:n               How many times to parse each fixture with each parser.
+                        The fastest time is reported.
+
+-fixtures-dir:x         Directory to write the fixtures to. A temporary
+                        directory is used by default.
+"""
+"""
+Copyright 2020 David Wong
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import time
+import tempfile
+import tracemalloc
+from copy import deepcopy
+from email.utils import formatdate
+from typing import Any, Callable, List, Tuple, TypedDict
+
+import feedparser
+import pywikibot
+
+from feed_external_links import FeedParserType, iter_file_chunks, parse_feed
+
+
+class BenchmarkOptionTypedDict(TypedDict, total=False):
+    entries: int
+    repeat: int
+    fixtures_dir: str
+
+
+class BenchmarkResultTypedDict(TypedDict):
+    fixture: str
+    parser: str
+    entries: int
+    seconds: float
+    peak_memory: int
+
+
+BENCHMARK_OPTION: BenchmarkOptionTypedDict = {
+    "entries": 100000,
+    "repeat": 3
+}
+
+ENTRY_DESCRIPTION: str = "&lt;p&gt;" + ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20) + "&lt;/p&gt;"
+
+
+def write_rss_fixture(path: str, number_of_entries: int) -> None:
+    with open(path, "w", encoding="utf8") as file:
+        file.write('<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0">\n<channel>\n<title>RSS fixture</title>\n<link>http://domain.tld/</link>\n')
+        for i in range(number_of_entries):
+            published = formatdate(1577836800 - (i * 60), usegmt=True)
+            file.write(
+                f"<item><title>Entry {i} about nuclear energy</title><link>http://domain.tld/pages/{i}</link>"
+                f'<guid isPermaLink="false">rss-{i}</guid><pubDate>{published}</pubDate>'
+                f"<description>{ENTRY_DESCRIPTION}</description></item>\n"
+            )
+
+        file.write("</channel>\n</rss>\n")
+
+
+def write_atom_fixture(path: str, number_of_entries: int) -> None:
+    with open(path, "w", encoding="utf8") as file:
+        file.write('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n<title>Atom fixture</title>\n<id>urn:fixture</id>\n')
+        for i in range(number_of_entries):
+            published = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1577836800 - (i * 60)))
+            file.write(
+                f'<entry><title>Entry {i} about STEM</title><link href="http://domain.tld/entries/{i}"/>'
+                f"<id>atom-{i}</id><published>{published}</published><updated>{published}</updated>"
+                f'<summary type="html">{ENTRY_DESCRIPTION}</summary></entry>\n'
+            )
+
+        file.write("</feed>\n")
+
+
+def parse_with_feedparser(path: str) -> int:
+    with open(path, "rb") as file:
+        feed = feedparser.parse(file.read())
+
+    return len(feed.entries)
+
+
+def parse_with_stream(path: str) -> int:
+    feed = parse_feed(lambda: iter_file_chunks(path), None, FeedParserType.STREAM)
+    number_of_entries = 0
+    for entry in feed.entries:
+        number_of_entries += 1
+
+    return number_of_entries
+
+
+def measure(parse: Callable[[str], int], path: str, repeat: int) -> Tuple[int, float, int]:
+    number_of_entries = 0
+    fastest = float("inf")
+    peak_memory = 0
+    for i in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        number_of_entries = parse(path)
+        seconds = (time.perf_counter() - start)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        fastest = min(fastest, seconds)
+        peak_memory = max(peak_memory, peak)
+
+    return number_of_entries, fastest, peak_memory
+
+
+def run_benchmark(benchmark_option: BenchmarkOptionTypedDict) -> List[BenchmarkResultTypedDict]:
+    number_of_entries = benchmark_option["entries"]
+    repeat = benchmark_option["repeat"]
+    fixtures_dir = (benchmark_option["fixtures_dir"] if "fixtures_dir" in benchmark_option else tempfile.mkdtemp(prefix="feed_fixtures_"))
+    os.makedirs(fixtures_dir, exist_ok=True)
+
+    fixtures: List[Tuple[str, Callable[[str, int], None]]] = [
+        ("rss.xml", write_rss_fixture),
+        ("atom.xml", write_atom_fixture)
+    ]
+    parsers: List[Tuple[str, Callable[[str], int]]] = [
+        (str(FeedParserType.FEEDPARSER), parse_with_feedparser),
+        (str(FeedParserType.STREAM), parse_with_stream)
+    ]
+
+    results: List[BenchmarkResultTypedDict] = []
+    for filename, write_fixture in fixtures:
+        path = os.path.join(fixtures_dir, filename)
+        pywikibot.output(f"Writing {number_of_entries} entries to \"{path}\"...")
+        write_fixture(path, number_of_entries)
+
+        for parser_name, parse in parsers:
+            entries, seconds, peak_memory = measure(parse, path, repeat)
+            results.append({
+                "fixture": filename,
+                "parser": parser_name,
+                "entries": entries,
+                "seconds": seconds,
+                "peak_memory": peak_memory
+            })
+
+    return results
+
+
+def output_results(results: List[BenchmarkResultTypedDict]) -> None:
+    pywikibot.output("")
+    pywikibot.output("{0:<10} {1:<12} {2:>10} {3:>12} {4:>16}".format("Fixture", "Parser", "Entries", "Seconds", "Peak memory (MB)"))
+    for result in results:
+        pywikibot.output("{0:<10} {1:<12} {2:>10} {3:>12.3f} {4:>16.1f}".format(
+            result["fixture"],
+            result["parser"],
+            result["entries"],
+            result["seconds"],
+            result["peak_memory"] / (1024 * 1024)
+        ))
+
+
+def main(*args: Tuple[Any, ...]) -> None:
+    benchmark_option: BenchmarkOptionTypedDict = deepcopy(BENCHMARK_OPTION)
+
+    local_args = pywikibot.handle_args(args)
+    for arg in local_args:
+        key, seperator, value = arg.partition(":")
+        stripped_value = value.strip()
+        if key == "-entries":
+            benchmark_option["entries"] = int(stripped_value)
+        elif key == "-repeat":
+            benchmark_option["repeat"] = int(stripped_value)
+        elif key == "-fixtures-dir":
+            benchmark_option["fixtures_dir"] = stripped_value
+
+    results = run_benchmark(benchmark_option)
+    output_results(results)
+
+
+if __name__ == "__main__":
+    main()
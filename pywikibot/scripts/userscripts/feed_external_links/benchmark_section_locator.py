@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""benchmark_section_locator.py
+
+This script compares the section locator of feed_external_links.py, which
+only parses the section that the links are added to, with a full
+mwparserfromhell parse of large generated pages. It checks that both give the
+same page text, and outputs the time of each.
+
+SCRIPT OPTIONS
+==============
+(Arguments available for this script)
+
+-sections:n             How many sections to write to each page.
+
+-repeat:n               How many times to add the links to each page with each
+                        method. The fastest time is reported.
+"""
+"""
+Copyright 2020 David Wong
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import time
+from copy import deepcopy
+from typing import Any, Callable, List, Optional, Tuple, TypedDict
+
+import pywikibot
+from feed_external_links import EntriesDataType, FeedEntry, feed_external_links_by_parse, feed_external_links_by_scan
+
+
+class BenchmarkOptionTypedDict(TypedDict, total=False):
+    sections: int
+    repeat: int
+
+
+class BenchmarkResultTypedDict(TypedDict):
+    page: str
+    method: str
+    length: int
+    seconds: float
+    is_same: bool
+
+
+BENCHMARK_OPTION: BenchmarkOptionTypedDict = {
+    "sections": 500,
+    "repeat": 5
+}
+
+LocatorDataType = Callable[[str, str, EntriesDataType], Optional[Tuple[str, int]]]
+
+SECTION_TEXT: str = (
+    "{{Main|Related article}}\n"
+    "Lorem ipsum dolor sit amet, '''consectetur''' adipiscing elit, [[sed do]] eiusmod tempor incididunt.<ref>{{cite web|url=http://domain.tld/ref|title=Reference}}</ref>\n"
+    "\n"
+    "* Ut enim ad minim veniam, quis nostrud [[exercitation]] ullamco.\n"
+    "* Duis aute irure dolor in ''reprehenderit'' in voluptate.<ref name=\"shared\" />\n"
+    "\n"
+    "{| class=\"wikitable\"\n! Header\n|-\n| Cell\n|}\n"
+)
+
+
+def write_page(number_of_sections: int, has_external_links_section: bool) -> str:
+    buffer: List[str] = ["{{Infobox\n| name = Page\n| field = Value\n}}\n", SECTION_TEXT]
+    for i in range(number_of_sections):
+        buffer.append(f"\n== Section {i} ==\n{SECTION_TEXT}")
+        if i % 5 == 0:
+            buffer.append(f"\n=== Subsection {i} ===\n{SECTION_TEXT}")
+
+    if has_external_links_section:
+        buffer.append("\n== External links ==\n* [http://domain.tld/old Old link]\n* [http://domain.tld/other Other link]\n{{Navbox}}\n")
+
+    buffer.append("\n[[Category:Pages]]\n")
+    return "".join(buffer)
+
+
+def measure(locate: LocatorDataType, page_text: str, repeat: int) -> Tuple[Optional[str], float]:
+    # No entries are added while timing so that the links added are not output every time.
+    revised_page_text: Optional[str] = None
+    fastest = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = locate("Page", page_text, [])
+        seconds = (time.perf_counter() - start)
+        fastest = min(fastest, seconds)
+        if result is not None:
+            revised_page_text = result[0]
+
+    return revised_page_text, fastest
+
+
+def run_benchmark(benchmark_option: BenchmarkOptionTypedDict) -> List[BenchmarkResultTypedDict]:
+    number_of_sections = benchmark_option["sections"]
+    repeat = benchmark_option["repeat"]
+    entries: EntriesDataType = [FeedEntry("New link", "http://domain.tld/new", None, None)]
+
+    pages: List[Tuple[str, str]] = [
+        ("existing", write_page(number_of_sections, True)),
+        ("new", write_page(number_of_sections, False))
+    ]
+    locators: List[Tuple[str, LocatorDataType]] = [
+        ("parse", feed_external_links_by_parse),
+        ("scan", feed_external_links_by_scan)
+    ]
+
+    results: List[BenchmarkResultTypedDict] = []
+    for page_name, page_text in pages:
+        # Both methods must give the same page text with an entry added.
+        expected_result = feed_external_links_by_parse("Page", page_text, entries)
+        scan_result = feed_external_links_by_scan("Page", page_text, entries)
+        is_same = (scan_result == expected_result)
+        if scan_result is None:
+            pywikibot.warning(f"Page \"{page_name}\" fell back to a full parse.")
+
+        for method_name, locate in locators:
+            revised_page_text, seconds = measure(locate, page_text, repeat)
+            results.append({
+                "page": page_name,
+                "method": method_name,
+                "length": len(page_text),
+                "seconds": seconds,
+                "is_same": (is_same if method_name == "scan" else True)
+            })
+
+    return results
+
+
+def output_results(results: List[BenchmarkResultTypedDict]) -> None:
+    pywikibot.output("")
+    pywikibot.output("{0:<10} {1:<8} {2:>12} {3:>12} {4:>6}".format("Page", "Method", "Length", "Seconds", "Same"))
+    for result in results:
+        pywikibot.output("{0:<10} {1:<8} {2:>12} {3:>12.4f} {4:>6}".format(
+            result["page"],
+            result["method"],
+            result["length"],
+            result["seconds"],
+            ("yes" if result["is_same"] else "no")
+        ))
+
+
+def main(*args: Tuple[Any, ...]) -> None:
+    benchmark_option: BenchmarkOptionTypedDict = deepcopy(BENCHMARK_OPTION)
+
+    local_args = pywikibot.handle_args(args)
+    for arg in local_args:
+        key, seperator, value = arg.partition(":")
+        stripped_value = value.strip()
+        if key == "-sections":
+            benchmark_option["sections"] = int(stripped_value)
+        elif key == "-repeat":
+            benchmark_option["repeat"] = int(stripped_value)
+
+    results = run_benchmark(benchmark_option)
+    output_results(results)
+
+
+if __name__ == "__main__":
+    main()
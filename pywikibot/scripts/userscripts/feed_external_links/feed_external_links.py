@@ -23,13 +23,120 @@ SCRIPT OPTIONS
 -config-page-title:x    Page title of the config file on the wiki. Used with
                         `-config-type:wiki` argument.
 
--history-path:x         File path of the history file.
+-config-page-prefix:x   Title prefix of the config pages on the wiki. Every
+                        page with the prefix is a config file, and it is used
+                        instead of `-config-page-title`. Used with
+                        `-config-type:wiki` argument.
+
+-config-cache-path:x    File path of the config cache file. The compiled
+                        config of each wiki page is cached by revision, and
+                        only changed pages are downloaded and compiled.
+
+-history-path:x         File path of the history database.
+
+-import-history-path:x  File path of a history JSON file to import into the
+                        history database.
+
+-history-max-age:n      How many days the history of a link is kept after it
+                        was last added to a page.
+
+-new-entries-only       Stop reading a date-ordered feed at the first entry
+                        that was read in a previous run.
+                        An argument for `-history-path` must be specified.
+
+-max-entry-age:n        Discard entries published more than this many days
+                        ago.
 
 -max-add:n              How many times a unique link is added to a page.
                         An argument for `-history-path` must be specified.
 
+-max-links-per-page:n   Add only the newest n links found for each page.
+
+-queue-min-links:n      Queue the links found for a page until at least this
+                        many are queued, and then add them in one edit.
+                        An argument for `-history-path` must be specified.
+
+-queue-max-age:n        Add the queued links of a page once the oldest was
+                        queued this many hours ago, even if fewer than
+                        `-queue-min-links` are queued.
+
+-queue-window:x         Add the queued links of every page when the script
+                        runs during this daily window of local time, such as
+                        "01:00-05:00".
+
+-flush-queue            Add the queued links of every page now.
+
+-retention-max-links:n  Keep only the newest n links that the bot added to
+                        the "External links" section of a page. Older links
+                        are removed when links are added to the page.
+                        An argument for `-history-path` must be specified.
+
+-retention-max-age:n    Remove the links that the bot last added more than
+                        this many days ago when links are added to the page.
+                        An argument for `-history-path` must be specified.
+
+-retention-batch:n      Remove links only once at least this many are past
+                        the retention policy of a page.
+
+-archive-subpage:x      Append the removed links of a page to its subpage
+                        with this title, such as "Archived links", instead of
+                        discarding them.
+
 -group:n                How many pages to preload at once.
 
+-workers:n              How many processes to parse and search the feeds and
+                        add the links to the page text in. The main process
+                        fetches the feeds and saves the pages.
+
+-pipeline               Match entries, preload pages and edit pages while
+                        the feeds are still being fetched. A page is
+                        preloaded as soon as an entry is found for it, and
+                        edited as soon as all of its sources are matched.
+
+-daemon                 Keep running, and fetch each source on its own
+                        schedule. The schedule is learned from the `ttl` and
+                        `sy:updatePeriod` of the feed and the gaps between
+                        its new entries.
+
+-poll-min-interval:n    How many minutes to wait at least between fetches of
+                        a source in daemon mode.
+
+-poll-max-interval:n    How many minutes to wait at most between fetches of
+                        a source in daemon mode.
+
+-shard-path:x           File path of a shard database shared by several
+                        instances of the script. The page titles are split
+                        into shards, and each instance leases its share of
+                        the shards, only fetches the sources of their pages,
+                        and only edits their pages.
+                        The instances must share the history database.
+
+-shards:n               How many shards to split the page titles into when
+                        the shard database is created.
+
+-shard-lease-time:n     How many minutes the lease of a shard lasts unless it
+                        is renewed. The shards of an instance that stops are
+                        claimed by the other instances after this time.
+
+-shard-join-time:n      How many seconds an instance waits after it joins the
+                        shard database before it claims its shards, so that
+                        the instances started at the same time split the
+                        shards between them.
+
+-instance-id:x          Unique name of this instance in the shard database.
+                        The host name and process ID are used by default.
+
+-section-edit           Edit only the "External links" section of a page
+                        instead of the whole page, or append the links to the
+                        end of the page when the section is the last one.
+                        The whole page is edited when the section must be
+                        created.
+
+-async-save             Save each page on a background thread while the next
+                        page is rewritten. The pages are still saved one at
+                        a time with the put throttle, and the history of a
+                        page is only updated once it is saved.
+
 -proxy:x                Specify the same proxy as both HTTP and HTTPS for
                         all sources.
 
@@ -38,6 +145,67 @@ SCRIPT OPTIONS
 -https-proxy:x          Specify an HTTPS proxy for all sources.
 
 -proxies-path:x         File path of the proxies file.
+
+-proxy-match:x          Proxy match of "first" or "last".
+                        For "first", the first rule of the proxies file that
+                        matches a source is used.
+                        For "last", the last rule of the proxies file that
+                        matches a source is used.
+                        Rules with a higher priority are used before either.
+
+-feed-cache-path:x      File path of the feed cache file. Sources are fetched
+                        with the ETag and Last-Modified validators of the
+                        previous run, and feeds that are not modified or have
+                        the same content are skipped.
+
+-fetch-concurrency:n    How many sources to fetch at once.
+
+-fetch-host-concurrency:n
+                        How many sources to fetch at once from the same host.
+
+-fetch-timeout:n        How many seconds to wait for a source to be fetched.
+
+-check-links            Check the links of the new entries before they are
+                        added. Links that are not found are discarded, and
+                        links that are permanently redirected are replaced by
+                        their new location. The links are checked with the
+                        concurrency, timeout and proxies of the sources.
+
+-link-cache-path:x      File path of the link cache file. The result of each
+                        link checked is cached, so the same link is not
+                        checked again for other pages or in later runs.
+
+-link-cache-ttl:n       How many hours the result of a link check is cached.
+
+-feed-parser:x          Feed parser of "stream" or "feedparser".
+                        For "stream", RSS 2.0 and Atom feeds are parsed
+                        incrementally, and other feeds are parsed with
+                        feedparser.
+                        For "feedparser", all feeds are parsed with
+                        feedparser.
+
+-metrics-path:x         File path to export the time spent in each stage and
+                        the counts of feeds, entries, matches, discards, bytes
+                        and pages to when the script exits. In daemon mode,
+                        it is also exported after each cycle.
+
+-metrics-format:x       Metrics format of "json" or "prometheus".
+                        For "prometheus", the file is written in the text
+                        format of the Prometheus node exporter textfile
+                        collector.
+
+-quiet                  Output one line for each page instead of its revised
+                        text, and count the entries that are discarded or
+                        have the same title as another entry instead of
+                        warning about each of them.
+
+-diff                   Output a unified diff of the text of each page
+                        instead of its revised text.
+
+-summary-log:x          File path of a log to append a JSON record of each
+                        page to, with its title, whether it was saved,
+                        unchanged, queued, or failed, and how many links
+                        were added.
 """
 """
 Copyright 2020 David Wong
@@ -55,20 +223,46 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
 import math
+import calendar
 import json
+import pickle
 import re
-import concurrent.futures
+import sqlite3
+import time
+import random
+import hashlib
+import heapq
+import socket
+import html
+import difflib
+import functools
+import asyncio
+import threading
+import queue
+import logging
+import signal
+import multiprocessing
+import multiprocessing.pool
+import xml.etree.ElementTree as ElementTree
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from operator import attrgetter
+from contextlib import contextmanager
 from enum import Enum
 from copy import deepcopy
-from typing import Any, Optional, Union, TypedDict, Pattern, Match, List, Dict, Tuple, Set, Iterable, Iterator, Generator
+from typing import Any, Optional, Union, TypedDict, NamedTuple, Pattern, Match, List, Dict, Tuple, Set, Iterable, Iterator, Generator, Callable, Deque, TypeVar, cast
+from urllib.parse import urlparse
 from urllib.request import ProxyHandler
 
 import feedparser
 from feedparser import FeedParserDict
 
+try:
+    from feedparser.datetimes import _parse_date as parse_feed_date
+except ImportError:
+    from feedparser import _parse_date as parse_feed_date
+
 import mwparserfromhell
 from mwparserfromhell.nodes.external_link import ExternalLink
 import pywikibot
@@ -83,15 +277,21 @@ requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
 class ConfigQueryRegexTypedDict(TypedDict, total=False):
     pattern: str
     flags: Union[str, int, List[Union[str, int]]]
+    fields: List[str]
 
 
 class ConfigQueryTypedDict(TypedDict, total=False):
     pages: List[str]
     keywords: List[str]
     regexes: List[Union[str, ConfigQueryRegexTypedDict]]
+    fields: List[str]
+
+
+class ConfigFieldsTypedDict(TypedDict, total=False):
+    fields: List[str]
 
 
-class ConfigTypedDict(TypedDict):
+class ConfigTypedDict(ConfigFieldsTypedDict):
     sources: List[str]
     queries: List[ConfigQueryTypedDict]
 
@@ -108,19 +308,118 @@ class ConfigType(Enum):
         return self.value
 
 
+class FeedParserType(Enum):
+    STREAM: str = "stream"
+    FEEDPARSER: str = "feedparser"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class MetricsFormat(Enum):
+    JSON: str = "json"
+    PROMETHEUS: str = "prometheus"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class ProxyMatchMode(Enum):
+    FIRST: str = "first"
+    LAST: str = "last"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class PageStatus(Enum):
+    SAVED: str = "saved"
+    UNCHANGED: str = "unchanged"
+    QUEUED: str = "queued"
+    FAILED: str = "failed"
+
+    def __str__(self) -> str:
+        return self.value
+
+
 class CommandOptionTypedDict(TypedDict, total=False):
     config_type: ConfigType
     config_path: str
     config_page_title: str
+    config_page_prefix: str
+    config_cache_path: str
     history_path: str
+    import_history_path: str
+    history_max_age: float
+    new_entries_only: bool
+    max_entry_age: float
     max_add: int
+    max_links: int
+
+    queue_min_links: int
+    queue_max_age: float
+    queue_window: Tuple[int, int]
+    flush_queue: bool
+
+    retention_max_links: int
+    retention_max_age: float
+    retention_batch: int
+    archive_subpage: str
 
     group: int
+    pipeline: bool
+    section_edit: bool
+    async_save: bool
+    workers: int
+
+    daemon: bool
+    poll_min_interval: float
+    poll_max_interval: float
+
+    shard_path: str
+    shards: int
+    shard_lease_time: float
+    shard_join_time: float
+    instance_id: str
 
     proxy: str
     http_proxy: str
     https_proxy: str
     proxies_path: str
+    proxy_match: ProxyMatchMode
+
+    feed_cache_path: str
+
+    fetch_concurrency: int
+    fetch_host_concurrency: int
+    fetch_timeout: float
+
+    check_links: bool
+    link_cache_path: str
+    link_cache_ttl: float
+
+    feed_parser: FeedParserType
+
+    metrics_path: str
+    metrics_format: MetricsFormat
+
+    quiet: bool
+    diff: bool
+    summary_log_path: str
+
+
+class OutputOptionTypedDict(TypedDict):
+    quiet: bool
+    diff: bool
+
+
+class PageRecordTypedDict(TypedDict, total=False):
+    time: float
+    title: str
+    status: str
+    entries: int
+    links_added: int
+    error: str
 
 
 class BotOptionTypedDict(TypedDict, total=False):
@@ -130,12 +429,20 @@ class BotOptionTypedDict(TypedDict, total=False):
 class QueryResultTypedDict(TypedDict):
     q: int
     query: ConfigQueryTypedDict
-    keyword_matches: List[Match]
+    keyword_matches: List[str]
     regex_matches: List[Match]
 
 
 ProxiesValueDataType = Union[str, Dict[str, str]]
-ProxiesDataType = Dict[str, ProxiesValueDataType]
+
+
+class ProxyRuleTypedDict(TypedDict, total=False):
+    regex: str
+    proxies: ProxiesValueDataType
+    priority: int
+
+
+ProxiesDataType = Union[Dict[str, ProxiesValueDataType], List[ProxyRuleTypedDict]]
 
 
 class SourceOptionValueTypedDict(TypedDict, total=False):
@@ -148,23 +455,154 @@ class SourceOptionValueTypedDict(TypedDict, total=False):
 SourceOptionDataType = Dict[str, SourceOptionValueTypedDict]
 
 
+class FeedCacheValueTypedDict(TypedDict, total=False):
+    etag: str
+    modified: str
+    hash: str
+    length: int
+    config_hash: str
+
+
+FeedCacheDataType = Dict[str, FeedCacheValueTypedDict]
+
+
+class LinkCacheValueTypedDict(TypedDict, total=False):
+    checked: float
+    status: int
+    location: str
+
+
+LinkCacheDataType = Dict[str, LinkCacheValueTypedDict]
+
+
+class FeedCacheStatus(Enum):
+    MISS: str = "miss"
+    NOT_MODIFIED: str = "not modified"
+    SAME_CONTENT: str = "same content"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class FeedPayloadTypedDict(TypedDict, total=False):
+    content: bytes
+    path: str
+    response_headers: Dict[str, str]
+    status: int
+    href: str
+    feed_parser: FeedParserType
+
+
+class FeedFetchResultTypedDict(TypedDict):
+    feed: Optional[FeedParserDict]
+    cache_status: FeedCacheStatus
+    cache_value: Optional[FeedCacheValueTypedDict]
+    bytes_received: int
+    bytes_saved: int
+    payload: Optional[FeedPayloadTypedDict]
+
+
 class SourceConfigValueTypedDict(TypedDict):
     option: SourceOptionValueTypedDict
-    feed: FeedParserDict
-    queries: List[ConfigQueryTypedDict]
+    fetch_result: FeedFetchResultTypedDict
+    plan: "QueryPlan"
+    published: List[float]
 
 
 SourceConfigDataType = Dict[str, SourceConfigValueTypedDict]
+
+
+class ConfigCacheValueTypedDict(TypedDict):
+    revision: int
+    plans: List["QueryPlan"]
+
+
+ConfigCacheDataType = Dict[str, ConfigCacheValueTypedDict]
+
+
+class SourceMarkTypedDict(TypedDict, total=False):
+    guid: str
+    published: float
+
+
+SourceMarkDataType = Dict[str, SourceMarkTypedDict]
+
+
+class SourceScheduleTypedDict(TypedDict):
+    interval: float
+    next_fetch: float
+    failures: int
+    last_published: Optional[float]
+
+
+SourceScheduleDataType = Dict[str, SourceScheduleTypedDict]
+
+
+class StageMetricTypedDict(TypedDict):
+    calls: int
+    seconds: float
+    max_seconds: float
+
+
+class MetricsTypedDict(TypedDict):
+    start_time: float
+    stages: Dict[str, StageMetricTypedDict]
+    counters: Dict[str, float]
+    gauges: Dict[str, float]
+
+
+class FeedEntry(NamedTuple):
+    """
+    The fields of a matched feed entry that its link is added with.
+
+    Entries are kept as these records instead of their `FeedParserDict`s, so
+    that the content, headers and namespaces of the feeds can be freed once
+    they are searched.
+    """
+
+    title: str
+    link: str
+    guid: Optional[str]
+    published: Optional[float]
+
+
+class FeedMatchResultTypedDict(TypedDict):
+    feed_info: Dict[str, Any]
+    exception: Optional[BaseException]
+    is_partial: bool
+    matches: List[List[FeedEntry]]
+    keyword_matches: int
+    regex_matches: int
+    mark: Optional[SourceMarkTypedDict]
+    published: List[float]
+    metrics: MetricsTypedDict
+    records: List[logging.LogRecord]
+
+
+class PageRevisionTypedDict(TypedDict):
+    text: str
+    revised_text: str
+    number_of_external_links_added: int
+    metrics: MetricsTypedDict
+    records: List[logging.LogRecord]
+
+
 LinkHistoryDataType = Dict[str, int]
 HistoryDataType = Dict[str, LinkHistoryDataType]
-EntriesDataType = List[FeedParserDict]
+EntriesDataType = List[FeedEntry]
 MatchesDataType = List[EntriesDataType]
 TitleEntriesDataType = Dict[str, EntriesDataType]
 PageEntriesDataType = Dict[pywikibot.page.Page, EntriesDataType]
 PageEntryGeneratorDataType = Generator[pywikibot.page.Page, None, None]
+TitleFilterDataType = Callable[[str], bool]
+TitleSourcesDataType = Dict[str, Set[str]]
 
 CONFIG_FILENAME: str = "config.json"
 CONFIG_PAGE_TITLE: str = f"MediaWiki:Feed external links/{CONFIG_FILENAME}"
+# Bumped when the pickled `QueryPlan` changes so that old caches are discarded.
+CONFIG_CACHE_VERSION: int = 3
+# How many pages the content is requested for at once.
+CONFIG_PAGE_BATCH_SIZE: int = 50
 
 COMMAND_OPTION: CommandOptionTypedDict = {
     "config_type": ConfigType.FILE,
@@ -173,9 +611,52 @@ COMMAND_OPTION: CommandOptionTypedDict = {
 
     "max_add": 1,
 
-    "group": 50
+    "group": 50,
+    "workers": 1,
+
+    "fetch_concurrency": 20,
+    "fetch_host_concurrency": 2,
+    "fetch_timeout": 60,
+
+    "link_cache_ttl": 168,
+
+    "feed_parser": FeedParserType.STREAM,
+
+    "proxy_match": ProxyMatchMode.LAST,
+
+    "metrics_format": MetricsFormat.JSON,
+
+    "poll_min_interval": 5,
+    "poll_max_interval": 1440,
+
+    "shards": 16,
+    "shard_lease_time": 10,
+    "shard_join_time": 30
+}
+
+# The poll interval in seconds of a source until its schedule is learned.
+POLL_INTERVAL: float = 3600
+# The fraction of the poll interval that it is randomly shifted by.
+POLL_JITTER: float = 0.1
+# How much the poll interval grows each time a source has no new entries.
+POLL_QUIET_FACTOR: float = 1.5
+# How many of the newest entries the gaps between entries are measured from.
+POLL_GAP_ENTRIES: int = 10
+
+SYNDICATION_UPDATE_PERIODS: Dict[str, float] = {
+    "hourly": 3600,
+    "daily": 86400,
+    "weekly": 604800,
+    "monthly": 2592000,
+    "yearly": 31536000
 }
 
+# The prefix of the metric names in the Prometheus textfile.
+METRICS_PREFIX: str = "feed_external_links"
+
+T = TypeVar("T")
+FunctionType = TypeVar("FunctionType", bound=Callable[..., Any])
+
 
 def fetch_json_file(path: str) -> Any:
     with open(path, encoding="utf8") as file:
@@ -195,585 +676,3740 @@ def fetch_proxies_file(path: str) -> ProxiesDataType:
     return fetch_json_file(path)
 
 
-def write_json_file(path: str, data: Any) -> None:
-    with open(path, "w", encoding="utf8") as file:
-        json.dump(data, file, indent=4)
+def fetch_feed_cache_file(path: str) -> FeedCacheDataType:
+    if not os.path.exists(path):
+        return {}
 
+    return fetch_json_file(path)
 
-def write_history_file(path: str, history: HistoryDataType) -> None:
-    write_json_file(path, history)
 
+def fetch_link_cache_file(path: str) -> LinkCacheDataType:
+    if not os.path.exists(path):
+        return {}
 
-def fetch_config_wiki_page(title: str) -> ConfigResultDataType:
-    site = pywikibot.Site()
-    page = pywikibot.Page(site, title)
+    return fetch_json_file(path)
 
-    if not page.exists():
-        raise pywikibot.exceptions.NoPage(page)
 
-    page_text = page.text
+def fetch_config_cache_file(path: str) -> ConfigCacheDataType:
+    if not os.path.exists(path):
+        return {}
 
     try:
-        config = json.loads(page_text)
-        return config
-    except json.decoder.JSONDecodeError as exception:
-        pywikibot.error("Invalid JSON syntax:")
-        pywikibot.output(page_text)
-        pywikibot.output("")
-        raise exception
+        with open(path, "rb") as file:
+            data = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as exception:
+        pywikibot.warning(f"Ignored the unreadable config cache file \"{path}\": {exception}")
+        return {}
 
+    if not isinstance(data, dict) or data.get("version") != CONFIG_CACHE_VERSION:
+        return {}
 
-def fetch_config(command_option: CommandOptionTypedDict) -> ConfigResultDataType:
-    config_type: ConfigType = command_option["config_type"]
-    if config_type == ConfigType.WIKI:
-        config_page_title: str = command_option["config_page_title"]
-        try:
-            return fetch_config_wiki_page(config_page_title)
-        except (pywikibot.exceptions.NoPage, json.decoder.JSONDecodeError) as exception:
-            pywikibot.exception(exception, tb=True)
-            pywikibot.output("")
-            pywikibot.output("")
+    config_cache: ConfigCacheDataType = data["pages"]
+    return config_cache
 
-    config_path: str = command_option["config_path"]
-    return fetch_config_file(config_path)
 
+def write_config_cache_file(path: str, config_cache: ConfigCacheDataType) -> None:
+    with open(path, "wb") as file:
+        pickle.dump({"version": CONFIG_CACHE_VERSION, "pages": config_cache}, file, protocol=pickle.HIGHEST_PROTOCOL)
 
-def parse_config(command_option: CommandOptionTypedDict) -> Tuple[ConfigsDataType, Set[str]]:
-    configs: ConfigResultDataType = fetch_config(command_option)
-    if isinstance(configs, dict):
-        configs = [configs]
-    elif not isinstance(configs, list):
-        raise TypeError("`configs` must be a dict or list.")
 
-    unique_sources: Set[str] = set()
-    for config in configs:
-        sources = config["sources"]
-        unique_sources.update(sources)
+def write_json_file(path: str, data: Any) -> None:
+    with open(path, "w", encoding="utf8") as file:
+        json.dump(data, file, indent=4)
 
-    return configs, unique_sources
 
+def write_feed_cache_file(path: str, feed_cache: FeedCacheDataType) -> None:
+    write_json_file(path, feed_cache)
 
-def get_source_options(command_option: CommandOptionTypedDict, sources: Iterable[str]) -> SourceOptionDataType:
-    # Create proxy handlers.
-    proxy_handler: Optional[ProxyHandler] = None
-    proxies: Dict[str, str] = {}
-    has_proxy: bool = False
-    if "proxy" in command_option:
-        proxy: str = command_option["proxy"]
-        proxies["http"] = proxy
-        proxies["https"] = proxy
-        has_proxy = True
 
-    if "http_proxy" in command_option:
-        http_proxy: str = command_option["http_proxy"]
-        proxies["http"] = http_proxy
-        has_proxy = True
+def write_link_cache_file(path: str, link_cache: LinkCacheDataType) -> None:
+    write_json_file(path, link_cache)
 
-    if "https_proxy" in command_option:
-        https_proxy: str = command_option["https_proxy"]
-        proxies["https"] = https_proxy
-        has_proxy = True
 
-    if has_proxy:
-        proxy_handler = ProxyHandler(proxies)
+class Metrics:
+    """
+    Time spent in each stage of a run, and counters of what each stage handled.
 
-    regex_proxies: ProxiesDataType = {}
-    if "proxies_path" in command_option:
-        path: str = command_option["proxies_path"]
-        regex_proxies = fetch_proxies_file(path)
+    The stages run on the fetch, match and preload threads at once, so the
+    seconds of the stages can add up to more than the time of the run.
+    """
 
-    compiled_pattern_proxies: Dict[Pattern, ProxiesValueDataType] = {re.compile(regex): proxies_value for regex, proxies_value in regex_proxies.items()}
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.start_time: float = time.time()
+        self.stages: Dict[str, StageMetricTypedDict] = {}
+        self.counters: Dict[str, float] = {}
+        # Values that can go down, such as the number of sources of the current cycle.
+        self.gauges: Dict[str, float] = {}
 
-    source_option: SourceOptionDataType = {}
-    for source in sources:
-        option: SourceOptionValueTypedDict = {
-            "proxies": proxies,
-            "has_proxy": has_proxy,
-            "handlers": proxy_handler
-        }
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
 
-        for compiled_pattern, proxies_value in compiled_pattern_proxies.items():
-            result = compiled_pattern.search(source)
-            if result is not None:
-                p = (proxies_value if isinstance(proxies_value, dict) else {
-                    "http": proxies_value,
-                    "https": proxies_value
-                })
+            stage_metric = self.stages[stage]
+            stage_metric["calls"] += 1
+            stage_metric["seconds"] += seconds
+            stage_metric["max_seconds"] = max(stage_metric["max_seconds"], seconds)
 
-                option["proxies"] = p
-                option["has_proxy"] = True
-                option["proxy_regex"] = compiled_pattern.pattern
-                option["handlers"] = ProxyHandler(p)
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
 
-        source_option[source] = option
+    def timed(self, stage: str) -> Callable[[FunctionType], FunctionType]:
+        """Decorate a function to time each call as `stage`."""
 
-    return source_option
+        def decorator(function: FunctionType) -> FunctionType:
+            @functools.wraps(function)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(stage):
+                    return function(*args, **kwargs)
 
+            return cast(FunctionType, wrapper)
 
-def fetch_feeds(source_option: SourceOptionDataType) -> Dict[str, FeedParserDict]:
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {executor.submit(feedparser.parse, source, handlers=option["handlers"]): source for source, option in source_option.items()}
-        feeds = {futures[future]: future.result() for future in concurrent.futures.as_completed(futures)}
-        return feeds
+        return decorator
 
+    def iterate(self, stage: str, iterable: Iterable[T]) -> Generator[T, None, None]:
+        """Yield the items of `iterable`, and time how long each item takes to be produced."""
 
-def get_source_queries(configs: ConfigsDataType) -> Dict[str, List[ConfigQueryTypedDict]]:
-    source_queries: Dict[str, List[ConfigQueryTypedDict]] = {}
+        iterator = iter(iterable)
+        while True:
+            with self.span(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
 
-    for config in configs:
-        sources = config["sources"]
-        queries = config["queries"]
-        for source in sources:
-            source_queries[source] = queries
+            yield item
 
-    return source_queries
+    def increment(self, counter: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
 
+    def set_gauge(self, gauge: str, value: float) -> None:
+        with self._lock:
+            self.gauges[gauge] = value
 
-def get_source_config(command_option: CommandOptionTypedDict) -> SourceConfigDataType:
-    configs, unique_sources = parse_config(command_option)
-    source_option = get_source_options(command_option, unique_sources)
-    source_feed = fetch_feeds(source_option)
-    source_queries = get_source_queries(configs)
+    def reset(self) -> None:
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.gauges.clear()
 
-    source_config: SourceConfigDataType = {}
-    for source in unique_sources:
-        source_config[source] = {
-            "option": source_option[source],
-            "feed": source_feed[source],
-            "queries": source_queries[source]
-        }
+    def merge(self, data: MetricsTypedDict) -> None:
+        """Add the metrics of another process, such as a worker process."""
 
-    return source_config
+        with self._lock:
+            for stage, stage_metric in data["stages"].items():
+                if stage not in self.stages:
+                    self.stages[stage] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
 
+                self.stages[stage]["calls"] += stage_metric["calls"]
+                self.stages[stage]["seconds"] += stage_metric["seconds"]
+                self.stages[stage]["max_seconds"] = max(self.stages[stage]["max_seconds"], stage_metric["max_seconds"])
 
-keyword_compiled_pattern: Dict[str, Pattern] = {}
+            for counter, value in data["counters"].items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
 
+            self.gauges.update(data["gauges"])
 
-def execute_queries(text: str, queries: List[ConfigQueryTypedDict]) -> Tuple[List[QueryResultTypedDict], int, int]:
-    query_results: List[QueryResultTypedDict] = []
-    number_of_keyword_matches: int = 0
-    number_of_regex_matches: int = 0
-    for q, query in enumerate(queries):
-        # Search by keywords.
-        keyword_matches: List[Match] = []
-        if "keywords" in query:
-            keywords = query["keywords"]
-            for keyword in keywords:
-                compiled_pattern: Optional[Pattern] = None
-                if keyword in keyword_compiled_pattern:
-                    compiled_pattern = keyword_compiled_pattern[keyword]
-                else:
-                    compiled_pattern = re.compile(r"\b({0})\b".format(keyword), flags=re.IGNORECASE)
-                    keyword_compiled_pattern[keyword] = compiled_pattern
+    def get_data(self) -> MetricsTypedDict:
+        with self._lock:
+            return {
+                "start_time": self.start_time,
+                "stages": deepcopy(self.stages),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges)
+            }
 
-                result = compiled_pattern.search(text)
-                if result is not None:
-                    keyword_matches.append(result)
-                    number_of_keyword_matches += 1
+    def format_json(self) -> str:
+        return json.dumps(self.get_data(), indent=4)
 
-        # Search by regexes.
-        regex_matches: List[Match] = []
-        if "regexes" in query:
-            regexes = query["regexes"]
-            for regex in regexes:
-                pattern = None
-                flags = 0
-                if isinstance(regex, str):
-                    pattern = regex
-                elif isinstance(regex, dict):
-                    if "pattern" in regex:
-                        pattern = regex["pattern"]
-                    else:
-                        pywikibot.error(f"Regex \"{regex}\" must have a pattern.")
-                        pywikibot.output("")
-                        continue
+    def format_prometheus(self) -> str:
+        data = self.get_data()
+        lines: List[str] = [
+            f"# TYPE {METRICS_PREFIX}_start_time_seconds gauge",
+            f"{METRICS_PREFIX}_start_time_seconds {data['start_time']}"
+        ]
 
-                    if "flags" in regex:
-                        regex_flags = regex["flags"]
-                        if isinstance(regex_flags, (str, int)):
-                            regex_flags = [regex_flags]
-                        elif not isinstance(regex_flags, list):
-                            pywikibot.error(f"Flags \"{regex_flags}\" must be a list, string, or int.")
-                            pywikibot.output("")
-                            continue
-
-                        f = 0
-                        for regex_flag in regex_flags:
-                            if isinstance(regex_flag, str):
-                                f += getattr(re, regex_flag)
-                            elif isinstance(regex_flag, int):
-                                f += regex_flag
-                            else:
-                                pywikibot.error(f"Flag \"{regex_flag}\" must be a string or int.")
-                                pywikibot.output("")
-                                continue
-
-                        flags = f
-                else:
-                    pywikibot.error(f"Regex \"{regex}\" must be a string or dict.")
-                    pywikibot.output("")
-                    continue
+        stage_samples: List[Tuple[str, str, Callable[[StageMetricTypedDict], float]]] = [
+            ("stage_calls_total", "counter", lambda stage_metric: stage_metric["calls"]),
+            ("stage_seconds_total", "counter", lambda stage_metric: stage_metric["seconds"]),
+            ("stage_max_seconds", "gauge", lambda stage_metric: stage_metric["max_seconds"])
+        ]
+        for name, metric_type, get_value in stage_samples:
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+            for stage, stage_metric in sorted(data["stages"].items()):
+                lines.append(f"{METRICS_PREFIX}_{name}{{stage=\"{stage}\"}} {get_value(stage_metric)}")
 
-                compiled_pattern = re.compile(pattern, flags=flags)
+        for counter, value in sorted(data["counters"].items()):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{counter}_total counter")
+            lines.append(f"{METRICS_PREFIX}_{counter}_total {value}")
 
-                result = compiled_pattern.search(text)
-                if result is not None:
-                    regex_matches.append(result)
-                    number_of_regex_matches += 1
+        for gauge, value in sorted(data["gauges"].items()):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{gauge} gauge")
+            lines.append(f"{METRICS_PREFIX}_{gauge} {value}")
 
-        query_results.append({
-            "q": q,
-            "query": query,
-            "keyword_matches": keyword_matches,
-            "regex_matches": regex_matches
-        })
+        return "\n".join(lines) + "\n"
 
-    return query_results, number_of_keyword_matches, number_of_regex_matches
 
+metrics = Metrics()
 
-def search_entries(feed: FeedParserDict, queries: List[ConfigQueryTypedDict], matches: MatchesDataType) -> Tuple[int, int]:
-    total_keyword_matches: int = 0
-    total_regex_matches: int = 0
 
-    entries: EntriesDataType = feed.entries
-    for entry in entries:
-        title: str = entry.title
+def write_metrics_file(path: str, metrics_format: MetricsFormat) -> None:
+    text = (metrics.format_prometheus() if metrics_format == MetricsFormat.PROMETHEUS else metrics.format_json())
 
-        query_results, number_of_keyword_matches, number_of_regex_matches = execute_queries(title, queries)
-        total_keyword_matches += number_of_keyword_matches
-        total_regex_matches += number_of_regex_matches
-        for query_result in query_results:
-            keyword_matches = query_result["keyword_matches"]
-            regex_matches = query_result["regex_matches"]
-            if len(keyword_matches) > 0 or len(regex_matches) > 0:
-                q = query_result["q"]
-                matches[q].append(entry)
+    # Replace the file at once so that a collector never reads it half written.
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf8") as file:
+        file.write(text)
 
-    return total_keyword_matches, total_regex_matches
+    os.replace(temporary_path, path)
 
 
-get_publish_date = attrgetter("published_parsed")
+# How much each page is output, set by `main`. Worker processes inherit it when they are forked.
+output_option: OutputOptionTypedDict = {
+    "quiet": False,
+    "diff": False
+}
 
+# The counters of the entries that are only counted with `-quiet`, and how they are summarized.
+QUIET_COUNTERS: Dict[str, str] = {
+    "entries_discarded_history": "discarded because their links were added before",
+    "entries_discarded_duplicate": "discarded because their links were duplicates",
+    "entries_discarded_no_link": "discarded because they had no link",
+    "entries_untitled": "titled with their summary or link because they had no title",
+    "entries_discarded_dead": "discarded because their links were not found",
+    "entries_same_title": "kept with the same title as another entry"
+}
 
-def process_matches(
-    queries: List[ConfigQueryTypedDict],
-    matches: MatchesDataType,
-    history: HistoryDataType,
-    max_add: int = 1
-) -> TitleEntriesDataType:
-    title_entries: TitleEntriesDataType = {}
 
-    # Add all matches to a page title in `title_entries`.
-    for q, query in enumerate(queries):
-        entries = matches[q]
-        if len(entries) > 0:
-            titles = query["pages"]
-            for title in titles:
-                if title not in title_entries:
-                    title_entries[title] = []
+def report_entry(counter: str, message: str) -> None:
+    """Count an entry that was discarded or has a warning, and output the warning unless the output is quiet."""
 
-                title_entries[title].extend(entries)
+    metrics.increment(counter)
+    if not output_option["quiet"]:
+        pywikibot.warning(message)
+        pywikibot.output("")
 
-    for title, entries in title_entries.items():
-        # Sort entries by date.
-        entries.sort(key=get_publish_date)
 
-        # History.
-        link_history: LinkHistoryDataType = (history[title] if title in history else {})
+def output_quiet_summary(counters: Dict[str, float]) -> None:
+    """Output how many entries were counted instead of reported since `counters` were taken from the metrics."""
 
-        # Remove duplicates.
-        unique_entries: EntriesDataType = []
-        unique_titles: Set[str] = set()
-        unique_links: Set[str] = set()
-        for entry in entries:
-            entry_link: str = entry.link
-            if entry_link in link_history:
-                number_of_times_added: int = link_history[entry_link]
-                if number_of_times_added >= max_add:
-                    pywikibot.warning("An entry for page \"{0}\" was discarded because its link \"{1}\" was added {2} {3} before.".format(
-                        title,
-                        entry_link,
-                        number_of_times_added,
-                        "time" + ("s" if number_of_times_added != 1 else "")
-                    ))
-                    pywikibot.output("")
-                    continue
+    if not output_option["quiet"]:
+        return
 
-            if entry_link in unique_links:
-                pywikibot.warning(f"An entry for page \"{title}\" was discarded because its link \"{entry_link}\" was a duplicate.")
-                pywikibot.output("")
-                continue
+    current_counters = metrics.get_data()["counters"]
+    for counter, description in QUIET_COUNTERS.items():
+        number_of_entries = int(current_counters.get(counter, 0) - counters.get(counter, 0))
+        if number_of_entries > 0:
+            pywikibot.output(f"{number_of_entries} {'entry' if number_of_entries == 1 else 'entries'} {description}.")
 
-            entry_title: str = entry.title
-            if title in unique_titles:
-                pywikibot.warning(f"An entry for page \"{title}\" has the same title \"{entry_title}\" as another entry.")
-                pywikibot.output("")
 
-            unique_titles.add(entry_title)
-            unique_links.add(entry_link)
-            unique_entries.append(entry)
+class SummaryLog:
+    """
+    Log of one JSON record per page, such as whether it was saved and how many links were added.
 
-        title_entries[title] = unique_entries
+    The records are written by a background thread through a buffered file,
+    so the bot does not wait for the file. Nothing is written until the log
+    is opened.
+    """
 
-    return title_entries
+    def __init__(self, queue_size: int = 10000) -> None:
+        self.queue_size = queue_size
+        self._queue: Optional["queue.Queue[Optional[PageRecordTypedDict]]"] = None
+        self._thread: Optional[threading.Thread] = None
 
+    def open(self, path: str) -> None:
+        """Start appending the records to a file."""
 
-def get_title_entries(
-    source_config: SourceConfigDataType,
-    history: HistoryDataType,
-    max_add: int = 1
-) -> TitleEntriesDataType:
-    title_entries: TitleEntriesDataType = {}
+        file = open(path, "a", encoding="utf8", buffering=65536)
+        self._queue = queue.Queue(self.queue_size)
+        self._thread = threading.Thread(target=self._write, args=(file, self._queue), name="summary_log", daemon=True)
+        self._thread.start()
 
-    for source, config in source_config.items():
-        pywikibot.output(f"Parsing feed from source \"{source}\"...")
+    def _write(self, file: Any, record_queue: "queue.Queue[Optional[PageRecordTypedDict]]") -> None:
+        try:
+            while True:
+                record = record_queue.get()
+                if record is None:
+                    break
+
+                file.write(json.dumps(record) + "\n")
+        finally:
+            file.close()
+
+    def write(self, title: str, status: PageStatus, entries: int = 0, links_added: int = 0, error: Optional[BaseException] = None) -> None:
+        if self._queue is None:
+            return
+
+        record: PageRecordTypedDict = {
+            "time": time.time(),
+            "title": title,
+            "status": str(status),
+            "entries": entries,
+            "links_added": links_added
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
 
-        option: SourceOptionValueTypedDict = config["option"]
-        feed: FeedParserDict = config["feed"]
-        queries: List[ConfigQueryTypedDict] = config["queries"]
+        self._queue.put(record)
 
-        has_proxy: bool = option["has_proxy"]
-        if has_proxy:
-            proxies = option["proxies"]
-            proxy_source = "command line"
-            if "proxy_regex" in option:
-                proxy_regex = option["proxy_regex"]
-                proxy_source = f"matched regex pattern \"{proxy_regex}\""
-            pywikibot.output(f"Using proxies \"{proxies}\" from {proxy_source}...")
+    def close(self) -> None:
+        """Write the queued records, and close the file."""
 
-        if "bozo_exception" in feed:
-            if "status" in feed:
-                status = feed["status"]
-                href = feed["href"]
-                pywikibot.error(f"Received HTTP status code {status} for \"{href}\".")
+        if self._queue is None or self._thread is None:
+            return
 
-            pywikibot.exception(feed["bozo_exception"])
-        else:
-            matches: MatchesDataType = [[] for i in range(len(queries))]
-            total_keyword_matches, total_regex_matches = search_entries(feed, queries, matches)
-            te: TitleEntriesDataType = process_matches(queries, matches, history, max_add)
-            for title, entries in te.items():
-                if title not in title_entries:
+        self._queue.put(None)
+        self._thread.join()
+        self._queue = None
+        self._thread = None
+
+
+summary_log = SummaryLog()
+
+
+class HistoryStore:
+    """
+    History of the links added to each page, stored in an SQLite database.
+
+    Each addition is committed as soon as it is recorded, so a crash only
+    loses the history of the page being saved. The link history of a page is
+    read once and then kept in memory.
+    """
+
+    def __init__(self, path: str = ":memory:", is_simulation: bool = False) -> None:
+        """
+        Initializer.
+        :param path: The file path of the database, or ":memory:".
+        :param is_simulation: Whether to copy the database into memory so that nothing is written to the file.
+        """
+
+        self.path = path
+        self.lock = threading.RLock()
+        self.link_histories: Dict[str, LinkHistoryDataType] = {}
+
+        connection = sqlite3.connect(path, check_same_thread=False)
+        try:
+            connection.execute("PRAGMA schema_version").fetchone()
+        except sqlite3.DatabaseError as exception:
+            connection.close()
+            raise ValueError(f"\"{path}\" is not a history database. A history JSON file can be imported with `-import-history-path`.") from exception
+
+        if is_simulation and path != ":memory:":
+            memory_connection = sqlite3.connect(":memory:", check_same_thread=False)
+            connection.backup(memory_connection)
+            connection.close()
+            connection = memory_connection
+        elif path != ":memory:":
+            connection.execute("PRAGMA journal_mode = WAL")
+
+        self.connection = connection
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    title TEXT NOT NULL,
+                    link TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    first_added REAL NOT NULL,
+                    last_added REAL NOT NULL,
+                    PRIMARY KEY (title, link)
+                ) WITHOUT ROWID
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS history_last_added ON history (last_added)")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS pending_edits (
+                    title TEXT NOT NULL,
+                    link TEXT NOT NULL,
+                    entry TEXT NOT NULL,
+                    queued REAL NOT NULL,
+                    PRIMARY KEY (title, link)
+                ) WITHOUT ROWID
+            """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS source_marks (
+                    source TEXT PRIMARY KEY,
+                    guid TEXT,
+                    published REAL
+                )
+            """)
+
+    def get_link_history(self, title: str) -> LinkHistoryDataType:
+        with self.lock:
+            if title not in self.link_histories:
+                rows = self.connection.execute("SELECT link, count FROM history WHERE title = ?", (title,))
+                self.link_histories[title] = {link: count for link, count in rows}
+
+            return self.link_histories[title]
+
+    def add(self, title: str, links: Iterable[str]) -> None:
+        """Increment the number of times each link was added to a page."""
+
+        now = time.time()
+        with self.lock:
+            link_history = self.get_link_history(title)
+            with self.connection:
+                for link in links:
+                    self.connection.execute("""
+                        INSERT INTO history (title, link, count, first_added, last_added) VALUES (?, ?, 1, ?, ?)
+                        ON CONFLICT (title, link) DO UPDATE SET count = count + 1, last_added = excluded.last_added
+                    """, (title, link, now, now))
+                    link_history[link] = (link_history.get(link, 0) + 1)
+
+    def get_link_times(self, title: str) -> Dict[str, float]:
+        """Get when each link was last added to a page."""
+
+        with self.lock:
+            rows = self.connection.execute("SELECT link, last_added FROM history WHERE title = ?", (title,))
+            return {link: last_added for link, last_added in rows}
+
+    def import_history(self, history: HistoryDataType) -> int:
+        """Import a history JSON file, keeping the larger count of each link."""
+
+        now = time.time()
+        number_of_links = 0
+        with self.lock, self.connection:
+            for title, link_history in history.items():
+                for link, count in link_history.items():
+                    self.connection.execute("""
+                        INSERT INTO history (title, link, count, first_added, last_added) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (title, link) DO UPDATE SET count = MAX(count, excluded.count)
+                    """, (title, link, count, now, now))
+                    number_of_links += 1
+
+            self.link_histories.clear()
+
+        return number_of_links
+
+    def compact(self, max_age: float) -> int:
+        """Remove the history of links that were last added more than `max_age` seconds ago."""
+
+        with self.lock, self.connection:
+            cursor = self.connection.execute("DELETE FROM history WHERE last_added < ?", (time.time() - max_age,))
+            self.link_histories.clear()
+            return cursor.rowcount
+
+    def queue_entries(self, title: str, entries: EntriesDataType) -> int:
+        """Queue the entries of a page to be added in a later edit. Links that are already queued are ignored."""
+
+        now = time.time()
+        number_of_entries = 0
+        with self.lock, self.connection:
+            for entry in entries:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO pending_edits (title, link, entry, queued) VALUES (?, ?, ?, ?)",
+                    (title, entry.link, json.dumps(entry), now)
+                )
+                number_of_entries += cursor.rowcount
+
+        return number_of_entries
+
+    def get_queued_entries(self, title: str) -> Tuple[EntriesDataType, float]:
+        """Get the queued entries of a page, and when the oldest was queued."""
+
+        entries: EntriesDataType = []
+        first_queued = float("inf")
+        with self.lock:
+            for entry, queued in self.connection.execute("SELECT entry, queued FROM pending_edits WHERE title = ?", (title,)):
+                entries.append(FeedEntry(*json.loads(entry)))
+                first_queued = min(first_queued, queued)
+
+        return entries, first_queued
+
+    def get_queued_titles(self) -> Dict[str, Tuple[int, float]]:
+        """Get how many entries are queued for each page, and when the oldest was queued."""
+
+        with self.lock:
+            rows = self.connection.execute("SELECT title, COUNT(*), MIN(queued) FROM pending_edits GROUP BY title")
+            return {title: (count, first_queued) for title, count, first_queued in rows}
+
+    def remove_queued_entries(self, title: str, links: Iterable[str]) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM pending_edits WHERE title = ? AND link = ?", ((title, link) for link in links))
+
+    def get_source_marks(self) -> SourceMarkDataType:
+        """Get the newest entry read from each source in previous runs."""
+
+        source_marks: SourceMarkDataType = {}
+        with self.lock:
+            for source, guid, published in self.connection.execute("SELECT source, guid, published FROM source_marks"):
+                mark: SourceMarkTypedDict = {}
+                if guid is not None:
+                    mark["guid"] = guid
+
+                if published is not None:
+                    mark["published"] = published
+
+                source_marks[source] = mark
+
+        return source_marks
+
+    def set_source_marks(self, source_marks: SourceMarkDataType) -> None:
+        with self.lock, self.connection:
+            for source, mark in source_marks.items():
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO source_marks (source, guid, published) VALUES (?, ?, ?)",
+                    (source, mark.get("guid"), mark.get("published"))
+                )
+
+    def clear_cache(self) -> None:
+        """Forget the link histories read so far, so that they are read again with the additions of other instances."""
+
+        with self.lock:
+            self.link_histories.clear()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+def get_shard_mark_key(source: str, shard: int) -> str:
+    # A URL cannot contain a space, so the key cannot be a source.
+    return f"{source} #{shard}"
+
+
+class ShardLeases:
+    """
+    Leases of the hash partitions of the page titles, stored in an SQLite database shared by several instances of the bot.
+
+    Each instance claims its share of the shards at the start of each cycle,
+    and only edits the pages of its shards. The leases are renewed by a
+    heartbeat thread, and the shards of an instance that stops renewing them
+    are claimed by the other instances once the leases expire. When an
+    instance joins, the others release their shards above the new share.
+    An instance waits for a while after it joins before it claims any
+    shard, so that the instances started at the same time share the shards
+    instead of the first one claiming all of them.
+    """
+
+    def __init__(self, path: str, instance_id: str, shards: int = 16, lease_time: float = 600) -> None:
+        """
+        Initializer.
+        :param path: The file path of the database.
+        :param instance_id: The unique name of this instance.
+        :param shards: How many shards the titles are split into. The count
+            of the database is used if it was created with another count.
+        :param lease_time: How many seconds a lease lasts unless it is renewed.
+        """
+
+        self.instance_id = instance_id
+        self.lease_time = lease_time
+        self.lock = threading.Lock()
+        self.owned_shards: Set[int] = set()
+        self._stop_event = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+        # The transactions are begun explicitly so that a claim is atomic across instances.
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        with self.transaction():
+            self.connection.execute("CREATE TABLE IF NOT EXISTS shard_config (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS leases (shard INTEGER PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS instances (instance TEXT PRIMARY KEY, expires REAL NOT NULL)")
+            self.connection.execute("INSERT OR IGNORE INTO shard_config (key, value) VALUES ('shards', ?)", (shards,))
+            row = self.connection.execute("SELECT value FROM shard_config WHERE key = 'shards'").fetchone()
+
+        self.shards: int = row[0]
+        if self.shards != shards:
+            pywikibot.warning(f"The shard database \"{path}\" splits the pages into {self.shards} shards, so they are used instead of {shards}.")
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+            self.connection.execute("COMMIT")
+
+    def get_shard(self, title: str) -> int:
+        # The built-in hash of a string differs between processes.
+        digest = hashlib.sha1(title.encode("utf8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.shards
+
+    def owns(self, title: str) -> bool:
+        return (self.get_shard(title) in self.owned_shards)
+
+    def register(self) -> None:
+        with self.transaction():
+            self.connection.execute("INSERT OR REPLACE INTO instances (instance, expires) VALUES (?, ?)", (self.instance_id, time.time() + self.lease_time))
+
+    def join(self, join_time: float) -> None:
+        """Register this instance, and wait for the instances started at the same time to register before the shards are claimed."""
+
+        self.register()
+        if join_time > 0:
+            pywikibot.output(f"Waiting {join_time:g} seconds for other instances to join the shard database...")
+            time.sleep(join_time)
+
+    def acquire(self) -> Set[int]:
+        """Claim the share of the shards of this instance, or release the shards above it, and renew the leases."""
+
+        with self.transaction():
+            now = time.time()
+            expires = now + self.lease_time
+            self.connection.execute("DELETE FROM instances WHERE expires < ?", (now,))
+            self.connection.execute("INSERT OR REPLACE INTO instances (instance, expires) VALUES (?, ?)", (self.instance_id, expires))
+            (number_of_instances,) = self.connection.execute("SELECT COUNT(*) FROM instances").fetchone()
+            share = math.ceil(self.shards / number_of_instances)
+
+            leased_shards: Dict[int, str] = {shard: owner for shard, owner in self.connection.execute("SELECT shard, owner FROM leases WHERE expires >= ?", (now,))}
+            owned_shards = sorted(shard for shard, owner in leased_shards.items() if owner == self.instance_id)
+            if len(owned_shards) > share:
+                released_shards = owned_shards[share:]
+                self.connection.executemany("DELETE FROM leases WHERE shard = ? AND owner = ?", ((shard, self.instance_id) for shard in released_shards))
+                owned_shards = owned_shards[:share]
+            else:
+                free_shards = [shard for shard in range(self.shards) if shard not in leased_shards]
+                owned_shards.extend(free_shards[:(share - len(owned_shards))])
+                if len(owned_shards) <= 0:
+                    pywikibot.warning("Every shard is leased by other instances. They release the shards above their share at the start of their next cycle.")
+
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO leases (shard, owner, expires) VALUES (?, ?, ?)",
+                ((shard, self.instance_id, expires) for shard in owned_shards)
+            )
+
+        self.owned_shards = set(owned_shards)
+        return self.owned_shards
+
+    def renew(self) -> None:
+        """Extend the leases of this instance, and forget the shards that were claimed by another instance after their leases expired."""
+
+        with self.transaction():
+            expires = time.time() + self.lease_time
+            self.connection.execute("INSERT OR REPLACE INTO instances (instance, expires) VALUES (?, ?)", (self.instance_id, expires))
+            self.connection.execute("UPDATE leases SET expires = ? WHERE owner = ?", (expires, self.instance_id))
+            owned_shards = {shard for (shard,) in self.connection.execute("SELECT shard FROM leases WHERE owner = ?", (self.instance_id,))}
+
+        lost_shards = self.owned_shards - owned_shards
+        if len(lost_shards) > 0:
+            pywikibot.warning(f"Lost the leases of {len(lost_shards)} {'shard' + ('s' if len(lost_shards) != 1 else '')} to other instances.")
+
+        self.owned_shards &= owned_shards
+
+    def _heartbeat(self) -> None:
+        while not self._stop_event.wait(self.lease_time / 3):
+            try:
+                self.renew()
+            except sqlite3.Error as exception:
+                pywikibot.warning(f"Could not renew the shard leases: {exception}")
+
+    def start(self) -> None:
+        """Start renewing the leases on a heartbeat thread."""
+
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="shard_heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+
+    def get_source_shards(self, plan: "QueryPlan") -> Set[int]:
+        """Get the owned shards of the titles that a source can route entries to."""
+
+        return {shard for shard in map(self.get_shard, plan.page_queries) if shard in self.owned_shards}
+
+    def get_source_marks(self, shard_marks: SourceMarkDataType, source_plans: Dict[str, "QueryPlan"]) -> SourceMarkDataType:
+        """
+        Get the mark of each source from the marks of its owned shards.
+
+        The oldest mark is used, so that no shard misses the entries after
+        its own mark. A source without a mark for one of its shards is read
+        completely.
+        """
+
+        source_marks: SourceMarkDataType = {}
+        for source, plan in source_plans.items():
+            marks = [shard_marks.get(get_shard_mark_key(source, shard)) for shard in self.get_source_shards(plan)]
+            if len(marks) <= 0 or any(mark is None or "published" not in mark for mark in marks):
+                continue
+
+            source_marks[source] = min(cast(List[SourceMarkTypedDict], marks), key=lambda mark: mark["published"])
+
+        return source_marks
+
+    def get_shard_marks(self, source_marks: SourceMarkDataType, source_plans: Dict[str, "QueryPlan"]) -> SourceMarkDataType:
+        """Get the marks of the owned shards of each source from the marks of the sources."""
+
+        shard_marks: SourceMarkDataType = {}
+        for source, mark in source_marks.items():
+            if source in source_plans:
+                for shard in self.get_source_shards(source_plans[source]):
+                    shard_marks[get_shard_mark_key(source, shard)] = mark
+
+        return shard_marks
+
+    def close(self) -> None:
+        """Stop the heartbeat, and release the leases so that the other instances can claim them at once."""
+
+        self._stop_event.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+
+        with self.transaction():
+            self.connection.execute("DELETE FROM leases WHERE owner = ?", (self.instance_id,))
+            self.connection.execute("DELETE FROM instances WHERE instance = ?", (self.instance_id,))
+
+        with self.lock:
+            self.connection.close()
+
+
+regex_special_character_pattern: Pattern = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+def is_literal_keyword(keyword: str) -> bool:
+    return len(keyword) > 0 and regex_special_character_pattern.search(keyword) is None
+
+
+def is_word_character(character: str) -> bool:
+    # Same as `\w` in a `str` pattern.
+    return character.isalnum() or character == "_"
+
+
+MATCH_FIELDS: List[str] = ["title", "summary", "content"]
+DEFAULT_MATCH_FIELDS: List[str] = ["title"]
+
+markup_pattern: Pattern = re.compile(r"<(script|style)\b[^>]*>.*?</\1\s*>|<!--.*?-->|<[^>]*>", flags=(re.IGNORECASE | re.DOTALL))
+token_pattern: Pattern = re.compile(r"\w+")
+
+
+def get_entry_field(entry: FeedParserDict, field: str) -> str:
+    if field == "content":
+        return "\n".join(content.get("value", "") for content in entry.get("content", []))
+
+    return entry.get(field, "")
+
+
+# Case folding turns the dotted capital I into "i" with a combining dot, and keeps the dotless i, while a case-insensitive regex matches both with "i".
+DOTTED_I_FOLDING: str = "i\u0307"
+DOTLESS_I_TABLE: Dict[int, str] = {ord("\u0131"): "i"}
+
+
+def fold_text(text: str) -> str:
+    """Case fold a text, and collapse its runs of whitespace, such as non-breaking spaces, into single spaces."""
+
+    folded_text = text.casefold()
+    if not folded_text.isascii():
+        folded_text = folded_text.replace(DOTTED_I_FOLDING, "i").translate(DOTLESS_I_TABLE)
+
+    return " ".join(folded_text.split())
+
+
+def strip_markup(text: str) -> str:
+    if "<" in text:
+        text = markup_pattern.sub(" ", text)
+
+    if "&" in text:
+        text = html.unescape(text)
+
+    return text
+
+
+class EntryIndex:
+    r"""
+    Normalized text and tokens of the fields of an entry.
+
+    Each is computed once, when a query first needs it, and shared by all the
+    queries of the entry. The text has its markup stripped, and the folded
+    text is also case folded with its whitespace collapsed, and split into a
+    set of `\w+` tokens.
+    """
+
+    def __init__(self, entry: FeedParserDict) -> None:
+        self.entry = entry
+        self._texts: Dict[str, str] = {}
+        self._folded_texts: Dict[str, str] = {}
+        self._tokens: Dict[str, Set[str]] = {}
+
+    def get_text(self, field: str) -> str:
+        if field not in self._texts:
+            self._texts[field] = strip_markup(get_entry_field(self.entry, field))
+
+        return self._texts[field]
+
+    def get_folded_text(self, field: str) -> str:
+        if field not in self._folded_texts:
+            self._folded_texts[field] = fold_text(self.get_text(field))
+
+        return self._folded_texts[field]
+
+    def get_tokens(self, field: str) -> Set[str]:
+        if field not in self._tokens:
+            self._tokens[field] = set(token_pattern.findall(self.get_folded_text(field)))
+
+        return self._tokens[field]
+
+
+def is_word_bounded(text: str, start: int, end: int) -> bool:
+    r"""Check if there are `\b` word boundaries at `start` and `end` of `text`."""
+
+    before = (start > 0 and is_word_character(text[start - 1]))
+    first = is_word_character(text[start])
+    last = is_word_character(text[end - 1])
+    after = (end < len(text) and is_word_character(text[end]))
+    return before != first and last != after
+
+
+def has_phrase(text: str, phrase: str) -> bool:
+    start = text.find(phrase)
+    while start >= 0:
+        if is_word_bounded(text, start, start + len(phrase)):
+            return True
+
+        start = text.find(phrase, start + 1)
+
+    return False
+
+
+class KeywordMatcher:
+    r"""
+    Match the keywords of all queries against the token index of an entry field.
+
+    A literal keyword of one word is matched by looking up its token in the
+    token set of the field. A literal keyword of several words is only
+    searched for as a phrase when all of its tokens are in the set. The other
+    keywords are compiled as `\b(keyword)\b` regexes, and searched for in the
+    text of the field that is not folded. All of them are case-insensitive
+    and only match on word boundaries.
+    """
+
+    def __init__(self, query_keywords: List[List[str]]) -> None:
+        """
+        Initializer.
+        :param query_keywords: The keywords of each query.
+        """
+
+        # Keywords by index in the order that they are added.
+        self.keyword_queries: List[List[Tuple[int, str]]] = []
+
+        # Token of a literal keyword of one word to its index.
+        self.token_keywords: Dict[str, int] = {}
+        # Folded literal keywords of several words, their tokens and their indices.
+        self.phrases: List[Tuple[str, Set[str], int]] = []
+        # Keywords that are not literal, and their indices.
+        self.compiled_patterns: List[Tuple[Pattern, int]] = []
+
+        keyword_indices: Dict[str, int] = {}
+        for q, keywords in enumerate(query_keywords):
+            for keyword in keywords:
+                is_literal = is_literal_keyword(keyword)
+                key = (fold_text(keyword) if is_literal else keyword)
+                if key not in keyword_indices:
+                    k = len(self.keyword_queries)
+                    keyword_indices[key] = k
+                    self.keyword_queries.append([])
+                    if not is_literal:
+                        self.compiled_patterns.append((re.compile(r"\b({0})\b".format(keyword), flags=re.IGNORECASE), k))
+                    else:
+                        tokens: List[str] = token_pattern.findall(key)
+                        if len(tokens) == 1 and tokens[0] == key:
+                            self.token_keywords[key] = k
+                        else:
+                            self.phrases.append((key, set(tokens), k))
+
+                self.keyword_queries[keyword_indices[key]].append((q, keyword))
+
+        self.tokens: Set[str] = set(self.token_keywords)
+
+    def __len__(self) -> int:
+        return len(self.keyword_queries)
+
+    def match(self, entry_index: EntryIndex, field: str) -> Dict[int, List[str]]:
+        """Get the matched keywords of each query by its index."""
+
+        query_keywords: Dict[int, List[str]] = {}
+        matched: List[int] = []
+
+        if len(self.tokens) > 0 or len(self.phrases) > 0:
+            tokens = entry_index.get_tokens(field)
+            matched.extend(self.token_keywords[token] for token in (tokens & self.tokens))
+
+            for phrase, phrase_tokens, k in self.phrases:
+                if phrase_tokens <= tokens and has_phrase(entry_index.get_folded_text(field), phrase):
+                    matched.append(k)
+
+        # The regexes are case-insensitive already, and folding the text would change what they match, such as "ß" into "ss".
+        for compiled_pattern, k in self.compiled_patterns:
+            if compiled_pattern.search(entry_index.get_text(field)) is not None:
+                matched.append(k)
+
+        for k in sorted(matched):
+            for q, keyword in self.keyword_queries[k]:
+                if q not in query_keywords:
+                    query_keywords[q] = []
+
+                query_keywords[q].append(keyword)
+
+        return query_keywords
+
+
+def report_config_error(message: str) -> None:
+    pywikibot.error(message)
+    pywikibot.output("")
+
+
+def parse_regex_flags(regex_flags: Union[str, int, List[Union[str, int]]]) -> int:
+    if isinstance(regex_flags, (str, int)):
+        regex_flags = [regex_flags]
+    elif not isinstance(regex_flags, list):
+        raise TypeError(f"Flags \"{regex_flags}\" must be a list, string, or int.")
+
+    flags = 0
+    for regex_flag in regex_flags:
+        if isinstance(regex_flag, str):
+            flag = getattr(re, regex_flag, None)
+            if not isinstance(flag, int):
+                raise ValueError(f"Flag \"{regex_flag}\" is not a flag of the `re` module.")
+
+            flags |= flag
+        elif isinstance(regex_flag, int):
+            flags |= regex_flag
+        else:
+            raise TypeError(f"Flag \"{regex_flag}\" must be a string or int.")
+
+    return flags
+
+
+def compile_regex(regex: Union[str, ConfigQueryRegexTypedDict]) -> Pattern:
+    if isinstance(regex, str):
+        return re.compile(regex)
+
+    if not isinstance(regex, dict):
+        raise TypeError(f"Regex \"{regex}\" must be a string or dict.")
+
+    if "pattern" not in regex:
+        raise ValueError(f"Regex \"{regex}\" must have a pattern.")
+
+    flags = (parse_regex_flags(regex["flags"]) if "flags" in regex else 0)
+    return re.compile(regex["pattern"], flags=flags)
+
+
+def get_match_fields(
+    config: Union[ConfigFieldsTypedDict, ConfigQueryTypedDict, ConfigQueryRegexTypedDict],
+    default_fields: List[str],
+    name: str
+) -> List[str]:
+    """Get the valid fields of a config, a query or a regex, or `default_fields` if it has none."""
+
+    if "fields" not in config:
+        return default_fields
+
+    fields = config["fields"]
+    if not isinstance(fields, list):
+        report_config_error(f"`fields` of {name} must be a list.")
+        return default_fields
+
+    match_fields: List[str] = []
+    for field in fields:
+        if field not in MATCH_FIELDS:
+            report_config_error(f"Field \"{field}\" of {name} must be one of {MATCH_FIELDS}.")
+            continue
+
+        match_fields.append(field)
+
+    return match_fields
+
+
+class QueryPlan:
+    """
+    Validated and compiled queries of a config.
+
+    Config errors are reported once when the plan is built, and the invalid
+    keywords and regexes are left out of the plan.
+    """
+
+    def __init__(self, config: ConfigTypedDict) -> None:
+        """
+        Initializer.
+        :param config: The config.
+        """
+
+        if not isinstance(config, dict):
+            raise TypeError(f"Config \"{config}\" must be a dict.")
+
+        sources = config.get("sources")
+        if not isinstance(sources, list):
+            raise TypeError("`sources` of a config must be a list.")
+
+        queries = config.get("queries")
+        if not isinstance(queries, list):
+            raise TypeError("`queries` of a config must be a list.")
+
+        self.sources: List[str] = sources
+        self.queries: List[ConfigQueryTypedDict] = queries
+        # A cached feed is only skipped while the config that it was matched with is the same.
+        self.config_hash: str = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf8")).hexdigest()
+
+        config_fields = get_match_fields(config, DEFAULT_MATCH_FIELDS, "config")
+
+        # Query index to page titles.
+        self.query_pages: List[List[str]] = []
+        # Page title to query indices.
+        self.page_queries: Dict[str, List[int]] = {}
+
+        # Field to the regexes matched against it, by query index and regex index.
+        self.field_regexes: Dict[str, List[Tuple[int, int, Pattern]]] = {}
+        field_query_keywords: Dict[str, List[List[str]]] = {field: [[] for query in queries] for field in MATCH_FIELDS}
+        for q, query in enumerate(queries):
+            query_fields = get_match_fields(query, config_fields, f"query {q}")
+            pages: List[str] = query.get("pages", [])
+            if not isinstance(pages, list):
+                report_config_error(f"`pages` of query {q} must be a list.")
+                pages = []
+
+            self.query_pages.append(pages)
+            for page in pages:
+                if page not in self.page_queries:
+                    self.page_queries[page] = []
+
+                self.page_queries[page].append(q)
+
+            keywords: List[str] = []
+            for keyword in query.get("keywords", []):
+                if not isinstance(keyword, str):
+                    report_config_error(f"Keyword \"{keyword}\" of query {q} must be a string.")
+                    continue
+
+                if not is_literal_keyword(keyword):
+                    try:
+                        re.compile(keyword)
+                    except re.error as exception:
+                        report_config_error(f"Keyword \"{keyword}\" of query {q} is an invalid regex: {exception}")
+                        continue
+
+                keywords.append(keyword)
+
+            for field in query_fields:
+                field_query_keywords[field][q] = keywords
+
+            for r, regex in enumerate(query.get("regexes", [])):
+                try:
+                    compiled_pattern = compile_regex(regex)
+                except (TypeError, ValueError, re.error) as exception:
+                    report_config_error(f"Regex \"{regex}\" of query {q} is invalid: {exception}")
+                    continue
+
+                regex_fields = (get_match_fields(regex, query_fields, f"regex \"{regex['pattern']}\" of query {q}") if isinstance(regex, dict) else query_fields)
+                for field in regex_fields:
+                    if field not in self.field_regexes:
+                        self.field_regexes[field] = []
+
+                    self.field_regexes[field].append((q, r, compiled_pattern))
+
+        # Field to the matcher of the keywords of the queries that match against it.
+        self.keyword_matchers: Dict[str, KeywordMatcher] = {}
+        for field, query_keywords in field_query_keywords.items():
+            keyword_matcher = KeywordMatcher(query_keywords)
+            if len(keyword_matcher) > 0:
+                self.keyword_matchers[field] = keyword_matcher
+
+        # Fields in the order that they are matched, so that the cheap title is matched first.
+        self.fields: List[str] = [field for field in MATCH_FIELDS if field in self.keyword_matchers or field in self.field_regexes]
+
+
+def get_config_plans(configs: ConfigResultDataType) -> List[QueryPlan]:
+    if isinstance(configs, dict):
+        configs = [configs]
+    elif not isinstance(configs, list):
+        raise TypeError("`configs` must be a dict or list.")
+
+    return [QueryPlan(config) for config in configs]
+
+
+def get_revision_content(revision: Dict[str, Any]) -> str:
+    # The content is in the main slot since MediaWiki 1.32.
+    if "slots" in revision:
+        return revision["slots"]["main"]["content"]
+
+    return revision["content"]
+
+
+def query_config_pages(site: pywikibot.site.APISite, parameters: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Query the latest revision of pages, and follow the continuations."""
+
+    pages: Dict[str, Dict[str, Any]] = {}
+    request_parameters: Dict[str, Any] = {
+        "action": "query",
+        "prop": "revisions",
+        "formatversion": 2,
+        **parameters
+    }
+    while True:
+        data = site.simple_request(**request_parameters).submit()
+        for page in data.get("query", {}).get("pages", []):
+            pages[page["title"]] = page
+
+        if "continue" not in data:
+            break
+
+        request_parameters.update(data["continue"])
+
+    return pages
+
+
+def fetch_config_wiki_plans(command_option: CommandOptionTypedDict, config_cache: ConfigCacheDataType) -> List[QueryPlan]:
+    """
+    Get the plans of the config pages on the wiki.
+
+    The latest revision IDs of all config pages are requested at once, and
+    only the pages with a revision that is not in `config_cache` are
+    downloaded and compiled. `config_cache` is updated with the new revisions.
+    """
+
+    site = pywikibot.Site()
+    is_prefix: bool = ("config_page_prefix" in command_option)
+    if is_prefix:
+        link = pywikibot.Link(command_option["config_page_prefix"], site)
+        pages = query_config_pages(site, {
+            "generator": "allpages",
+            "gapprefix": link.title,
+            "gapnamespace": link.namespace,
+            "gaplimit": "max",
+            "rvprop": "ids"
+        })
+        if len(pages) <= 0:
+            raise pywikibot.exceptions.NoPage(pywikibot.Page(site, command_option["config_page_prefix"]))
+    else:
+        pages = query_config_pages(site, {
+            "titles": command_option["config_page_title"],
+            "rvprop": "ids"
+        })
+        for title, page in pages.items():
+            if page.get("missing", False):
+                raise pywikibot.exceptions.NoPage(pywikibot.Page(site, title))
+
+    revisions: Dict[str, int] = {title: page["revisions"][0]["revid"] for title, page in pages.items() if "revisions" in page}
+    changed_titles: List[str] = [title for title, revision in revisions.items() if title not in config_cache or config_cache[title]["revision"] != revision]
+    pywikibot.output(f"Loading {len(changed_titles)} changed of {len(revisions)} config {'page' + ('s' if len(revisions) != 1 else '')}...")
+
+    for i in range(0, len(changed_titles), CONFIG_PAGE_BATCH_SIZE):
+        changed_pages = query_config_pages(site, {
+            "titles": "|".join(changed_titles[i:(i + CONFIG_PAGE_BATCH_SIZE)]),
+            "rvprop": "ids|content",
+            "rvslots": "main"
+        })
+        for title, page in changed_pages.items():
+            if "revisions" not in page:
+                continue
+
+            revision = page["revisions"][0]
+            page_text = get_revision_content(revision)
+            try:
+                configs = json.loads(page_text)
+            except json.decoder.JSONDecodeError as exception:
+                pywikibot.error(f"Invalid JSON syntax in config page \"{title}\":")
+                if not is_prefix:
+                    pywikibot.output(page_text)
+                    pywikibot.output("")
+                    raise exception
+
+                pywikibot.output(str(exception))
+                pywikibot.output("")
+                continue
+
+            try:
+                plans = get_config_plans(configs)
+            except TypeError as exception:
+                if not is_prefix:
+                    raise exception
+
+                pywikibot.error(f"Invalid config page \"{title}\": {exception}")
+                continue
+
+            config_cache[title] = {
+                "revision": revision["revid"],
+                "plans": plans
+            }
+
+    # Forget the pages that were deleted or moved away.
+    for title in list(config_cache):
+        if title not in revisions:
+            del config_cache[title]
+
+    plans = []
+    for title in sorted(revisions):
+        if title in config_cache:
+            plans.extend(config_cache[title]["plans"])
+
+    return plans
+
+
+def fetch_config_plans(command_option: CommandOptionTypedDict, config_cache: Optional[ConfigCacheDataType] = None) -> List[QueryPlan]:
+    """
+    Get the plans of the config.
+
+    :param config_cache: The compiled config pages by revision. It is read
+        from the config cache file if it is not specified.
+    """
+
+    config_type: ConfigType = command_option["config_type"]
+    if config_type == ConfigType.WIKI:
+        has_config_cache_path: bool = ("config_cache_path" in command_option)
+        if config_cache is None:
+            config_cache = (fetch_config_cache_file(command_option["config_cache_path"]) if has_config_cache_path else {})
+
+        try:
+            plans = fetch_config_wiki_plans(command_option, config_cache)
+            if has_config_cache_path:
+                write_config_cache_file(command_option["config_cache_path"], config_cache)
+
+            return plans
+        except (pywikibot.exceptions.NoPage, json.decoder.JSONDecodeError) as exception:
+            pywikibot.exception(exception, tb=True)
+            pywikibot.output("")
+            pywikibot.output("")
+
+    config_path: str = command_option["config_path"]
+    return get_config_plans(fetch_config_file(config_path))
+
+
+@metrics.timed("parse_config")
+def parse_config(command_option: CommandOptionTypedDict, config_cache: Optional[ConfigCacheDataType] = None) -> Tuple[List[QueryPlan], Set[str]]:
+    plans: List[QueryPlan] = fetch_config_plans(command_option, config_cache)
+
+    unique_sources: Set[str] = set()
+    for plan in plans:
+        unique_sources.update(plan.sources)
+
+    return plans, unique_sources
+
+
+def get_proxies(proxies_value: ProxiesValueDataType) -> Dict[str, str]:
+    if isinstance(proxies_value, dict):
+        return proxies_value
+
+    return {
+        "http": proxies_value,
+        "https": proxies_value
+    }
+
+
+def get_proxies_key(proxies: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(proxies.items()))
+
+
+class ProxyRouter:
+    """
+    Router that resolves the proxies of each source from the rules of the proxies file.
+
+    The rules are compiled once and ordered so that the first rule that
+    matches a source wins: rules with a higher priority come first, and rules
+    with the same priority keep the order of the file, or the reverse order
+    for `ProxyMatchMode.LAST`. The route of each source is cached, and the
+    sources routed through the same proxies share one `ProxyHandler`.
+    """
+
+    def __init__(
+        self,
+        default_proxies: Dict[str, str],
+        rules: List[ProxyRuleTypedDict],
+        match_mode: ProxyMatchMode = ProxyMatchMode.LAST
+    ) -> None:
+        """
+        Initializer.
+        :param default_proxies: The proxies of the sources that no rule matches.
+        :param rules: The rules in the order of the proxies file.
+        :param match_mode: Which rule wins among matching rules of the same priority.
+        """
+
+        self.default_proxies = default_proxies
+        self.match_mode = match_mode
+
+        indexed_rules = list(enumerate(rules))
+        direction = (-1 if match_mode == ProxyMatchMode.LAST else 1)
+        indexed_rules.sort(key=lambda indexed_rule: (-indexed_rule[1].get("priority", 0), direction * indexed_rule[0]))
+        self.rules: List[Tuple[Pattern, Dict[str, str]]] = [(re.compile(rule["regex"]), get_proxies(rule["proxies"])) for i, rule in indexed_rules]
+
+        self._routes: Dict[str, Tuple[Dict[str, str], Optional[str]]] = {}
+        self._handlers: Dict[Tuple[Tuple[str, str], ...], ProxyHandler] = {}
+
+    def route(self, source: str) -> Tuple[Dict[str, str], Optional[str]]:
+        """Get the proxies of a source, and the regex pattern of the rule that matched it, if any."""
+
+        if source not in self._routes:
+            route: Tuple[Dict[str, str], Optional[str]] = (self.default_proxies, None)
+            for compiled_pattern, proxies in self.rules:
+                if compiled_pattern.search(source) is not None:
+                    route = (proxies, compiled_pattern.pattern)
+                    break
+
+            self._routes[source] = route
+
+        return self._routes[source]
+
+    def get_handler(self, proxies: Dict[str, str]) -> Optional[ProxyHandler]:
+        if len(proxies) <= 0:
+            return None
+
+        key = get_proxies_key(proxies)
+        if key not in self._handlers:
+            self._handlers[key] = ProxyHandler(proxies)
+
+        return self._handlers[key]
+
+
+def get_proxy_rules(regex_proxies: ProxiesDataType) -> List[ProxyRuleTypedDict]:
+    if isinstance(regex_proxies, dict):
+        return [{"regex": regex, "proxies": proxies_value} for regex, proxies_value in regex_proxies.items()]
+
+    return regex_proxies
+
+
+def create_proxy_router(command_option: CommandOptionTypedDict) -> ProxyRouter:
+    proxies: Dict[str, str] = {}
+    if "proxy" in command_option:
+        proxy: str = command_option["proxy"]
+        proxies["http"] = proxy
+        proxies["https"] = proxy
+
+    if "http_proxy" in command_option:
+        proxies["http"] = command_option["http_proxy"]
+
+    if "https_proxy" in command_option:
+        proxies["https"] = command_option["https_proxy"]
+
+    rules: List[ProxyRuleTypedDict] = []
+    if "proxies_path" in command_option:
+        rules = get_proxy_rules(fetch_proxies_file(command_option["proxies_path"]))
+
+    return ProxyRouter(proxies, rules, command_option["proxy_match"])
+
+
+@metrics.timed("get_source_options")
+def get_source_options(
+    command_option: CommandOptionTypedDict,
+    sources: Iterable[str],
+    proxy_router: Optional[ProxyRouter] = None
+) -> SourceOptionDataType:
+    if proxy_router is None:
+        proxy_router = create_proxy_router(command_option)
+
+    source_option: SourceOptionDataType = {}
+    for source in sources:
+        proxies, proxy_regex = proxy_router.route(source)
+        option: SourceOptionValueTypedDict = {
+            "proxies": proxies,
+            "has_proxy": (len(proxies) > 0),
+            "handlers": proxy_router.get_handler(proxies)
+        }
+        if proxy_regex is not None:
+            option["proxy_regex"] = proxy_regex
+
+        source_option[source] = option
+
+    return source_option
+
+
+def get_content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_fetch_result(
+    feed: Optional[FeedParserDict],
+    cache_status: FeedCacheStatus = FeedCacheStatus.MISS,
+    cache_value: Optional[FeedCacheValueTypedDict] = None,
+    bytes_received: int = 0,
+    bytes_saved: int = 0,
+    payload: Optional[FeedPayloadTypedDict] = None
+) -> FeedFetchResultTypedDict:
+    return {
+        "feed": feed,
+        "cache_status": cache_status,
+        "cache_value": cache_value,
+        "bytes_received": bytes_received,
+        "bytes_saved": bytes_saved,
+        "payload": payload
+    }
+
+
+FEED_CHUNK_SIZE: int = 65536
+ATOM_NAMESPACE: str = "{http://www.w3.org/2005/Atom}"
+SYNDICATION_NAMESPACE: str = "{http://purl.org/rss/1.0/modules/syndication/}"
+CONTENT_NAMESPACE: str = "{http://purl.org/rss/1.0/modules/content/}"
+
+# The feed elements of the update schedule, and their feedparser keys.
+FEED_SCHEDULE_TAGS: Dict[str, str] = {
+    "ttl": "ttl",
+    f"{SYNDICATION_NAMESPACE}updatePeriod": "sy_updateperiod",
+    f"{SYNDICATION_NAMESPACE}updateFrequency": "sy_updatefrequency"
+}
+
+ContentOpenerDataType = Callable[[], Iterable[bytes]]
+
+
+def get_feed_schedule_info(feed: FeedParserDict) -> Dict[str, Any]:
+    feed_info = feed.get("feed", {})
+    return {key: feed_info[key] for key in FEED_SCHEDULE_TAGS.values() if key in feed_info}
+
+
+def get_compact_feed(feed: FeedParserDict) -> FeedParserDict:
+    """Get a feed without its entries, with only its status and the elements of its update schedule."""
+
+    compact_feed = FeedParserDict(bozo=feed.get("bozo", 0), feed=FeedParserDict(get_feed_schedule_info(feed)), entries=[])
+    for key in ("bozo_exception", "status", "href"):
+        if key in feed:
+            compact_feed[key] = feed[key]
+
+    return compact_feed
+
+
+class StreamFallback(Exception):
+    """Raised when a streamed feed has markup that only feedparser handles."""
+
+
+def iter_content_chunks(content: bytes) -> Iterator[bytes]:
+    for i in range(0, len(content), FEED_CHUNK_SIZE):
+        yield content[i:(i + FEED_CHUNK_SIZE)]
+
+
+def iter_file_chunks(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(FEED_CHUNK_SIZE)
+            if len(chunk) <= 0:
+                break
+
+            yield chunk
+
+
+def iter_xml_events(chunks: Iterable[bytes]) -> Iterator[Tuple[Any, ...]]:
+    parser: ElementTree.XMLPullParser = ElementTree.XMLPullParser(events=("start", "end"))
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from parser.read_events()
+
+    parser.close()
+    yield from parser.read_events()
+
+
+def get_stripped_text(element: ElementTree.Element, tag: str) -> Optional[str]:
+    text = element.findtext(tag)
+    return (text.strip() if text is not None else None)
+
+
+def set_entry_date(entry: FeedParserDict, key: str, value: Optional[str]) -> None:
+    if value is None:
+        return
+
+    entry[key] = value
+    parsed_date = parse_feed_date(value)
+    if parsed_date is not None:
+        entry[f"{key}_parsed"] = parsed_date
+
+
+def get_rss_entry(item: ElementTree.Element) -> FeedParserDict:
+    entry = FeedParserDict()
+
+    title = get_stripped_text(item, "title")
+    if title is not None:
+        if "<" in title:
+            raise StreamFallback("Title has markup.")
+
+        entry["title"] = title
+
+    link = get_stripped_text(item, "link")
+    guid_element = item.find("guid")
+    if guid_element is not None and guid_element.text is not None:
+        guid = guid_element.text.strip()
+        entry["id"] = guid
+        is_permalink = (guid_element.get("isPermaLink", "true").lower() != "false")
+        entry["guidislink"] = (is_permalink and link is None)
+        if entry["guidislink"]:
+            link = guid
+
+    if link is None:
+        raise StreamFallback("Item has no link.")
+
+    entry["link"] = link
+    set_entry_date(entry, "published", get_stripped_text(item, "pubDate"))
+
+    summary = get_stripped_text(item, "description")
+    if summary is not None:
+        entry["summary"] = summary
+
+    content = get_stripped_text(item, f"{CONTENT_NAMESPACE}encoded")
+    if content is not None:
+        entry["content"] = [FeedParserDict(type="text/html", value=content)]
+
+    return entry
+
+
+def get_atom_text(element: ElementTree.Element) -> str:
+    # The markup of an "xhtml" text is child elements, and only its text is kept.
+    return "".join(element.itertext()).strip()
+
+
+def get_atom_entry(element: ElementTree.Element) -> FeedParserDict:
+    entry = FeedParserDict()
+
+    title_element = element.find(f"{ATOM_NAMESPACE}title")
+    if title_element is not None:
+        title_type = title_element.get("type", "text")
+        title = (title_element.text or "").strip()
+        if title_type not in ("text", "html") or "<" in title:
+            raise StreamFallback("Title has markup.")
+
+        entry["title"] = title
+
+    for link_element in element.iterfind(f"{ATOM_NAMESPACE}link"):
+        if link_element.get("rel", "alternate") == "alternate":
+            link = link_element.get("href", "").strip()
+            if urlparse(link).scheme == "":
+                raise StreamFallback("Link is relative.")
+
+            entry["link"] = link
+            break
+    else:
+        raise StreamFallback("Entry has no link.")
+
+    entry_id = get_stripped_text(element, f"{ATOM_NAMESPACE}id")
+    if entry_id is not None:
+        entry["id"] = entry_id
+
+    set_entry_date(entry, "published", get_stripped_text(element, f"{ATOM_NAMESPACE}published"))
+    set_entry_date(entry, "updated", get_stripped_text(element, f"{ATOM_NAMESPACE}updated"))
+
+    summary_element = element.find(f"{ATOM_NAMESPACE}summary")
+    if summary_element is not None:
+        entry["summary"] = get_atom_text(summary_element)
+
+    content_element = element.find(f"{ATOM_NAMESPACE}content")
+    if content_element is not None and "src" not in content_element.attrib:
+        content_type = content_element.get("type", "text")
+        entry["content"] = [FeedParserDict(type=("text/html" if content_type == "html" else "text/plain"), value=get_atom_text(content_element))]
+
+    return entry
+
+
+def iter_stream_entries(
+    feed: FeedParserDict,
+    events: Iterator[Tuple[Any, ...]],
+    root: ElementTree.Element,
+    open_content: ContentOpenerDataType,
+    response_headers: Optional[Dict[str, str]] = None
+) -> Iterator[FeedParserDict]:
+    """
+    Yield the entries of a streamed feed as they are read.
+
+    Each entry is removed from the tree once it is yielded so that memory
+    stays bounded. If the rest of the feed cannot be streamed, it is parsed
+    with feedparser, and the entries that were already yielded are skipped.
+    """
+
+    is_atom = (root.tag == f"{ATOM_NAMESPACE}feed")
+    entry_tag = (f"{ATOM_NAMESPACE}entry" if is_atom else "item")
+
+    number_of_entries = 0
+    parents: List[ElementTree.Element] = [root]
+    try:
+        for event, element in events:
+            if event == "start":
+                parents.append(element)
+                continue
+
+            parents.pop()
+            if element.tag == entry_tag:
+                entry = (get_atom_entry(element) if is_atom else get_rss_entry(element))
+                if len(parents) > 0:
+                    parents[-1].remove(element)
+
+                number_of_entries += 1
+                yield entry
+            elif element.tag in FEED_SCHEDULE_TAGS and element.text is not None:
+                feed["feed"][FEED_SCHEDULE_TAGS[element.tag]] = element.text.strip()
+    except (ElementTree.ParseError, StreamFallback):
+        fallback_feed = feedparser.parse(b"".join(open_content()), response_headers=response_headers)
+        if "bozo_exception" in fallback_feed:
+            feed["bozo"] = 1
+            feed["bozo_exception"] = fallback_feed["bozo_exception"]
+            return
+
+        yield from fallback_feed.entries[number_of_entries:]
+    except OSError as exception:
+        feed["bozo"] = 1
+        feed["bozo_exception"] = exception
+
+
+def stream_feed(open_content: ContentOpenerDataType, response_headers: Optional[Dict[str, str]] = None) -> FeedParserDict:
+    """Parse an RSS 2.0 or Atom feed incrementally, or any other feed with feedparser."""
+
+    events = iter_xml_events(open_content())
+    root: Optional[ElementTree.Element] = None
+    try:
+        for event, element in events:
+            root = element
+            break
+    except ElementTree.ParseError:
+        pass
+
+    if root is not None:
+        version: Optional[str] = None
+        if root.tag == "rss" and root.get("version", "").startswith("2."):
+            version = "rss20"
+        elif root.tag == f"{ATOM_NAMESPACE}feed":
+            version = "atom10"
+
+        if version is not None:
+            feed = FeedParserDict(bozo=0, version=version, feed=FeedParserDict())
+            feed["entries"] = iter_stream_entries(feed, events, root, open_content, response_headers)
+            return feed
+
+    return feedparser.parse(b"".join(open_content()), response_headers=response_headers)
+
+
+def parse_feed(
+    open_content: ContentOpenerDataType,
+    response_headers: Optional[Dict[str, str]] = None,
+    feed_parser: FeedParserType = FeedParserType.STREAM
+) -> FeedParserDict:
+    if feed_parser == FeedParserType.STREAM:
+        return stream_feed(open_content, response_headers)
+
+    return feedparser.parse(b"".join(open_content()), response_headers=response_headers)
+
+
+def parse_feed_content(
+    open_content: ContentOpenerDataType,
+    content_hash: str,
+    content_length: int,
+    cache_value: Optional[FeedCacheValueTypedDict],
+    response_headers: Optional[Dict[str, str]] = None,
+    feed_parser: FeedParserType = FeedParserType.STREAM,
+    payload: Optional[FeedPayloadTypedDict] = None
+) -> FeedFetchResultTypedDict:
+    """
+    Parse the content of a feed unless it has the same hash as the cached content.
+
+    :param payload: The content to parse in a worker process instead. If it
+        is specified, the feed is not parsed, and the payload is returned.
+    """
+
+    new_cache_value: FeedCacheValueTypedDict = {
+        "hash": content_hash,
+        "length": content_length
+    }
+
+    if response_headers is not None:
+        if "etag" in response_headers:
+            new_cache_value["etag"] = response_headers["etag"]
+
+        if "last-modified" in response_headers:
+            new_cache_value["modified"] = response_headers["last-modified"]
+
+    if cache_value is not None and cache_value.get("hash") == content_hash:
+        return get_fetch_result(None, FeedCacheStatus.SAME_CONTENT, new_cache_value, content_length)
+
+    if payload is not None:
+        payload["feed_parser"] = feed_parser
+        if response_headers is not None:
+            payload["response_headers"] = response_headers
+
+        return get_fetch_result(None, FeedCacheStatus.MISS, new_cache_value, content_length, payload=payload)
+
+    feed = parse_feed(open_content, response_headers, feed_parser)
+    return get_fetch_result(feed, FeedCacheStatus.MISS, new_cache_value, content_length)
+
+
+def parse_payload(payload: FeedPayloadTypedDict) -> FeedParserDict:
+    if "path" in payload:
+        path = payload["path"]
+        open_content: ContentOpenerDataType = (lambda: iter_file_chunks(path))
+    else:
+        content = payload["content"]
+        open_content = (lambda: iter_content_chunks(content))
+
+    feed = parse_feed(open_content, payload.get("response_headers"), payload["feed_parser"])
+    if "status" in payload:
+        feed["status"] = payload["status"]
+        feed["href"] = payload["href"]
+
+    return feed
+
+
+def fetch_feed_file(
+    path: str,
+    cache_value: Optional[FeedCacheValueTypedDict],
+    feed_parser: FeedParserType = FeedParserType.STREAM,
+    defer_parse: bool = False
+) -> FeedFetchResultTypedDict:
+    # Hash the file in chunks so that large files are never read into memory at once.
+    content_hash = hashlib.sha256()
+    content_length = 0
+    try:
+        for chunk in iter_file_chunks(path):
+            content_hash.update(chunk)
+            content_length += len(chunk)
+    except OSError as exception:
+        return get_fetch_result(FeedParserDict(bozo=1, bozo_exception=exception, entries=[]))
+
+    payload: Optional[FeedPayloadTypedDict] = ({"path": path} if defer_parse else None)
+    return parse_feed_content(lambda: iter_file_chunks(path), content_hash.hexdigest(), content_length, cache_value, None, feed_parser, payload)
+
+
+def read_response_content(response: requests.Response, deadline: float) -> bytes:
+    chunks: List[bytes] = []
+    for chunk in response.iter_content(chunk_size=65536):
+        if time.monotonic() > deadline:
+            raise requests.exceptions.Timeout(f"Timed out while reading \"{response.url}\".")
+
+        chunks.append(chunk)
+
+    return b"".join(chunks)
+
+
+def fetch_feed_url(
+    source: str,
+    option: SourceOptionValueTypedDict,
+    cache_value: Optional[FeedCacheValueTypedDict],
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None,
+    feed_parser: FeedParserType = FeedParserType.STREAM,
+    defer_parse: bool = False
+) -> FeedFetchResultTypedDict:
+    """Fetch a feed with a conditional GET request using the cached validators."""
+
+    headers: Dict[str, str] = {"User-Agent": feedparser.USER_AGENT}
+    if cache_value is not None and "hash" in cache_value:
+        if "etag" in cache_value:
+            headers["If-None-Match"] = cache_value["etag"]
+
+        if "modified" in cache_value:
+            headers["If-Modified-Since"] = cache_value["modified"]
+
+    if session is None:
+        session = requests.Session()
+
+    deadline = (time.monotonic() + timeout if timeout is not None else math.inf)
+
+    try:
+        with session.get(source, headers=headers, proxies=option["proxies"], timeout=timeout, stream=True) as response:
+            status = response.status_code
+            if status == 304 and cache_value is not None:
+                return get_fetch_result(None, FeedCacheStatus.NOT_MODIFIED, cache_value, 0, cache_value.get("length", 0))
+
+            if status >= 400:
+                http_error = requests.exceptions.HTTPError(f"{status} {response.reason}", response=response)
+                return get_fetch_result(FeedParserDict(bozo=1, bozo_exception=http_error, status=status, href=response.url, entries=[]))
+
+            content = read_response_content(response, deadline)
+    except requests.exceptions.RequestException as exception:
+        return get_fetch_result(FeedParserDict(bozo=1, bozo_exception=exception, entries=[]))
+
+    payload: Optional[FeedPayloadTypedDict] = ({"content": content, "status": status, "href": response.url} if defer_parse else None)
+    fetch_result = parse_feed_content(
+        lambda: iter_content_chunks(content),
+        get_content_hash(content),
+        len(content),
+        cache_value,
+        # feedparser only looks up lowercase header names.
+        {key.lower(): value for key, value in response.headers.items()},
+        feed_parser,
+        payload
+    )
+    feed = fetch_result["feed"]
+    if feed is not None:
+        feed["status"] = status
+        feed["href"] = response.url
+
+    return fetch_result
+
+
+@metrics.timed("fetch_feed")
+def fetch_feed(
+    source: str,
+    option: SourceOptionValueTypedDict,
+    cache_value: Optional[FeedCacheValueTypedDict] = None,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None,
+    feed_parser: FeedParserType = FeedParserType.STREAM,
+    defer_parse: bool = False
+) -> FeedFetchResultTypedDict:
+    """
+    Fetch a feed, and parse it unless `defer_parse` is true.
+
+    :param defer_parse: Whether to return the content of HTTP and file
+        sources as a payload to parse in a worker process.
+    """
+
+    scheme = urlparse(source).scheme.lower()
+    if scheme in ("http", "https"):
+        return fetch_feed_url(source, option, cache_value, session, timeout, feed_parser, defer_parse)
+
+    if os.path.isfile(source):
+        return fetch_feed_file(source, cache_value, feed_parser, defer_parse)
+
+    # Let feedparser handle any other kind of source.
+    return get_fetch_result(feedparser.parse(source, handlers=option["handlers"]))
+
+
+def create_session(concurrency: int, host_concurrency: int) -> requests.Session:
+    """Create a session that keeps up to `host_concurrency` connections alive for each host."""
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=host_concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class SessionPool:
+    """
+    Pooled keep-alive sessions, one for each distinct set of proxies.
+
+    All sources routed through the same proxies share its session, so their
+    connections to the proxy, and the TLS handshakes of those connections,
+    are reused. A proxy carries the requests of many hosts, so its session
+    keeps up to `concurrency` connections alive instead of `host_concurrency`.
+    """
+
+    def __init__(self, concurrency: int, host_concurrency: int) -> None:
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+
+        self._lock = threading.Lock()
+        self._sessions: Dict[Tuple[Tuple[str, str], ...], requests.Session] = {}
+
+    def get(self, proxies: Dict[str, str]) -> requests.Session:
+        key = get_proxies_key(proxies)
+        with self._lock:
+            if key not in self._sessions:
+                pool_maxsize = (self.concurrency if len(proxies) > 0 else self.host_concurrency)
+                session = create_session(self.concurrency, pool_maxsize)
+                session.proxies.update(proxies)
+                self._sessions[key] = session
+
+            return self._sessions[key]
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+
+            self._sessions.clear()
+
+    def __enter__(self) -> "SessionPool":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def get_source_host(source: str) -> str:
+    return urlparse(source).netloc.lower()
+
+
+async def fetch_feeds_async(
+    source_option: SourceOptionDataType,
+    feed_cache: FeedCacheDataType,
+    on_fetched: Callable[[str, FeedFetchResultTypedDict], None],
+    concurrency: int,
+    host_concurrency: int,
+    timeout: Optional[float],
+    feed_parser: FeedParserType,
+    defer_parse: bool = False
+) -> None:
+    """Fetch feeds concurrently and call `on_fetched` as soon as each source is fetched."""
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def fetch(executor: ThreadPoolExecutor, session_pool: SessionPool, source: str, option: SourceOptionValueTypedDict) -> None:
+        host = get_source_host(source)
+        if host not in host_semaphores:
+            host_semaphores[host] = asyncio.Semaphore(host_concurrency)
+
+        async with semaphore, host_semaphores[host]:
+            try:
+                session = session_pool.get(option["proxies"])
+                fetch_result = await loop.run_in_executor(executor, fetch_feed, source, option, feed_cache.get(source), session, timeout, feed_parser, defer_parse)
+            except Exception as exception:
+                fetch_result = get_fetch_result(FeedParserDict(bozo=1, bozo_exception=exception, entries=[]))
+
+        on_fetched(source, fetch_result)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, SessionPool(concurrency, host_concurrency) as session_pool:
+        await asyncio.gather(*(fetch(executor, session_pool, source, option) for source, option in source_option.items()))
+
+
+def iter_fetch_results(
+    source_option: SourceOptionDataType,
+    feed_cache: Optional[FeedCacheDataType] = None,
+    concurrency: int = 20,
+    host_concurrency: int = 2,
+    timeout: Optional[float] = 60,
+    feed_parser: FeedParserType = FeedParserType.STREAM,
+    defer_parse: bool = False
+) -> Iterator[Tuple[str, FeedFetchResultTypedDict]]:
+    """Yield the fetch result of each source in the order that the sources finish fetching."""
+
+    if feed_cache is None:
+        feed_cache = {}
+
+    fetched: "queue.Queue[Optional[Tuple[str, FeedFetchResultTypedDict]]]" = queue.Queue()
+
+    def on_fetched(source: str, fetch_result: FeedFetchResultTypedDict) -> None:
+        metrics.increment("feeds_fetched")
+        if fetch_result["cache_status"] != FeedCacheStatus.MISS:
+            metrics.increment("feeds_unchanged")
+
+        metrics.increment("feed_bytes_received", fetch_result["bytes_received"])
+        metrics.increment("feed_bytes_saved", fetch_result["bytes_saved"])
+        fetched.put((source, fetch_result))
+
+    def run() -> None:
+        try:
+            with metrics.span("fetch_feeds"):
+                asyncio.run(fetch_feeds_async(source_option, feed_cache, on_fetched, concurrency, host_concurrency, timeout, feed_parser, defer_parse))
+        finally:
+            fetched.put(None)
+
+    thread = threading.Thread(target=run, name="fetch_feeds", daemon=True)
+    thread.start()
+
+    while True:
+        item = fetched.get()
+        if item is None:
+            break
+
+        yield item
+
+    thread.join()
+
+
+def fetch_feeds(
+    source_option: SourceOptionDataType,
+    feed_cache: Optional[FeedCacheDataType] = None,
+    concurrency: int = 20,
+    host_concurrency: int = 2,
+    timeout: Optional[float] = 60,
+    feed_parser: FeedParserType = FeedParserType.STREAM
+) -> Dict[str, FeedFetchResultTypedDict]:
+    return dict(iter_fetch_results(source_option, feed_cache, concurrency, host_concurrency, timeout, feed_parser))
+
+
+def update_feed_cache(feed_cache: FeedCacheDataType, source_config: SourceConfigDataType) -> None:
+    for source, config in source_config.items():
+        fetch_result = config["fetch_result"]
+        feed = fetch_result["feed"]
+        cache_value = fetch_result["cache_value"]
+        if cache_value is None or (feed is not None and "bozo_exception" in feed):
+            continue
+
+        cache_value["config_hash"] = config["plan"].config_hash
+        feed_cache[source] = cache_value
+
+
+# The status codes of a link that is gone. Other errors, such as 403 or 5xx, may not last or only affect the bot.
+DEAD_LINK_STATUSES: Set[int] = {404, 410}
+PERMANENT_REDIRECT_STATUSES: Set[int] = {301, 308}
+
+
+def get_link_cache_value(response: requests.Response) -> LinkCacheValueTypedDict:
+    cache_value: LinkCacheValueTypedDict = {"checked": time.time(), "status": response.status_code}
+    # Only a chain of permanent redirects replaces the link.
+    if len(response.history) > 0 and all(redirect.status_code in PERMANENT_REDIRECT_STATUSES for redirect in response.history):
+        cache_value["location"] = response.url
+
+    return cache_value
+
+
+def check_link(link: str, proxies: Dict[str, str], session: requests.Session, timeout: Optional[float] = None) -> Optional[LinkCacheValueTypedDict]:
+    """
+    Check a link with a HEAD request, or a ranged GET request if the HEAD request fails.
+
+    :return: None if the result of the link is not known, such as after a
+        connection error or a server error.
+    """
+
+    headers: Dict[str, str] = {"User-Agent": feedparser.USER_AGENT}
+    try:
+        response = session.head(link, headers=headers, proxies=proxies, timeout=timeout, allow_redirects=True)
+        # Some servers do not allow HEAD requests, so the first byte is requested instead.
+        if response.status_code >= 400:
+            headers["Range"] = "bytes=0-0"
+            with session.get(link, headers=headers, proxies=proxies, timeout=timeout, allow_redirects=True, stream=True) as response:
+                pass
+    except requests.exceptions.RequestException:
+        return None
+
+    if response.status_code >= 400 and response.status_code not in DEAD_LINK_STATUSES:
+        return None
+
+    return get_link_cache_value(response)
+
+
+class LinkChecker:
+    """
+    Checker of the links of new entries, with a cache of the result of each link.
+
+    The links are checked concurrently on an asyncio event loop, with the
+    same limits, sessions and proxies as the sources. A link that is not
+    found is dead, and a link that is permanently redirected is replaced by
+    its new location. A link whose result is not known, such as after a
+    timeout, is kept and not cached, so it is checked again next time.
+    """
+
+    def __init__(
+        self,
+        proxy_router: ProxyRouter,
+        link_cache: Optional[LinkCacheDataType] = None,
+        ttl: float = 604800,
+        concurrency: int = 20,
+        host_concurrency: int = 2,
+        timeout: Optional[float] = 60
+    ) -> None:
+        """
+        Initializer.
+        :param proxy_router: The router of the proxies of each link.
+        :param link_cache: The cached result of each link checked.
+        :param ttl: How many seconds the result of a link is cached.
+        :param concurrency: How many links to check at once.
+        :param host_concurrency: How many links to check at once on the same host.
+        :param timeout: How many seconds to wait for a link to respond.
+        """
+
+        self.proxy_router = proxy_router
+        self.link_cache: LinkCacheDataType = (link_cache if link_cache is not None else {})
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.timeout = timeout
+
+        self._session_pool = SessionPool(concurrency, host_concurrency)
+
+    def is_cached(self, link: str, now: float) -> bool:
+        return link in self.link_cache and self.link_cache[link]["checked"] > now - self.ttl
+
+    async def check_links_async(self, links: Iterable[str]) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        async def check(executor: ThreadPoolExecutor, link: str) -> None:
+            host = get_source_host(link)
+            if host not in host_semaphores:
+                host_semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+
+            async with semaphore, host_semaphores[host]:
+                try:
+                    proxies, regex = self.proxy_router.route(link)
+                    session = self._session_pool.get(proxies)
+                    cache_value = await loop.run_in_executor(executor, check_link, link, proxies, session, self.timeout)
+                except Exception:
+                    cache_value = None
+
+            metrics.increment("links_checked")
+            if cache_value is not None:
+                self.link_cache[link] = cache_value
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*(check(executor, link) for link in links))
+
+    def check(self, links: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Check the links that are not cached.
+
+        :return: The link to add instead of each link, or None if the link is dead.
+        """
+
+        now = time.time()
+        unique_links = set(links)
+        unchecked_links = [link for link in unique_links if not self.is_cached(link, now)]
+        metrics.increment("links_cached", len(unique_links) - len(unchecked_links))
+        if len(unchecked_links) > 0:
+            with metrics.span("check_links"):
+                asyncio.run(self.check_links_async(unchecked_links))
+
+        checked_links: Dict[str, Optional[str]] = {}
+        for link in unique_links:
+            cache_value = self.link_cache.get(link)
+            if cache_value is None:
+                checked_links[link] = link
+            elif cache_value["status"] in DEAD_LINK_STATUSES:
+                checked_links[link] = None
+            else:
+                checked_links[link] = cache_value.get("location", link)
+
+        return checked_links
+
+    def get_link_cache(self) -> LinkCacheDataType:
+        """Get the results that are not expired, so the cache file does not keep every link ever checked."""
+
+        now = time.time()
+        return {link: cache_value for link, cache_value in self.link_cache.items() if self.is_cached(link, now)}
+
+    def close(self) -> None:
+        self._session_pool.close()
+
+
+def create_link_checker(command_option: CommandOptionTypedDict, proxy_router: ProxyRouter) -> Optional[LinkChecker]:
+    if not command_option.get("check_links", False):
+        return None
+
+    link_cache: LinkCacheDataType = (fetch_link_cache_file(command_option["link_cache_path"]) if "link_cache_path" in command_option else {})
+    return LinkChecker(
+        proxy_router,
+        link_cache,
+        command_option["link_cache_ttl"] * 3600,
+        command_option["fetch_concurrency"],
+        command_option["fetch_host_concurrency"],
+        command_option["fetch_timeout"]
+    )
+
+
+def check_title_entries(title_entries: TitleEntriesDataType, link_checker: LinkChecker, history: HistoryStore, max_add: int) -> None:
+    """Discard the entries whose links are dead, and replace the links that are permanently redirected."""
+
+    checked_links = link_checker.check(entry.link for entries in title_entries.values() for entry in entries)
+    for title, entries in title_entries.items():
+        checked_entries: EntriesDataType = []
+        unique_links: Set[str] = set()
+        for entry in entries:
+            link = checked_links[entry.link]
+            if link is None:
+                report_entry("entries_discarded_dead", f"An entry for page \"{title}\" was discarded because its link \"{entry.link}\" was not found.")
+                continue
+
+            if link != entry.link:
+                # The new location may have been added before.
+                number_of_times_added = history.get_link_history(title).get(link, 0)
+                if number_of_times_added >= max_add:
+                    report_entry("entries_discarded_history", "An entry for page \"{0}\" was discarded because its link \"{1}\" was added {2} {3} before.".format(
+                        title,
+                        link,
+                        number_of_times_added,
+                        "time" + ("s" if number_of_times_added != 1 else "")
+                    ))
+                    continue
+
+            # A link may be redirected to the same location as another link.
+            if link in unique_links:
+                report_entry("entries_discarded_duplicate", f"An entry for page \"{title}\" was discarded because its link \"{link}\" was a duplicate.")
+                continue
+
+            if link != entry.link:
+                metrics.increment("links_redirected")
+                entry = entry._replace(link=link)
+
+            unique_links.add(link)
+            checked_entries.append(entry)
+
+        title_entries[title] = checked_entries
+
+
+def get_source_plans(plans: List[QueryPlan]) -> Dict[str, QueryPlan]:
+    source_plans: Dict[str, QueryPlan] = {}
+
+    for plan in plans:
+        for source in plan.sources:
+            source_plans[source] = plan
+
+    return source_plans
+
+
+def load_source_plans(command_option: CommandOptionTypedDict, config_cache: Optional[ConfigCacheDataType] = None) -> Dict[str, QueryPlan]:
+    plans, unique_sources = parse_config(command_option, config_cache)
+    return get_source_plans(plans)
+
+
+def reuse_source_plans(source_plans: Dict[str, QueryPlan], previous_source_plans: Dict[str, QueryPlan]) -> Dict[str, QueryPlan]:
+    """Replace the plans of a reloaded config by the previous plans of the same configs, so that the worker processes still know them."""
+
+    previous_plans: Dict[str, QueryPlan] = {plan.config_hash: plan for plan in previous_source_plans.values()}
+    return {source: previous_plans.get(plan.config_hash, plan) for source, plan in source_plans.items()}
+
+
+def iter_source_config(
+    command_option: CommandOptionTypedDict,
+    feed_cache: Optional[FeedCacheDataType] = None,
+    source_config: Optional[SourceConfigDataType] = None,
+    source_plans: Optional[Dict[str, QueryPlan]] = None,
+    proxy_router: Optional[ProxyRouter] = None,
+    defer_parse: bool = False
+) -> Iterator[Tuple[str, SourceConfigValueTypedDict]]:
+    """
+    Yield the config of each source as soon as its feed is fetched, and add it to `source_config`.
+
+    :param source_plans: The query plan of each source. The config is loaded
+        if it is not specified.
+    :param proxy_router: The router of the proxies of each source. It is
+        created from the options if it is not specified.
+    :param defer_parse: Whether to leave the feeds to be parsed by a `WorkerPool`.
+    """
+
+    if source_plans is None:
+        source_plans = load_source_plans(command_option)
+
+    source_option = get_source_options(command_option, source_plans.keys(), proxy_router)
+
+    # The feeds that were matched with another config are fetched and matched again.
+    if feed_cache is not None:
+        feed_cache = {
+            source: cache_value
+            for source, cache_value in feed_cache.items()
+            if source in source_plans and cache_value.get("config_hash") == source_plans[source].config_hash
+        }
+
+    fetch_results = iter_fetch_results(
+        source_option,
+        feed_cache,
+        command_option["fetch_concurrency"],
+        command_option["fetch_host_concurrency"],
+        command_option["fetch_timeout"],
+        command_option["feed_parser"],
+        defer_parse
+    )
+    for source, fetch_result in fetch_results:
+        config: SourceConfigValueTypedDict = {
+            "option": source_option[source],
+            "fetch_result": fetch_result,
+            "plan": source_plans[source],
+            "published": []
+        }
+
+        if source_config is not None:
+            source_config[source] = config
+
+        yield source, config
+
+
+def get_source_config(command_option: CommandOptionTypedDict, feed_cache: Optional[FeedCacheDataType] = None) -> SourceConfigDataType:
+    source_config: SourceConfigDataType = {}
+    for source, config in iter_source_config(command_option, feed_cache, source_config):
+        pass
+
+    return source_config
+
+
+def execute_queries(entry_index: EntryIndex, plan: QueryPlan) -> Tuple[List[QueryResultTypedDict], int, int]:
+    query_keyword_matches: List[List[str]] = [[] for query in plan.queries]
+    query_regex_matches: List[List[Match]] = [[] for query in plan.queries]
+    number_of_keyword_matches: int = 0
+    number_of_regex_matches: int = 0
+
+    # A keyword or regex that matches in more than one field is counted once.
+    matched_regexes: Set[Tuple[int, int]] = set()
+    for field in plan.fields:
+        # Search by keywords.
+        if field in plan.keyword_matchers:
+            for q, keywords in plan.keyword_matchers[field].match(entry_index, field).items():
+                keyword_matches = query_keyword_matches[q]
+                for keyword in keywords:
+                    if keyword not in keyword_matches:
+                        keyword_matches.append(keyword)
+                        number_of_keyword_matches += 1
+
+        # Search by regexes.
+        for q, r, compiled_pattern in plan.field_regexes.get(field, []):
+            if (q, r) in matched_regexes:
+                continue
+
+            result = compiled_pattern.search(entry_index.get_text(field))
+            if result is not None:
+                matched_regexes.add((q, r))
+                query_regex_matches[q].append(result)
+                number_of_regex_matches += 1
+
+    query_results: List[QueryResultTypedDict] = []
+    for q, query in enumerate(plan.queries):
+        query_results.append({
+            "q": q,
+            "query": query,
+            "keyword_matches": query_keyword_matches[q],
+            "regex_matches": query_regex_matches[q]
+        })
+
+    return query_results, number_of_keyword_matches, number_of_regex_matches
+
+
+def get_entry_timestamp(entry: FeedParserDict) -> Optional[float]:
+    published_parsed = entry.get("published_parsed")
+    return (float(calendar.timegm(published_parsed)) if published_parsed is not None else None)
+
+
+def get_entry_guid(entry: FeedParserDict) -> Optional[str]:
+    return entry.get("id", entry.get("link"))
+
+
+# How many characters of the summary of an entry without a title are used as its title.
+UNTITLED_LABEL_LENGTH: int = 100
+
+
+def get_untitled_entry_label(entry: FeedParserDict, link: str) -> str:
+    """Get a title for an entry without one from its summary, or its link if it has no summary either."""
+
+    summary = " ".join(strip_markup(entry.get("summary", "")).split())
+    if len(summary) <= 0:
+        return link
+
+    if len(summary) > UNTITLED_LABEL_LENGTH:
+        summary = summary[:UNTITLED_LABEL_LENGTH].rsplit(" ", 1)[0] + "…"
+
+    return summary
+
+
+@metrics.timed("search_entries")
+def search_entries(
+    feed: FeedParserDict,
+    plan: QueryPlan,
+    matches: MatchesDataType,
+    mark: Optional[SourceMarkTypedDict] = None,
+    min_published: Optional[float] = None,
+    published_times: Optional[List[float]] = None
+) -> Tuple[int, int, Optional[SourceMarkTypedDict]]:
+    """
+    Search the entries of a feed, and get the new mark of its newest entry.
+
+    Once two entries are ordered from newest to oldest, and while the entries
+    stay in that order, reading stops at the entry of `mark` or an older one,
+    and at the first entry published before `min_published`. Before that,
+    those entries are skipped instead, so that an old entry pinned at the
+    top of a feed does not stop reading before the new entries after it.
+
+    :param published_times: The publish times of the entries read are added to it.
+    """
+
+    total_keyword_matches: int = 0
+    total_regex_matches: int = 0
+    number_of_entries_read: int = 0
+    number_of_entries_matched: int = 0
+
+    new_mark: Optional[SourceMarkTypedDict] = (deepcopy(mark) if mark is not None else None)
+    is_date_ordered: bool = True
+    # Whether an entry was older than the one before it, so that the feed is known to be ordered from newest to oldest.
+    is_newest_first: bool = False
+    previous_published: Optional[float] = None
+
+    entries: Iterable[FeedParserDict] = feed.entries
+    for entry in entries:
+        guid = get_entry_guid(entry)
+        published = get_entry_timestamp(entry)
+        if published is None or (previous_published is not None and published > previous_published):
+            is_date_ordered = False
+        elif previous_published is not None:
+            is_newest_first = True
+
+        previous_published = published
+        if published is not None and published_times is not None:
+            published_times.append(published)
+
+        if is_date_ordered and mark is not None:
+            mark_published = mark.get("published")
+            if (guid is not None and guid == mark.get("guid")) or (published is not None and mark_published is not None and published < mark_published):
+                if is_newest_first:
+                    break
+
+                continue
+
+        if published is not None:
+            if new_mark is None or published > new_mark.get("published", -math.inf):
+                new_mark = {"published": published}
+                if guid is not None:
+                    new_mark["guid"] = guid
+
+            if min_published is not None and published < min_published:
+                if is_date_ordered and is_newest_first:
+                    break
+
+                continue
+
+        query_results, number_of_keyword_matches, number_of_regex_matches = execute_queries(EntryIndex(entry), plan)
+        total_keyword_matches += number_of_keyword_matches
+        total_regex_matches += number_of_regex_matches
+        number_of_entries_read += 1
+        is_matched = False
+        for query_result in query_results:
+            keyword_matches = query_result["keyword_matches"]
+            regex_matches = query_result["regex_matches"]
+            if len(keyword_matches) > 0 or len(regex_matches) > 0:
+                q = query_result["q"]
+                if not is_matched:
+                    # RSS 2.0 items only need a title or a description, and the link is optional too.
+                    entry_title: str = entry.get("title", "")
+                    link: Optional[str] = entry.get("link")
+                    if not link:
+                        report_entry("entries_discarded_no_link", (
+                            f"An entry \"{entry_title}\" was discarded because it has no link." if len(entry_title) > 0
+                            else "An entry without a title was discarded because it has no link."
+                        ))
+                        break
+
+                    if len(entry_title.strip()) <= 0:
+                        # A link without a title is shown as a bare numbered link.
+                        entry_title = get_untitled_entry_label(entry, link)
+                        report_entry("entries_untitled", f"An entry with the link \"{link}\" has no title, so \"{entry_title}\" is used as its title.")
+
+                    feed_entry = FeedEntry(entry_title, link, guid, published)
+                    is_matched = True
+
+                matches[q].append(feed_entry)
+
+        if is_matched:
+            number_of_entries_matched += 1
+
+    metrics.increment("entries_read", number_of_entries_read)
+    metrics.increment("entries_matched", number_of_entries_matched)
+    metrics.increment("keyword_matches", total_keyword_matches)
+    metrics.increment("regex_matches", total_regex_matches)
+
+    return total_keyword_matches, total_regex_matches, new_mark
+
+
+def get_entry_order(entry: FeedEntry) -> Tuple[bool, float, str]:
+    """Order entries by date and then by link, with undated entries last, so that the order does not depend on which source is fetched first."""
+
+    published = entry.published
+    return (published is None, (published if published is not None else 0), entry.link)
+
+
+@metrics.timed("process_matches")
+def process_matches(
+    plan: QueryPlan,
+    matches: MatchesDataType,
+    history: HistoryStore,
+    max_add: int = 1,
+    title_filter: Optional[TitleFilterDataType] = None,
+    max_links: Optional[int] = None
+) -> TitleEntriesDataType:
+    """
+    Get the unique entries of a source for each page title, in the order of `get_entry_order`.
+
+    :param max_links: How many of the newest unique entries are kept for each
+        page title. The older entries are not checked.
+    """
+
+    title_entries: TitleEntriesDataType = {}
+
+    # Add all matches to a page title in `title_entries`.
+    for q, titles in enumerate(plan.query_pages):
+        entries = matches[q]
+        if len(entries) > 0:
+            for title in titles:
+                if title_filter is not None and not title_filter(title):
+                    continue
+
+                if title not in title_entries:
                     title_entries[title] = []
 
-                title_entries[title].extend(entries)
+                title_entries[title].extend(entries)
+
+    for title, entries in title_entries.items():
+        # Sort entries by date.
+        entries.sort(key=get_entry_order)
+
+        # History.
+        link_history: LinkHistoryDataType = history.get_link_history(title)
+
+        # Remove duplicates.
+        unique_entries: EntriesDataType = []
+        unique_titles: Set[str] = set()
+        unique_links: Set[str] = set()
+        for entry in (reversed(entries) if max_links is not None else entries):
+            if max_links is not None and len(unique_entries) >= max_links:
+                break
+
+            entry_link: str = entry.link
+            if entry_link in link_history:
+                number_of_times_added: int = link_history[entry_link]
+                if number_of_times_added >= max_add:
+                    report_entry("entries_discarded_history", "An entry for page \"{0}\" was discarded because its link \"{1}\" was added {2} {3} before.".format(
+                        title,
+                        entry_link,
+                        number_of_times_added,
+                        "time" + ("s" if number_of_times_added != 1 else "")
+                    ))
+                    continue
+
+            if entry_link in unique_links:
+                report_entry("entries_discarded_duplicate", f"An entry for page \"{title}\" was discarded because its link \"{entry_link}\" was a duplicate.")
+                continue
+
+            entry_title: str = entry.title
+            if entry_title in unique_titles:
+                report_entry("entries_same_title", f"An entry for page \"{title}\" has the same title \"{entry_title}\" as another entry.")
+
+            unique_titles.add(entry_title)
+            unique_links.add(entry_link)
+            unique_entries.append(entry)
+
+        if max_links is not None:
+            unique_entries.reverse()
+
+        title_entries[title] = unique_entries
+
+    return title_entries
+
+
+def log_feed_cache_result(fetch_result: FeedFetchResultTypedDict) -> None:
+    cache_status = fetch_result["cache_status"]
+    bytes_received = fetch_result["bytes_received"]
+    bytes_saved = fetch_result["bytes_saved"]
+    pywikibot.output("Feed cache {0}: received {1} {2} and saved {3} {4}.".format(
+        ("miss" if cache_status == FeedCacheStatus.MISS else f"hit ({cache_status})"),
+        bytes_received,
+        "byte" + ("s" if bytes_received != 1 else ""),
+        bytes_saved,
+        "byte" + ("s" if bytes_saved != 1 else "")
+    ))
+
+
+def log_feed_cache_results(fetch_results: List[FeedFetchResultTypedDict]) -> None:
+    hits = sum(1 for fetch_result in fetch_results if fetch_result["cache_status"] != FeedCacheStatus.MISS)
+    misses = (len(fetch_results) - hits)
+    bytes_received = sum(fetch_result["bytes_received"] for fetch_result in fetch_results)
+    bytes_saved = sum(fetch_result["bytes_saved"] for fetch_result in fetch_results)
+    pywikibot.output("Feed cache: {0} {1}, {2} {3}, {4} {5} received, and {6} {7} saved.".format(
+        hits,
+        "hit" + ("s" if hits != 1 else ""),
+        misses,
+        "miss" + ("es" if misses != 1 else ""),
+        bytes_received,
+        "byte" + ("s" if bytes_received != 1 else ""),
+        bytes_saved,
+        "byte" + ("s" if bytes_saved != 1 else "")
+    ))
+    pywikibot.output("")
+
+
+def match_source(
+    source: str,
+    config: SourceConfigValueTypedDict,
+    history: HistoryStore,
+    max_add: int = 1,
+    source_marks: Optional[SourceMarkDataType] = None,
+    min_published: Optional[float] = None,
+    match_result: Optional[FeedMatchResultTypedDict] = None,
+    title_filter: Optional[TitleFilterDataType] = None,
+    max_links: Optional[int] = None
+) -> TitleEntriesDataType:
+    """
+    Get the entries of a source to add to each page title.
+
+    :param match_result: The result of parsing and searching the feed in a
+        worker process. The feed is parsed and searched here if it is not
+        specified.
+    :param title_filter: Whether entries are added to a page title. Entries
+        are added to every page title of the plan by default.
+    :param max_links: How many of the newest entries are added to each page title.
+    """
+
+    pywikibot.output(f"Parsing feed from source \"{source}\"...")
+
+    title_entries: TitleEntriesDataType = {}
+
+    option: SourceOptionValueTypedDict = config["option"]
+    fetch_result: FeedFetchResultTypedDict = config["fetch_result"]
+    feed: Optional[FeedParserDict] = fetch_result["feed"]
+    plan: QueryPlan = config["plan"]
+
+    has_proxy: bool = option["has_proxy"]
+    if has_proxy:
+        proxies = option["proxies"]
+        proxy_source = "command line"
+        if "proxy_regex" in option:
+            proxy_regex = option["proxy_regex"]
+            proxy_source = f"matched regex pattern \"{proxy_regex}\""
+        pywikibot.output(f"Using proxies \"{proxies}\" from {proxy_source}...")
+
+    log_feed_cache_result(fetch_result)
+
+    payload: Optional[FeedPayloadTypedDict] = fetch_result["payload"]
+    if payload is not None:
+        if match_result is not None:
+            metrics.merge(match_result["metrics"])
+            output_worker_records(match_result["records"])
+            feed = FeedParserDict(bozo=0, feed=FeedParserDict(match_result["feed_info"]), entries=[])
+            if "status" in payload:
+                feed["status"] = payload["status"]
+                feed["href"] = payload["href"]
+
+            if match_result["exception"] is not None and not match_result["is_partial"]:
+                feed["bozo"] = 1
+                feed["bozo_exception"] = match_result["exception"]
+        else:
+            feed = parse_payload(payload)
+
+        # The feed replaces the payload so that its content can be freed.
+        fetch_result["feed"] = feed
+        fetch_result["payload"] = None
+
+    if feed is None:
+        pywikibot.output("Skipped unchanged feed.")
+    elif "bozo_exception" in feed:
+        if "status" in feed:
+            status = feed["status"]
+            href = feed["href"]
+            pywikibot.error(f"Received HTTP status code {status} for \"{href}\".")
+
+        pywikibot.exception(feed["bozo_exception"])
+        metrics.increment("feeds_failed")
+    else:
+        matches: MatchesDataType
+        new_mark: Optional[SourceMarkTypedDict]
+        if match_result is not None:
+            matches = match_result["matches"]
+            total_keyword_matches = match_result["keyword_matches"]
+            total_regex_matches = match_result["regex_matches"]
+            new_mark = match_result["mark"]
+            config["published"].extend(match_result["published"])
+            if match_result["exception"] is not None:
+                feed["bozo"] = 1
+                feed["bozo_exception"] = match_result["exception"]
+        else:
+            matches = [[] for i in range(len(plan.queries))]
+            mark: Optional[SourceMarkTypedDict] = (source_marks.get(source) if source_marks is not None else None)
+            total_keyword_matches, total_regex_matches, new_mark = search_entries(feed, plan, matches, mark, min_published, config["published"])
+
+        if source_marks is not None and new_mark is not None:
+            source_marks[source] = new_mark
+
+        # A streamed feed can fail after some of its entries were matched.
+        if "bozo_exception" in feed:
+            pywikibot.exception(feed["bozo_exception"])
+            metrics.increment("feeds_failed")
+
+        title_entries = process_matches(plan, matches, history, max_add, title_filter, max_links)
+
+        # Only the status and schedule of the feed are needed after it is searched, so its entries are freed.
+        fetch_result["feed"] = get_compact_feed(feed)
+
+        pywikibot.output("Found {0} {1} and {2} {3}.".format(
+            total_keyword_matches,
+            "keyword match" + ("es" if total_keyword_matches != 1 else ""),
+            total_regex_matches,
+            "regex match" + ("es" if total_regex_matches != 1 else ""),
+        ))
+
+    pywikibot.output("Done.")
+    pywikibot.output("")
+
+    return title_entries
+
+
+def iter_source_matches(
+    source_configs: Iterable[Tuple[str, SourceConfigValueTypedDict]],
+    worker_pool: Optional["WorkerPool"] = None,
+    source_marks: Optional[SourceMarkDataType] = None,
+    min_published: Optional[float] = None
+) -> Iterator[Tuple[Tuple[str, SourceConfigValueTypedDict], Optional[FeedMatchResultTypedDict]]]:
+    if worker_pool is not None:
+        return worker_pool.match_sources(source_configs, source_marks, min_published)
+
+    return ((source_config, None) for source_config in source_configs)
+
+
+def get_title_entries(
+    source_configs: Iterable[Tuple[str, SourceConfigValueTypedDict]],
+    history: HistoryStore,
+    max_add: int = 1,
+    source_marks: Optional[SourceMarkDataType] = None,
+    max_entry_age: Optional[float] = None,
+    worker_pool: Optional["WorkerPool"] = None,
+    title_filter: Optional[TitleFilterDataType] = None,
+    max_links: Optional[int] = None,
+    title_sources: Optional[TitleSourcesDataType] = None
+) -> TitleEntriesDataType:
+    """
+    Get the entries to add to each page title.
+
+    :param source_marks: The marks of the newest entries read from each
+        source in previous runs. Only newer entries are read from date-ordered
+        feeds, and the marks are updated with the newest entries read.
+    :param max_entry_age: The max age in seconds of the entries to read.
+    :param worker_pool: The pool of the processes to parse and search the feeds in.
+    :param title_filter: The `title_filter`.
+    :param max_links: How many of the newest entries are added to each page title.
+    :param title_sources: The sources that entries are found in for each
+        page title are added to it.
+    """
+
+    # The entries of each source for each page title.
+    title_source_entries: Dict[str, MatchesDataType] = {}
+    fetch_results: List[FeedFetchResultTypedDict] = []
+    min_published: Optional[float] = (time.time() - max_entry_age if max_entry_age is not None else None)
+
+    for (source, config), match_result in iter_source_matches(source_configs, worker_pool, source_marks, min_published):
+        fetch_results.append(config["fetch_result"])
+        te: TitleEntriesDataType = match_source(source, config, history, max_add, source_marks, min_published, match_result, title_filter, max_links)
+        for title, entries in te.items():
+            if title not in title_source_entries:
+                title_source_entries[title] = []
+
+            title_source_entries[title].append(entries)
+            if title_sources is not None and len(entries) > 0:
+                if title not in title_sources:
+                    title_sources[title] = set()
+
+                title_sources[title].add(source)
+
+    log_feed_cache_results(fetch_results)
+
+    return {title: merge_source_entries(title, source_entries, max_links) for title, source_entries in title_source_entries.items()}
+
+
+def format_entry_to_link_markup(entry: FeedEntry) -> str:
+    title: str = entry.title
+    link: str = entry.link
+    external_link = ExternalLink(link, title)
+    # return f"* [{link} {title}]"
+    return f"* {external_link}"
+
+
+def map_entries_to_list_markup(entries: EntriesDataType) -> Iterator[str]:
+    return map(format_entry_to_link_markup, entries)
+
+
+def format_entries_to_list_markup(entries: EntriesDataType) -> str:
+    return "\n".join(map_entries_to_list_markup(entries))
+
+
+def get_unique_entries(
+    title: str,
+    previous_external_links: List[ExternalLink],
+    entries: Iterable[FeedEntry],
+    max_entries: Optional[int] = None
+) -> EntriesDataType:
+    """
+    Merge entries by excluding duplicate links that already exist.
+
+    :param max_entries: How many unique entries are kept. The entries after
+        them are not checked.
+    """
+
+    unique_entries: EntriesDataType = []
+    unique_titles: Set[str] = set()
+    unique_links: Set[str] = set()
+
+    # Add titles and links from existing external links.
+    for previous_external_link in previous_external_links:
+        previous_title = str(previous_external_link.title)
+        previous_link = str(previous_external_link.url)
+        unique_titles.add(previous_title)
+        unique_links.add(previous_link)
+
+    # Check for titles and links that already exist, and remove duplicates.
+    for entry in entries:
+        if max_entries is not None and len(unique_entries) >= max_entries:
+            break
+
+        entry_link: str = entry.link
+        if entry_link in unique_links:
+            report_entry("entries_discarded_duplicate", f"An entry for page \"{title}\" was discarded because its link \"{entry_link}\" was a duplicate.")
+            continue
+
+        entry_title: str = entry.title
+        if entry_title in unique_titles:
+            report_entry("entries_same_title", f"An entry for page \"{title}\" has the same title \"{entry_title}\" as another entry.")
+
+        unique_titles.add(entry_title)
+        unique_links.add(entry_link)
+        unique_entries.append(entry)
+
+    return unique_entries
+
+
+def merge_source_entries(title: str, source_entries: MatchesDataType, max_links: Optional[int] = None) -> EntriesDataType:
+    """
+    Merge the entries that each source found for a page title, and remove duplicates.
+
+    The entries of each source are already in the order of `get_entry_order`,
+    so they are merged with a heap instead of sorted again. With `max_links`,
+    they are merged from the newest, and the merge stops at the newest
+    `max_links` unique links. Undated entries are ordered after every dated
+    entry, as in `get_entry_order`.
+    """
+
+    if max_links is None:
+        return get_unique_entries(title, [], heapq.merge(*source_entries, key=get_entry_order))
+
+    newest_entries = heapq.merge(*(reversed(entries) for entries in source_entries), key=get_entry_order, reverse=True)
+    unique_entries = get_unique_entries(title, [], newest_entries, max_links)
+    unique_entries.reverse()
+    return unique_entries
+
+
+def log_external_links_added(number_of_external_links: int, title: str, text: str) -> None:
+    if number_of_external_links > 0:
+        # The links are shown in the diff instead, or not at all.
+        is_brief = (output_option["quiet"] or output_option["diff"])
+        pywikibot.output("Add {0} {1} to page \"{2}\"{3}".format(
+            number_of_external_links,
+            "external link" + ("s" if number_of_external_links != 1 else ""),
+            title,
+            ("." if is_brief else f":{text}")
+        ))
+
+
+def add_entries_to_section(page_title: str, external_link_section: mwparserfromhell.wikicode.Wikicode, entries: EntriesDataType) -> int:
+    """Add the entries after the last external link or line of the lead of an "External links" section."""
+
+    unique_entries = entries
+    text = "\n" + format_entries_to_list_markup(entries) + "\n\n"
+
+    subsections = external_link_section.get_sections(include_headings=True)
+    if len(subsections) > 0:
+        lead = subsections[0]
+        previous_node = lead
+
+        previous_external_links = lead.filter_external_links(recursive=False)
+        last_external_link_index = -1
+        if len(previous_external_links) > 0:
+            last_external_link = previous_external_links[-1]
+            last_external_link_index = lead.index(last_external_link)
+            previous_node = last_external_link
+
+        lines = lead.filter_text(recursive=False)
+        if len(lines) > 0:
+            last_line = lines[-1]
+            last_line_index = lead.index(last_line)
+            if last_external_link_index < last_line_index:
+                previous_node = last_line
+
+        unique_entries = get_unique_entries(page_title, previous_external_links, entries)
+
+        text = "\n" + format_entries_to_list_markup(unique_entries) + "\n\n"
+
+        external_link_section.replace(previous_node, previous_node.rstrip() + text)
+    else:
+        external_link_section.append(text)
+
+    number_of_unique_entries = len(unique_entries)
+    log_external_links_added(number_of_unique_entries, page_title, text)
+    return number_of_unique_entries
+
+
+def add_external_links_heading(page_title: str, wikicode: mwparserfromhell.wikicode.Wikicode, entries: EntriesDataType) -> int:
+    """Add an "External links" section with the entries after the last line of the page."""
+
+    heading = "\n\n== External links =="
+    previous_external_links: List[ExternalLink] = []
+    unique_entries = get_unique_entries(page_title, previous_external_links, entries)
+    content = "\n" + format_entries_to_list_markup(unique_entries) + "\n\n"
+    text = heading + content
+
+    lines = wikicode.filter_text(recursive=False)
+    if len(lines) > 0:
+        last_line = lines[-1]
+        wikicode.replace(last_line, last_line.rstrip() + text)
+    else:
+        wikicode.append(text)
+
+    number_of_unique_entries = len(unique_entries)
+    log_external_links_added(number_of_unique_entries, page_title, content)
+    return number_of_unique_entries
+
+
+class HeadingLocationTypedDict(TypedDict):
+    start: int
+    end: int
+    level: int
+    title: str
+
+
+# A heading on a line by itself, with only whitespace after it.
+heading_line_pattern: Pattern = re.compile(r"(=+)(.+?)(=+)[ \t]*")
+# Markup that can hide or fake headings, or that the line scanner cannot balance.
+ambiguous_markup_pattern: Pattern = re.compile(r"<!--|<\s*/?\s*(?:nowiki|pre|source|syntaxhighlight|includeonly|noinclude|onlyinclude|math|gallery|poem|score|timeline|graph|templatedata)\b", flags=re.IGNORECASE)
+open_tag_pattern: Pattern = re.compile(r"<([A-Za-z][A-Za-z0-9]*)(?:\s[^<>]*)?(?<!/)>")
+close_tag_pattern: Pattern = re.compile(r"</\s*([A-Za-z][A-Za-z0-9]*)\s*>")
+VOID_TAGS: Set[str] = {"br", "hr", "wbr", "img"}
+
+
+def count_open_tags(line: str) -> int:
+    number_of_open_tags = sum(1 for match in open_tag_pattern.finditer(line) if match.group(1).lower() not in VOID_TAGS)
+    number_of_close_tags = sum(1 for match in close_tag_pattern.finditer(line) if match.group(1).lower() not in VOID_TAGS)
+    return (number_of_open_tags - number_of_close_tags)
+
+
+def scan_headings(page_text: str) -> Optional[List[HeadingLocationTypedDict]]:
+    """
+    Find the top-level headings of a page by scanning its lines.
+
+    :return: None if the markup is ambiguous, such as a heading inside a
+        template, tag, or comment, so that the page must be fully parsed.
+    """
+
+    if ambiguous_markup_pattern.search(page_text) is not None:
+        return None
+
+    headings: List[HeadingLocationTypedDict] = []
+    brace_depth = 0
+    bracket_depth = 0
+    tag_depth = 0
+    start = 0
+    for line in page_text.split("\n"):
+        end = start + len(line)
+        if line.startswith("="):
+            if brace_depth != 0 or bracket_depth != 0 or tag_depth != 0:
+                return None
+
+            match = heading_line_pattern.fullmatch(line)
+            if match is None:
+                return None
+
+            opening, title, closing = match.groups()
+            level = min(len(opening), len(closing), 6)
+            title = opening[level:] + title + closing[level:]
+            if len(title.strip("=")) <= 0:
+                return None
+
+            # The whitespace after a heading belongs to its section.
+            headings.append({
+                "start": start,
+                "end": start + match.end(3),
+                "level": level,
+                "title": title
+            })
+
+        # Unclosed bold or italic markup changes how the next lines are parsed.
+        if line.count("''") % 2 != 0:
+            return None
+
+        brace_depth += line.count("{") - line.count("}")
+        bracket_depth += line.count("[") - line.count("]")
+        tag_depth += count_open_tags(line)
+        if brace_depth < 0 or bracket_depth < 0 or tag_depth < 0:
+            return None
+
+        start = end + 1
+
+    if brace_depth != 0 or bracket_depth != 0 or tag_depth != 0:
+        return None
+
+    return headings
+
+
+def get_external_links_section_span(headings: List[HeadingLocationTypedDict], text_length: int) -> Optional[Tuple[int, int]]:
+    """
+    Get where the text of the last level 2 "External links" section starts and ends.
+
+    The section starts after its heading, and ends at the next heading of the
+    same or a higher level.
+
+    :return: None if there is no such heading.
+    """
+
+    external_links_heading: Optional[int] = None
+    for i, heading in enumerate(headings):
+        if heading["level"] == 2 and re.search(r"External links", heading["title"], flags=(re.IGNORECASE | re.DOTALL)) is not None:
+            external_links_heading = i
+
+    if external_links_heading is None:
+        return None
+
+    start = headings[external_links_heading]["end"]
+    end = text_length
+    for next_heading in headings[(external_links_heading + 1):]:
+        if next_heading["level"] <= 2:
+            end = next_heading["start"]
+            break
+
+    return start, end
+
+
+def feed_external_links_by_scan(page_title: str, page_text: str, entries: EntriesDataType) -> Optional[Tuple[str, int]]:
+    """
+    Add the entries by only parsing the section that they are added to.
+
+    The section is located by scanning the headings of the page, and it is
+    parsed by itself. The result is the same as parsing the whole page.
+
+    :return: None if the page must be fully parsed instead.
+    """
+
+    headings = scan_headings(page_text)
+    if headings is None or len(headings) <= 0:
+        return None
+
+    span = get_external_links_section_span(headings, len(page_text))
+    if span is not None:
+        start, end = span
+        section = mwparserfromhell.parse(page_text[start:end])
+        number_of_external_links_added = add_entries_to_section(page_title, section, entries)
+    else:
+        # The heading is added after the last line, which is in the last section unless the section has no text.
+        start = headings[-1]["start"]
+        end = len(page_text)
+        section = mwparserfromhell.parse(page_text[start:end])
+        if len(section.filter_text(recursive=False)) <= 0:
+            return None
+
+        number_of_external_links_added = add_external_links_heading(page_title, section, entries)
+
+    revised_page_text = (page_text[:start] + str(section) + page_text[end:]).rstrip()
+    return revised_page_text, number_of_external_links_added
+
+
+@metrics.timed("feed_external_links")
+def feed_external_links(page_title: str, page_text: str, entries: EntriesDataType) -> Tuple[str, int]:
+    result = feed_external_links_by_scan(page_title, page_text, entries)
+    if result is not None:
+        return result
+
+    return feed_external_links_by_parse(page_title, page_text, entries)
+
+
+def feed_external_links_by_parse(page_title: str, page_text: str, entries: EntriesDataType) -> Tuple[str, int]:
+    wikicode = mwparserfromhell.parse(page_text)
+
+    number_of_external_links_added = 0
+
+    external_link_sections = wikicode.get_sections(levels=[2], matches=r"External links", include_headings=False)
+    if len(external_link_sections) > 0:
+        for external_link_section in external_link_sections[-1:]:
+            number_of_external_links_added += add_entries_to_section(page_title, external_link_section, entries)
+    else:
+        number_of_external_links_added += add_external_links_heading(page_title, wikicode, entries)
+
+    revised_page_text = wikicode.rstrip()
+
+    return revised_page_text, number_of_external_links_added
+
+
+def output_separator(title: str, character: str, line_length: int = 80) -> str:
+    separator_line = (character * line_length)
+    buffer = [
+        separator_line,
+        "\n"
+    ]
+
+    if isinstance(title, str):
+        title_length = len(title)
+        if title_length > 0:
+            padded_line_length = (line_length - 2)
+            if title_length < padded_line_length:
+                side = ((padded_line_length - title_length) / 2)
+                left_side_length = math.floor(side)
+                right_side_length = math.ceil(side)
+                left_side = (character * left_side_length)
+                right_side = (character * right_side_length)
+                buffer = [
+                    left_side,
+                    " " + title + " ",
+                    right_side,
+                    "\n"
+                ]
+            else:
+                buffer.append("\n" + title + ":\n")
+
+    return "".join(buffer)
 
-            pywikibot.output("Found {0} {1} and {2} {3}.".format(
-                total_keyword_matches,
-                "keyword match" + ("es" if total_keyword_matches != 1 else ""),
-                total_regex_matches,
-                "regex match" + ("es" if total_regex_matches != 1 else ""),
-            ))
 
-        pywikibot.output("Done.")
+revised_page_text_separator: str = output_separator("Revised page text", "-")
+revised_section_text_separator: str = output_separator("Revised section text", "-")
+page_text_diff_separator: str = output_separator("Page text diff", "-")
+section_text_diff_separator: str = output_separator("Section text diff", "-")
+save_result_separator: str = output_separator("Save result", "-")
+
+
+def output_unless_quiet(text: str) -> None:
+    if not output_option["quiet"]:
+        pywikibot.output(text)
+
+
+def output_revised_text(separator: str, diff_separator: str, text: str, revised_text: str) -> None:
+    """Output the revised text of a page or section, or a unified diff of it with `-diff`. Nothing is output with `-quiet` alone."""
+
+    if output_option["diff"]:
+        diff_lines = difflib.unified_diff(text.splitlines(), revised_text.splitlines(), "before", "after", lineterm="")
+        pywikibot.output(diff_separator)
+        pywikibot.output("\n".join(diff_lines))
+        output_unless_quiet("")
+    elif not output_option["quiet"]:
+        pywikibot.output(separator)
+        pywikibot.output(revised_text)
         pywikibot.output("")
 
-    # Remove duplicates.
-    for title, entries in title_entries.items():
-        title_entries[title] = get_unique_entries(title, [], entries)
 
-    return title_entries
+def format_edit_summary(number_of_external_links_added: int, number_of_external_links_removed: int = 0, archive_title: Optional[str] = None) -> str:
+    summary = "Add {0} {1}".format(
+        number_of_external_links_added,
+        "external link" + ("s" if number_of_external_links_added != 1 else ""),
+    )
+    if number_of_external_links_removed > 0:
+        summary += " and {0} {1} old {2}".format(
+            ("archive" if archive_title is not None else "remove"),
+            number_of_external_links_removed,
+            "external link" + ("s" if number_of_external_links_removed != 1 else "")
+        )
+        if archive_title is not None:
+            summary += f" to [[{archive_title}]]"
 
+    return summary + "."
 
-def format_entry_to_link_markup(entry: FeedParserDict) -> str:
-    title: str = entry.title
-    link: str = entry.link
-    external_link = ExternalLink(link, title)
-    # return f"* [{link} {title}]"
-    return f"* {external_link}"
 
+# A line of an external link in the markup that the bot adds it with.
+bot_link_line_pattern: Pattern = re.compile(r"\* \[([^\s\]]+) ([^\]\n]*)\]")
+
+
+class LinkRetention:
+    """
+    Policy of how many of the links that the bot added are kept in the "External links" section of a page.
+
+    When the bot adds links to a page, the links it added before are removed
+    if they are past `max_links` or `max_age`, oldest first, and appended to
+    the archive subpage of the page if there is one. A link is only known to
+    be added by the bot if its line has exactly the markup of the bot, it is
+    not nested in other markup, and the history of the page has it, so links
+    added by other editors are never removed.
+    """
+
+    def __init__(
+        self,
+        history: HistoryStore,
+        max_links: Optional[int] = None,
+        max_age: Optional[float] = None,
+        batch: int = 1,
+        archive_subpage: Optional[str] = None
+    ) -> None:
+        """
+        Initializer.
+        :param history: The `history` of when each link was last added.
+        :param max_links: How many links that the bot added are kept.
+        :param max_age: How many seconds after it was last added a link is kept.
+        :param batch: How many links must be past the policy before they are removed together.
+        :param archive_subpage: The title of the subpage of each page that its removed links are appended to.
+        """
+
+        self.history = history
+        self.max_links = max_links
+        self.max_age = max_age
+        self.batch = batch
+        self.archive_subpage = archive_subpage
+
+    def get_archive_title(self, title: str) -> Optional[str]:
+        return (f"{title}/{self.archive_subpage}" if self.archive_subpage is not None else None)
+
+    def prune_section_text(self, section_text: str, link_times: Dict[str, float], now: float) -> Tuple[str, List[str]]:
+        """Remove the lines of the links past the policy from the text of an "External links" section."""
+
+        # Where the external links that are not nested in other markup start.
+        top_level_offsets: Set[int] = set()
+        offset = 0
+        for node in mwparserfromhell.parse(section_text).nodes:
+            if isinstance(node, ExternalLink):
+                top_level_offsets.add(offset)
+
+            offset += len(str(node))
+
+        lines = section_text.split("\n")
+        # The time and line index of each link that the bot added.
+        bot_links: List[Tuple[float, int]] = []
+        line_start = 0
+        for i, line in enumerate(lines):
+            match = bot_link_line_pattern.fullmatch(line)
+            if match is not None and match.group(1) in link_times and (line_start + 2) in top_level_offsets:
+                bot_links.append((link_times[match.group(1)], i))
+
+            line_start += len(line) + 1
+
+        bot_links.sort()
+        pruned_indices: Set[int] = set()
+        if self.max_age is not None:
+            pruned_indices.update(i for last_added, i in bot_links if last_added < (now - self.max_age))
+
+        if self.max_links is not None:
+            kept_links = [(last_added, i) for last_added, i in bot_links if i not in pruned_indices]
+            pruned_indices.update(i for last_added, i in kept_links[:max(len(kept_links) - self.max_links, 0)])
+
+        if len(pruned_indices) <= 0 or len(pruned_indices) < self.batch:
+            return section_text, []
+
+        pruned_lines = [lines[i] for i in sorted(pruned_indices)]
+        revised_section_text = "\n".join(line for i, line in enumerate(lines) if i not in pruned_indices)
+        return revised_section_text, pruned_lines
+
+    def prune(self, title: str, text: str, entries: EntriesDataType) -> Tuple[str, List[str]]:
+        """
+        Remove the links past the policy from the "External links" section of a page or section text.
+
+        :param entries: The entries that are being added, which are the newest links.
+        :return: The revised text, and the lines of the links removed.
+        """
+
+        now = time.time()
+        link_times = self.history.get_link_times(title)
+        for entry in entries:
+            link_times[entry.link] = now
+
+        headings = scan_headings(text)
+        if headings is not None:
+            span = get_external_links_section_span(headings, len(text))
+            if span is None:
+                return text, []
+
+            start, end = span
+            revised_section_text, pruned_lines = self.prune_section_text(text[start:end], link_times, now)
+            return (text[:start] + revised_section_text + text[end:]), pruned_lines
+
+        wikicode = mwparserfromhell.parse(text)
+        external_link_sections = wikicode.get_sections(levels=[2], matches=r"External links", include_headings=False)
+        if len(external_link_sections) <= 0:
+            return text, []
+
+        external_link_section = external_link_sections[-1]
+        revised_section_text, pruned_lines = self.prune_section_text(str(external_link_section), link_times, now)
+        if len(pruned_lines) > 0:
+            wikicode.replace(external_link_section, revised_section_text)
+
+        return str(wikicode), pruned_lines
+
+    def archive(self, site: pywikibot.site.APISite, title: str, lines: List[str]) -> None:
+        """Append the lines of the links removed from a page to its archive subpage in one edit."""
+
+        archive_title = self.get_archive_title(title)
+        if archive_title is None or len(lines) <= 0:
+            return
+
+        archive_page = pywikibot.Page(site, archive_title)
+        archive_text = (archive_page.text if archive_page.exists() else "")
+        # Lines that were archived before a failed save of the page are not archived again.
+        archived_lines = set(archive_text.split("\n"))
+        new_lines = [line for line in lines if line not in archived_lines]
+        if len(new_lines) <= 0:
+            return
+
+        archive_page.text = (archive_text.rstrip() + "\n" if len(archive_text.strip()) > 0 else "") + "\n".join(new_lines)
+        archive_page.save(
+            summary="Archive {0} old {1} from [[{2}]].".format(
+                len(new_lines),
+                "external link" + ("s" if len(new_lines) != 1 else ""),
+                title
+            ),
+            minor=False,
+            quiet=output_option["quiet"]
+        )
+        metrics.increment("links_archived", len(new_lines))
+
+
+def create_link_retention(command_option: CommandOptionTypedDict, history: HistoryStore) -> Optional[LinkRetention]:
+    """Create the retention policy of the links that the bot added, or None if every link is kept."""
+
+    if not any(key in command_option for key in ("retention_max_links", "retention_max_age")):
+        return None
+
+    max_age: Optional[float] = (command_option["retention_max_age"] * 86400 if "retention_max_age" in command_option else None)
+    return LinkRetention(
+        history,
+        command_option.get("retention_max_links"),
+        max_age,
+        command_option.get("retention_batch", 1),
+        command_option.get("archive_subpage")
+    )
+
+
+def log_external_links_removed(number_of_external_links: int, title: str, archive_title: Optional[str]) -> None:
+    if number_of_external_links > 0:
+        output_unless_quiet("{0} {1} old {2} of page \"{3}\"{4}.".format(
+            ("Archive" if archive_title is not None else "Remove"),
+            number_of_external_links,
+            "external link" + ("s" if number_of_external_links != 1 else ""),
+            title,
+            (f" to \"{archive_title}\"" if archive_title is not None else "")
+        ))
+
+
+class PageSaver:
+    """
+    Saver of the pages, which can save them on the put thread of Pywikibot while the next pages are rewritten.
+
+    Asynchronous saves are queued with `pywikibot.async_request`, so they
+    share the bounded put queue of Pywikibot, which blocks the bot when it is
+    full, and they are saved one at a time with the put throttle and the rate
+    limits of the site. The callback of a save is only called once it
+    succeeds.
+    """
+
+    def __init__(self, is_async: bool = False) -> None:
+        """
+        Initializer.
+        :param is_async: Whether to save the pages on the put thread instead of the calling thread.
+        """
+
+        self.is_async = is_async
+        self.condition = threading.Condition()
+        # How many saves are queued or in progress.
+        self.pending = 0
+        # The titles of the pages that failed to be saved.
+        self.failed_titles: Set[str] = set()
+
+    def add_failure(self, title: str, error: Optional[BaseException] = None) -> None:
+        """Record a page that was not saved, so that the entries found for it are read again in the next run."""
+
+        with self.condition:
+            self.failed_titles.add(title)
+
+        summary_log.write(title, PageStatus.FAILED, error=error)
+
+    def save(self, title: str, save: Callable[[], None], on_saved: Callable[[], None]) -> None:
+        """
+        Save a page, and call `on_saved` once it is saved.
+
+        A synchronous save raises its exception, and an asynchronous save
+        reports it on the put thread.
+        """
+
+        if not self.is_async:
+            with metrics.span("page_save"):
+                save()
+
+            on_saved()
+            return
+
+        with self.condition:
+            self.pending += 1
+
+        output_unless_quiet(f"Queued the save of page [[{title}]].")
+        pywikibot.async_request(self.run_save, title, save, on_saved)
+
+    def run_save(self, title: str, save: Callable[[], None], on_saved: Callable[[], None]) -> None:
+        """Save a page on the put thread. Exceptions are caught so that the put thread keeps running."""
+
+        try:
+            with metrics.span("page_save"):
+                save()
+
+            on_saved()
+        except Exception as exception:
+            metrics.increment("pages_failed")
+            self.add_failure(title, exception)
+            pywikibot.error(f"Failed to save page \"{title}\".")
+            pywikibot.exception(exception, tb=True)
+        finally:
+            with self.condition:
+                self.pending -= 1
+                self.condition.notify_all()
+
+    def wait(self) -> None:
+        """Wait until every queued save is done."""
+
+        with self.condition:
+            if self.pending > 0:
+                pywikibot.output(f"Waiting for {self.pending} {'page' + ('s' if self.pending != 1 else '')} to be saved...")
+
+            while self.pending > 0:
+                self.condition.wait()
+
+
+def save_external_links(
+    page: pywikibot.page.Page,
+    title: str,
+    entries: EntriesDataType,
+    page_revision: Optional[PageRevisionTypedDict] = None,
+    page_saver: Optional[PageSaver] = None,
+    on_saved: Optional[Callable[[], None]] = None,
+    retention: Optional[LinkRetention] = None
+) -> None:
+    """
+    Add the entries to the "External links" section of a page, and save it.
+
+    :param page_revision: The text of the page rewritten in a worker process.
+        It is only used if the text of the page has not changed since.
+    :param page_saver: The saver of the page. The page is saved before this
+        function returns by default.
+    :param on_saved: Called once the page is saved, or at once if no links
+        are added.
+    :param retention: The policy of the links that the bot added before,
+        which are removed in the same edit. The page is only edited to add
+        links, so nothing is removed if no links are added.
+    """
+
+    if page_saver is None:
+        page_saver = PageSaver()
+
+    output_unless_quiet(output_separator(f"Page \"{title}\"", "="))
+
+    page_text = page.text
+
+    if page_revision is not None and page_revision["text"] == page_text:
+        metrics.merge(page_revision["metrics"])
+        output_worker_records(page_revision["records"])
+        revised_page_text = page_revision["revised_text"]
+        number_of_external_links_added = page_revision["number_of_external_links_added"]
+    else:
+        revised_page_text, number_of_external_links_added = feed_external_links(title, page_text, entries)
+
+    if number_of_external_links_added <= 0:
+        pywikibot.output(f"No external links added to page \"{title}\".")
+        output_unless_quiet("")
+        metrics.increment("pages_unchanged")
+        summary_log.write(title, PageStatus.UNCHANGED, len(entries))
+        if on_saved is not None:
+            on_saved()
+
+        return
+
+    pruned_lines: List[str] = []
+    archive_title: Optional[str] = None
+    if retention is not None:
+        revised_page_text, pruned_lines = retention.prune(title, revised_page_text, entries)
+        archive_title = retention.get_archive_title(title)
+        log_external_links_removed(len(pruned_lines), title, archive_title)
+
+    output_revised_text(revised_page_text_separator, page_text_diff_separator, page_text, revised_page_text)
+
+    page.text = revised_page_text
+
+    output_unless_quiet(save_result_separator)
+
+    def save() -> None:
+        # The links are archived first so that they are never lost.
+        if retention is not None and len(pruned_lines) > 0:
+            retention.archive(page.site, title, pruned_lines)
+
+        page.save(
+            summary=format_edit_summary(number_of_external_links_added, len(pruned_lines), archive_title),
+            minor=False,
+            quiet=output_option["quiet"]
+        )
+
+    def on_page_saved() -> None:
+        metrics.increment("pages_saved")
+        metrics.increment("links_added", number_of_external_links_added)
+        if len(pruned_lines) > 0:
+            metrics.increment("links_removed", len(pruned_lines))
+        summary_log.write(title, PageStatus.SAVED, len(entries), number_of_external_links_added)
+        if on_saved is not None:
+            on_saved()
+
+    page_saver.save(title, save, on_page_saved)
+    output_unless_quiet("")
+
+
+def get_external_links_section(site: pywikibot.site.APISite, title: str) -> Optional[Tuple[str, bool]]:
+    """
+    Get the index of the last level 2 "External links" section of a page, and whether it is the last section.
+
+    :return: None if the page has no such section that can be edited by itself.
+    """
+
+    data = site.simple_request(action="parse", page=title, prop="sections", formatversion=2).submit()
+    sections: List[Dict[str, Any]] = data["parse"]["sections"]
+
+    external_links_section: Optional[Dict[str, Any]] = None
+    for section in sections:
+        if int(section["level"]) == 2 and re.search(r"External links", section["line"], flags=(re.IGNORECASE | re.DOTALL)) is not None:
+            external_links_section = section
+
+    # Sections from transcluded templates have indices like "T-1".
+    if external_links_section is None or not str(external_links_section["index"]).isdigit():
+        return None
+
+    return str(external_links_section["index"]), (external_links_section is sections[-1])
+
+
+def save_external_links_section(
+    page: pywikibot.page.Page,
+    title: str,
+    entries: EntriesDataType,
+    page_saver: Optional[PageSaver] = None,
+    on_saved: Optional[Callable[[], None]] = None,
+    retention: Optional[LinkRetention] = None
+) -> None:
+    """
+    Add the entries to the "External links" section by editing only that section.
+
+    The links are appended to the end of the page when the section is the
+    last one and only gains a suffix. The whole page is edited when the
+    section must be created.
+
+    :param page_saver: The `page_saver`.
+    :param on_saved: The `on_saved` callback.
+    :param retention: The `retention`.
+    """
+
+    if page_saver is None:
+        page_saver = PageSaver()
+
+    site: pywikibot.site.APISite = page.site
+
+    try:
+        section = get_external_links_section(site, title)
+    except pywikibot.data.api.APIError as exception:
+        pywikibot.warning(f"Could not get the sections of page \"{title}\": {exception}")
+        section = None
+
+    if section is None:
+        save_external_links(page, title, entries, None, page_saver, on_saved, retention)
+        return
+
+    section_index, is_last_section = section
+
+    output_unless_quiet(output_separator(f"Page \"{title}\"", "="))
+
+    data = site.simple_request(
+        action="query",
+        prop="revisions",
+        titles=title,
+        rvprop="content|timestamp",
+        rvslots="main",
+        rvsection=section_index,
+        curtimestamp=True,
+        formatversion=2
+    ).submit()
+    revision: Dict[str, Any] = data["query"]["pages"][0]["revisions"][0]
+    section_text = get_revision_content(revision)
+
+    revised_section_text, number_of_external_links_added = feed_external_links(title, section_text, entries)
+
+    if number_of_external_links_added <= 0:
+        pywikibot.output(f"No external links added to page \"{title}\".")
+        output_unless_quiet("")
+        metrics.increment("pages_unchanged")
+        summary_log.write(title, PageStatus.UNCHANGED, len(entries))
+        if on_saved is not None:
+            on_saved()
+
+        return
+
+    pruned_lines: List[str] = []
+    archive_title: Optional[str] = None
+    if retention is not None:
+        revised_section_text, pruned_lines = retention.prune(title, revised_section_text, entries)
+        archive_title = retention.get_archive_title(title)
+        log_external_links_removed(len(pruned_lines), title, archive_title)
+
+    output_revised_text(revised_section_text_separator, section_text_diff_separator, section_text, revised_section_text)
+
+    edit_parameters: Dict[str, Any] = {
+        "action": "edit",
+        "title": title,
+        "summary": format_edit_summary(number_of_external_links_added, len(pruned_lines), archive_title),
+        "notminor": True,
+        "nocreate": True,
+        "basetimestamp": revision["timestamp"],
+        "starttimestamp": data["curtimestamp"],
+        "token": site.tokens["csrf"]
+    }
+    if site.has_right("bot"):
+        edit_parameters["bot"] = True
+
+    original_section_text = section_text.rstrip()
+    if is_last_section and revised_section_text.startswith(original_section_text):
+        edit_parameters["appendtext"] = revised_section_text[len(original_section_text):]
+    else:
+        edit_parameters["section"] = section_index
+        edit_parameters["text"] = revised_section_text
+
+    output_unless_quiet(save_result_separator)
+
+    def save() -> None:
+        # The links are archived first so that they are never lost.
+        if retention is not None and len(pruned_lines) > 0:
+            retention.archive(site, title, pruned_lines)
 
-def map_entries_to_list_markup(entries: EntriesDataType) -> Iterator[str]:
-    return map(format_entry_to_link_markup, entries)
+        result = site.simple_request(**edit_parameters).submit()
+        edit_result: Dict[str, Any] = result.get("edit", {})
+        if edit_result.get("result") != "Success":
+            raise pywikibot.data.api.APIError("editfailed", f"Failed to save section {section_index} of page \"{title}\".", result=result)
 
+        edit_type = ("Appended to" if "appendtext" in edit_parameters else f"Saved section {section_index} of")
+        output_unless_quiet(f"{edit_type} page [[{title}]].")
 
-def format_entries_to_list_markup(entries: EntriesDataType) -> str:
-    return "\n".join(map_entries_to_list_markup(entries))
+    def on_section_saved() -> None:
+        metrics.increment("pages_saved")
+        metrics.increment("links_added", number_of_external_links_added)
+        if len(pruned_lines) > 0:
+            metrics.increment("links_removed", len(pruned_lines))
+        summary_log.write(title, PageStatus.SAVED, len(entries), number_of_external_links_added)
+        if on_saved is not None:
+            on_saved()
 
+    page_saver.save(title, save, on_section_saved)
+    output_unless_quiet("")
 
-def get_unique_entries(title: str, previous_external_links: List[ExternalLink], entries: EntriesDataType) -> EntriesDataType:
-    """Merge entries by excluding duplicate links that already exist."""
 
-    unique_entries: EntriesDataType = []
-    unique_titles: Set[str] = set()
-    unique_links: Set[str] = set()
+def update_history(history: HistoryStore, title: str, entries: EntriesDataType) -> None:
+    history.add(title, (entry.link for entry in entries))
 
-    # Add titles and links from existing external links.
-    for previous_external_link in previous_external_links:
-        previous_title = str(previous_external_link.title)
-        previous_link = str(previous_external_link.url)
-        unique_titles.add(previous_title)
-        unique_links.add(previous_link)
 
-    # Check for titles and links that already exist, and remove duplicates.
-    for entry in entries:
-        entry_link: str = entry.link
-        if entry_link in unique_links:
-            pywikibot.warning(f"An entry for page \"{title}\" was discarded because its link \"{entry_link}\" was a duplicate.")
-            pywikibot.output("")
-            continue
+def parse_queue_window(window: str) -> Tuple[int, int]:
+    """Parse a daily window of local time such as "01:00-05:00" into its start and end minutes."""
 
-        entry_title: str = entry.title
-        if entry_title in unique_titles:
-            pywikibot.warning(f"An entry for page \"{title}\" has the same title \"{entry_title}\" as another entry.")
-            pywikibot.output("")
+    minutes: List[int] = []
+    for time_text in window.split("-"):
+        hours, seperator, minutes_text = time_text.strip().partition(":")
+        minutes.append(int(hours) * 60 + (int(minutes_text) if len(minutes_text) > 0 else 0))
 
-        unique_titles.add(entry_title)
-        unique_links.add(entry_link)
-        unique_entries.append(entry)
+    if len(minutes) != 2:
+        raise ValueError(f"\"{window}\" is not a window such as \"01:00-05:00\".")
 
-    return unique_entries
+    return minutes[0], minutes[1]
 
 
-def log_external_links_added(number_of_external_links: int, title: str, text: str) -> None:
-    if number_of_external_links > 0:
-        pywikibot.output("Add {0} {1} to page \"{2}\":{3}".format(
-            number_of_external_links,
-            "external link" + ("s" if number_of_external_links != 1 else ""),
-            title,
-            text
-        ))
+def is_in_queue_window(window: Tuple[int, int], now: float) -> bool:
+    local_time = time.localtime(now)
+    minute = local_time.tm_hour * 60 + local_time.tm_min
+    start, end = window
+    # The window can span midnight.
+    return (start <= minute < end if start <= end else (minute >= start or minute < end))
 
 
-def feed_external_links(page_title: str, page_text: str, entries: EntriesDataType) -> Tuple[str, int]:
-    wikicode = mwparserfromhell.parse(page_text)
+class EditQueue:
+    """
+    Queue of the entries found for each page, which are added in one edit once the page is due.
 
-    number_of_external_links_added = 0
+    The queue is stored in the history database, so the entries found in
+    several runs are added together instead of costing an edit each. A page
+    is due when it has at least `min_links` queued links, when its oldest
+    link was queued `max_age` seconds ago, or when the queue is flushed.
+    Entries stay queued until the page is saved.
+    """
 
-    external_link_sections = wikicode.get_sections(levels=[2], matches=r"External links", include_headings=False)
-    if len(external_link_sections) > 0:
-        for external_link_section in external_link_sections[-1:]:
-            unique_entries = entries
-            text = "\n" + format_entries_to_list_markup(entries) + "\n\n"
+    def __init__(
+        self,
+        history: HistoryStore,
+        min_links: Optional[int] = None,
+        max_age: Optional[float] = None,
+        flush: bool = False,
+        title_filter: Optional[TitleFilterDataType] = None,
+        max_links: Optional[int] = None
+    ) -> None:
+        """
+        Initializer.
+        :param history: The `history` that stores the queue.
+        :param min_links: How many links must be queued for a page to be due.
+        :param max_age: How many seconds the oldest link of a page is queued at most.
+        :param flush: Whether every page is due.
+        :param title_filter: Whether the queued entries of a page title are added in this cycle.
+        :param max_links: How many of the newest queued links are added to a
+            page that is due. The older links are removed from the queue.
+        """
 
-            subsections = external_link_section.get_sections(include_headings=True)
-            if len(subsections) > 0:
-                lead = subsections[0]
-                previous_node = lead
+        self.history = history
+        self.min_links = min_links
+        self.max_age = max_age
+        self.flush = flush
+        self.title_filter = title_filter
+        self.max_links = max_links
+        # The titles that entries were found for in this cycle.
+        self.titles: Set[str] = set()
 
-                previous_external_links = lead.filter_external_links(recursive=False)
-                last_external_link_index = -1
-                if len(previous_external_links) > 0:
-                    last_external_link = previous_external_links[-1]
-                    last_external_link_index = lead.index(last_external_link)
-                    previous_node = last_external_link
+    def is_due(self, number_of_links: int, first_queued: float, now: float) -> bool:
+        if self.flush:
+            return True
 
-                lines = lead.filter_text(recursive=False)
-                if len(lines) > 0:
-                    last_line = lines[-1]
-                    last_line_index = lead.index(last_line)
-                    if last_external_link_index < last_line_index:
-                        previous_node = last_line
+        if self.min_links is not None and number_of_links >= self.min_links:
+            return True
 
-                unique_entries = get_unique_entries(page_title, previous_external_links, entries)
+        return (self.max_age is not None and (now - first_queued) >= self.max_age)
 
-                text = "\n" + format_entries_to_list_markup(unique_entries) + "\n\n"
+    def take(self, title: str, entries: EntriesDataType) -> Optional[EntriesDataType]:
+        """
+        Queue the entries of a page, and get every queued entry of the page if it is due.
 
-                external_link_section.replace(previous_node, previous_node.rstrip() + text)
-            else:
-                external_link_section.append(text)
+        :return: None if the page is not due yet.
+        """
 
-            number_of_unique_entries = len(unique_entries)
-            number_of_external_links_added += number_of_unique_entries
-            log_external_links_added(number_of_unique_entries, page_title, text)
-    else:
-        heading = "\n\n== External links =="
-        previous_external_links = []
-        unique_entries = get_unique_entries(page_title, previous_external_links, entries)
-        content = "\n" + format_entries_to_list_markup(unique_entries) + "\n\n"
-        text = heading + content
+        self.titles.add(title)
+        number_of_entries = self.history.queue_entries(title, entries)
+        metrics.increment("entries_queued", number_of_entries)
+
+        queued_entries, first_queued = self.history.get_queued_entries(title)
+        if not self.is_due(len(queued_entries), first_queued, time.time()):
+            output_unless_quiet("Queued {0} {1} for page \"{2}\" ({3} queued).".format(
+                number_of_entries,
+                "external link" + ("s" if number_of_entries != 1 else ""),
+                title,
+                len(queued_entries)
+            ))
+            metrics.increment("pages_queued")
+            summary_log.write(title, PageStatus.QUEUED, len(queued_entries))
+            return None
 
-        lines = wikicode.filter_text(recursive=False)
-        if len(lines) > 0:
-            last_line = lines[-1]
-            wikicode.replace(last_line, last_line.rstrip() + text)
-        else:
-            wikicode.append(text)
+        return self._get_newest_entries(title, queued_entries)
 
-        number_of_unique_entries = len(unique_entries)
-        number_of_external_links_added += number_of_unique_entries
-        log_external_links_added(number_of_unique_entries, page_title, content)
+    def take_title_entries(self, title_entries: TitleEntriesDataType) -> None:
+        """Queue the entries of each title, and keep only the titles that are due with all of their queued entries."""
 
-    revised_page_text = wikicode.rstrip()
+        for title in list(title_entries):
+            entries = self.take(title, title_entries[title])
+            if entries is None:
+                del title_entries[title]
+            else:
+                title_entries[title] = entries
 
-    return revised_page_text, number_of_external_links_added
+        output_unless_quiet("")
 
+    def get_due_title_entries(self) -> TitleEntriesDataType:
+        """Get the queued entries of the pages that are due although no entries were found for them in this cycle."""
 
-def output_separator(title: str, character: str, line_length: int = 80) -> str:
-    separator_line = (character * line_length)
-    buffer = [
-        separator_line,
-        "\n"
-    ]
+        title_entries: TitleEntriesDataType = {}
+        now = time.time()
+        for title, (number_of_links, first_queued) in self.history.get_queued_titles().items():
+            if title in self.titles or not self.is_due(number_of_links, first_queued, now):
+                continue
 
-    if isinstance(title, str):
-        title_length = len(title)
-        if title_length > 0:
-            padded_line_length = (line_length - 2)
-            if title_length < padded_line_length:
-                side = ((padded_line_length - title_length) / 2)
-                left_side_length = math.floor(side)
-                right_side_length = math.ceil(side)
-                left_side = (character * left_side_length)
-                right_side = (character * right_side_length)
-                buffer = [
-                    left_side,
-                    " " + title + " ",
-                    right_side,
-                    "\n"
-                ]
-            else:
-                buffer.append("\n" + title + ":\n")
+            if self.title_filter is not None and not self.title_filter(title):
+                continue
 
-    return "".join(buffer)
+            entries, first_queued = self.history.get_queued_entries(title)
+            title_entries[title] = self._get_newest_entries(title, entries)
 
+        return title_entries
 
-revised_page_text_separator: str = output_separator("Revised page text", "-")
-save_result_separator: str = output_separator("Save result", "-")
+    def _get_newest_entries(self, title: str, entries: EntriesDataType) -> EntriesDataType:
+        """Sort the queued entries of a page, and remove the entries older than the newest `max_links` from the queue."""
 
+        entries.sort(key=get_entry_order)
+        if self.max_links is not None and len(entries) > self.max_links:
+            self.remove(title, entries[:-self.max_links])
+            entries = entries[-self.max_links:]
 
-def save_external_links(page: pywikibot.page.Page, title: str, entries: EntriesDataType) -> None:
-    pywikibot.output(output_separator(f"Page \"{title}\"", "="))
+        return entries
 
-    page_text = page.text
+    def remove(self, title: str, entries: EntriesDataType) -> None:
+        """Remove the entries of a page that was saved from the queue."""
 
-    revised_page_text, number_of_external_links_added = feed_external_links(title, page_text, entries)
+        self.history.remove_queued_entries(title, (entry.link for entry in entries))
 
-    if number_of_external_links_added <= 0:
-        pywikibot.output(f"No external links added to page \"{title}\".")
-        pywikibot.output("")
-        return
 
-    pywikibot.output(revised_page_text_separator)
-    pywikibot.output(revised_page_text)
-    pywikibot.output("")
+def create_edit_queue(
+    command_option: CommandOptionTypedDict,
+    history: HistoryStore,
+    title_filter: Optional[TitleFilterDataType] = None
+) -> Optional[EditQueue]:
+    """Create the edit queue of a cycle, or None if the links are added as soon as they are found."""
 
-    page.text = revised_page_text
+    if not any(key in command_option for key in ("queue_min_links", "queue_max_age", "queue_window", "flush_queue")):
+        return None
 
-    pywikibot.output(save_result_separator)
+    flush: bool = command_option.get("flush_queue", False)
+    if "queue_window" in command_option and is_in_queue_window(command_option["queue_window"], time.time()):
+        flush = True
 
-    page.save(
-        summary="Add {0} {1}.".format(
-            number_of_external_links_added,
-            "external link" + ("s" if number_of_external_links_added != 1 else ""),
-        ),
-        minor=False
-    )
+    max_age: Optional[float] = (command_option["queue_max_age"] * 3600 if "queue_max_age" in command_option else None)
+    return EditQueue(history, command_option.get("queue_min_links"), max_age, flush, title_filter, command_option.get("max_links"))
 
-    pywikibot.output("")
 
+def QueuedPageGenerator(
+    generator: PageEntryGeneratorDataType,
+    site: pywikibot.site.APISite,
+    edit_queue: EditQueue,
+    page_entries: PageEntriesDataType,
+    group: Optional[int] = None
+) -> PageEntryGeneratorDataType:
+    """
+    Yield the pages of `generator`, and then the pages that are only due in the queue.
 
-def update_history(history: HistoryDataType, title: str, entries: EntriesDataType) -> None:
-    link_history: Optional[LinkHistoryDataType] = None
-    if title not in history:
-        link_history = {entry.link: 1 for entry in entries}
-        history[title] = link_history
-    else:
-        link_history = history[title]
-        for entry in entries:
-            entry_link: str = entry.link
-            number_of_times_added: int = (link_history[entry_link] if entry_link in link_history else 0)
-            link_history[entry_link] = (number_of_times_added + 1)
+    :param group: How many of the pages due in the queue to preload at once,
+        or None to not preload them.
+    """
+
+    yield from generator
+
+    # The pages with new entries are queued or taken by now.
+    queued_page_generator: Iterable[pywikibot.page.Page] = PageEntryGenerator(site=site, title_entries=edit_queue.get_due_title_entries(), page_entries=page_entries)
+    if group is not None:
+        queued_page_generator = metrics.iterate("preload_pages", pagegenerators.PreloadingGenerator(queued_page_generator, groupsize=group))
+
+    yield from queued_page_generator
 
 
 def PageEntryGenerator(
@@ -797,6 +4433,478 @@ def PageEntryGenerator(
             yield page
 
 
+# The query plans of a worker process, set by `initialize_worker`.
+worker_plans: List[QueryPlan] = []
+# The log records of the current task of a worker process.
+worker_records: List[logging.LogRecord] = []
+
+
+class WorkerRecordHandler(logging.Handler):
+    """Keep the log records of a worker process so that the main process outputs them in order."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        worker_records.append(record)
+
+
+def initialize_worker(plans: List[QueryPlan]) -> None:
+    global worker_plans
+    worker_plans = plans
+
+    logger = logging.getLogger("pywiki")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    logger.addHandler(WorkerRecordHandler())
+    logger.propagate = False
+
+    # An interrupt is handled by the main process, which stops the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def take_worker_records() -> List[logging.LogRecord]:
+    records: List[logging.LogRecord] = []
+    formatter = logging.Formatter()
+    for record in worker_records:
+        # Format the message and traceback so that the record can be pickled.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info is not None:
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        records.append(record)
+
+    worker_records.clear()
+    return records
+
+
+def output_worker_records(records: List[logging.LogRecord]) -> None:
+    for record in records:
+        logging.getLogger(record.name).handle(record)
+
+
+def get_picklable_exception(exception: BaseException) -> BaseException:
+    try:
+        pickle.dumps(exception)
+    except Exception:
+        return RuntimeError(f"{type(exception).__name__}: {exception}")
+
+    return exception
+
+
+def match_payload(
+    payload: FeedPayloadTypedDict,
+    plan_index: Union[int, QueryPlan],
+    mark: Optional[SourceMarkTypedDict],
+    min_published: Optional[float]
+) -> FeedMatchResultTypedDict:
+    """Parse and search a feed in a worker process."""
+
+    metrics.reset()
+    plan = (worker_plans[plan_index] if isinstance(plan_index, int) else plan_index)
+    feed = parse_payload(payload)
+
+    matches: MatchesDataType = [[] for i in range(len(plan.queries))]
+    total_keyword_matches = 0
+    total_regex_matches = 0
+    new_mark: Optional[SourceMarkTypedDict] = None
+    published_times: List[float] = []
+    exception: Optional[BaseException] = feed.get("bozo_exception")
+    is_partial = False
+    if exception is None:
+        total_keyword_matches, total_regex_matches, new_mark = search_entries(feed, plan, matches, mark, min_published, published_times)
+        exception = feed.get("bozo_exception")
+        is_partial = (exception is not None)
+
+    return {
+        "feed_info": get_feed_schedule_info(feed),
+        "exception": (get_picklable_exception(exception) if exception is not None else None),
+        "is_partial": is_partial,
+        "matches": matches,
+        "keyword_matches": total_keyword_matches,
+        "regex_matches": total_regex_matches,
+        "mark": new_mark,
+        "published": published_times,
+        "metrics": metrics.get_data(),
+        "records": take_worker_records()
+    }
+
+
+def rewrite_page_text(title: str, text: str, entries: EntriesDataType) -> PageRevisionTypedDict:
+    """Add the entries to the text of a page in a worker process."""
+
+    metrics.reset()
+    revised_text, number_of_external_links_added = feed_external_links(title, text, entries)
+    return {
+        "text": text,
+        "revised_text": revised_text,
+        "number_of_external_links_added": number_of_external_links_added,
+        "metrics": metrics.get_data(),
+        "records": take_worker_records()
+    }
+
+
+def iter_in_order(
+    items: Iterable[T],
+    submit: Callable[[T], Optional["multiprocessing.pool.AsyncResult[Any]"]],
+    window: int
+) -> Iterator[Tuple[T, Optional[Any]]]:
+    """
+    Submit each item, and yield it with its result in the order that the items were submitted.
+
+    Up to `window` items are in progress at once. An item is yielded as soon
+    as it and every item before it are done, and its result is None if it
+    was not submitted or its task failed.
+    """
+
+    pending: Deque[Tuple[T, Optional["multiprocessing.pool.AsyncResult[Any]"]]] = deque()
+
+    def get_result(async_result: Optional["multiprocessing.pool.AsyncResult[Any]"]) -> Optional[Any]:
+        if async_result is None:
+            return None
+
+        try:
+            return async_result.get()
+        except Exception as exception:
+            pywikibot.exception(exception, tb=True)
+            return None
+
+    for item in items:
+        pending.append((item, submit(item)))
+        while len(pending) > 0 and (len(pending) > window or pending[0][1] is None or pending[0][1].ready()):
+            done_item, async_result = pending.popleft()
+            yield done_item, get_result(async_result)
+
+    while len(pending) > 0:
+        done_item, async_result = pending.popleft()
+        yield done_item, get_result(async_result)
+
+
+class WorkerPool:
+    """
+    Process pool that parses and searches feeds and rewrites page text on more than one core.
+
+    The workers are forked when the pool is created, before any other thread
+    is started, and they are given the query plans once. A task only sends
+    the content of a feed or the text of a page, and the plan of the feed if
+    it was loaded later, and the titles and links of entries are sent back. Results are used in the order that the tasks were
+    submitted, so they do not depend on the number of workers.
+    """
+
+    def __init__(self, workers: int, plans: Iterable[QueryPlan]) -> None:
+        """
+        Initializer.
+        :param workers: How many worker processes to start.
+        :param plans: The query plans of the sources to match.
+        """
+
+        self.plans: List[QueryPlan] = []
+        self.plan_indices: Dict[int, int] = {}
+        for plan in plans:
+            if id(plan) not in self.plan_indices:
+                self.plan_indices[id(plan)] = len(self.plans)
+                self.plans.append(plan)
+
+        # Twice as many tasks as workers are in progress so that no worker waits for the next task.
+        self.window = (workers * 2)
+        self.pool = multiprocessing.get_context("fork").Pool(workers, initializer=initialize_worker, initargs=(self.plans,))
+
+    def match_sources(
+        self,
+        source_configs: Iterable[Tuple[str, SourceConfigValueTypedDict]],
+        source_marks: Optional[SourceMarkDataType] = None,
+        min_published: Optional[float] = None
+    ) -> Iterator[Tuple[Tuple[str, SourceConfigValueTypedDict], Optional[FeedMatchResultTypedDict]]]:
+        """Yield the config of each source with the result of parsing and searching its feed in a worker, if any."""
+
+        def submit(source_config: Tuple[str, SourceConfigValueTypedDict]) -> Optional["multiprocessing.pool.AsyncResult[Any]"]:
+            source, config = source_config
+            payload = config["fetch_result"]["payload"]
+            if payload is None:
+                return None
+
+            # A plan that was loaded after the workers were forked, such as in a later cycle of daemon mode, is sent with the task.
+            plan_index: Union[int, QueryPlan] = self.plan_indices.get(id(config["plan"]), config["plan"])
+            mark = (source_marks.get(source) if source_marks is not None else None)
+            return self.pool.apply_async(match_payload, (payload, plan_index, mark, min_published))
+
+        return iter_in_order(source_configs, submit, self.window)
+
+    def rewrite_pages(
+        self,
+        pages: Iterable[pywikibot.page.Page],
+        get_entries: Callable[[pywikibot.page.Page], EntriesDataType],
+        page_revisions: Dict[str, PageRevisionTypedDict]
+    ) -> PageEntryGeneratorDataType:
+        """Yield each page once its text is rewritten in a worker, and add the revised text to `page_revisions`."""
+
+        def submit(page: pywikibot.page.Page) -> Optional["multiprocessing.pool.AsyncResult[Any]"]:
+            try:
+                title = page.title()
+                text = page.text
+            except Exception:
+                # The bot reports the error when it treats the page.
+                return None
+
+            return self.pool.apply_async(rewrite_page_text, (title, text, get_entries(page)))
+
+        for page, page_revision in iter_in_order(pages, submit, self.window):
+            if page_revision is not None:
+                page_revisions[page.title()] = page_revision
+
+            yield page
+
+    def close(self) -> None:
+        """Stop the workers. The results of their tasks are either used by then or no longer needed."""
+
+        self.pool.terminate()
+        self.pool.join()
+
+
+def create_worker_pool(command_option: CommandOptionTypedDict, plans: Iterable[QueryPlan]) -> Optional[WorkerPool]:
+    workers: int = command_option["workers"]
+    if workers <= 1:
+        return None
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pywikibot.warning("Worker processes are not supported on this platform, so only the main process is used.")
+        pywikibot.output("")
+        return None
+
+    return WorkerPool(workers, plans)
+
+
+class FeedPipeline:
+    """
+    Pipeline that matches entries, preloads pages and yields the pages to edit concurrently.
+
+    Sources are matched by a thread as soon as they are fetched, and the
+    titles that entries are found for are queued to be preloaded by another
+    thread. A preloaded page is yielded once every source that can route
+    entries to its title is matched. The stages are connected by bounded
+    queues, so a slow stage holds back the stages before it.
+    """
+
+    def __init__(
+        self,
+        site: pywikibot.site.APISite,
+        source_configs: Iterable[Tuple[str, SourceConfigValueTypedDict]],
+        source_plans: Dict[str, QueryPlan],
+        history: HistoryStore,
+        max_add: int = 1,
+        source_marks: Optional[SourceMarkDataType] = None,
+        max_entry_age: Optional[float] = None,
+        group: int = 50,
+        queue_size: int = 100,
+        preload: bool = True,
+        worker_pool: Optional["WorkerPool"] = None,
+        edit_queue: Optional[EditQueue] = None,
+        title_filter: Optional[TitleFilterDataType] = None,
+        max_links: Optional[int] = None,
+        link_checker: Optional[LinkChecker] = None
+    ) -> None:
+        """
+        Initializer.
+        :param site: The site.
+        :param source_configs: The config of each source in the order that the sources are fetched.
+        :param source_plans: The query plan of each source.
+        :param history: The `history`.
+        :param max_add: How many times a unique link is added to a page.
+        :param source_marks: The `source_marks`.
+        :param max_entry_age: The max age in seconds of the entries to read.
+        :param group: How many pages to preload at once.
+        :param queue_size: How many titles or pages each queue holds.
+        :param preload: Whether to preload the text of the pages.
+        :param worker_pool: The pool of the processes to parse and search the feeds in.
+        :param edit_queue: The queue that holds back the pages that are not due.
+        :param title_filter: Whether entries are added to a page title.
+        :param max_links: How many of the newest entries are added to each page title.
+        :param link_checker: The checker of the links of the entries found.
+        """
+
+        self.site = site
+        self.source_configs = source_configs
+        self.history = history
+        self.max_add = max_add
+        self.source_marks = source_marks
+        self.min_published: Optional[float] = (time.time() - max_entry_age if max_entry_age is not None else None)
+        self.group = group
+        self.preload = preload
+        self.worker_pool = worker_pool
+        self.edit_queue = edit_queue
+        self.title_filter = title_filter
+        self.max_links = max_links
+        self.link_checker = link_checker
+
+        self.title_entries: TitleEntriesDataType = {}
+        self.page_entries: PageEntriesDataType = {}
+        # The sources that entries are found in for each page title.
+        self.title_sources: TitleSourcesDataType = {}
+        # The entries of each source for each page title that is not emitted yet.
+        self._source_entries: Dict[str, MatchesDataType] = {}
+
+        self._lock = threading.Lock()
+        self._preload_queue: "queue.Queue[Optional[str]]" = queue.Queue(queue_size)
+        self._edit_queue: "queue.Queue[Optional[pywikibot.page.Page]]" = queue.Queue(queue_size)
+
+        # How many sources that can route entries to each title are not matched yet.
+        self._pending_sources: Dict[str, int] = {}
+        for source, plan in source_plans.items():
+            for title in plan.page_queries:
+                if title_filter is None or title_filter(title):
+                    self._pending_sources[title] = self._pending_sources.get(title, 0) + 1
+
+        self._ready_titles: Set[str] = set()
+        self._loaded_pages: Dict[str, pywikibot.page.Page] = {}
+
+    def _emit(self, title: str) -> Optional[pywikibot.page.Page]:
+        """Return the page of a title if it is both loaded and ready, and stop tracking it. Must hold the lock."""
+
+        if title not in self._ready_titles or title not in self._loaded_pages:
+            return None
+
+        self._ready_titles.remove(title)
+        page = self._loaded_pages.pop(title)
+        entries: Optional[EntriesDataType] = merge_source_entries(title, self._source_entries.pop(title), self.max_links)
+        if self.edit_queue is not None:
+            entries = self.edit_queue.take(title, cast(EntriesDataType, entries))
+            if entries is None:
+                return None
+
+        self.title_entries[title] = cast(EntriesDataType, entries)
+        self.page_entries[page] = self.title_entries[title]
+        return page
+
+    def _match(self) -> None:
+        fetch_results: List[FeedFetchResultTypedDict] = []
+        try:
+            source_matches = iter_source_matches(self.source_configs, self.worker_pool, self.source_marks, self.min_published)
+            for (source, config), match_result in source_matches:
+                fetch_results.append(config["fetch_result"])
+                source_title_entries = match_source(
+                    source,
+                    config,
+                    self.history,
+                    self.max_add,
+                    self.source_marks,
+                    self.min_published,
+                    match_result,
+                    self.title_filter,
+                    self.max_links
+                )
+                if self.link_checker is not None:
+                    check_title_entries(source_title_entries, self.link_checker, self.history, self.max_add)
+
+                for title, entries in source_title_entries.items():
+                    with self._lock:
+                        is_new_title = (title not in self._source_entries)
+                        if is_new_title:
+                            self._source_entries[title] = []
+
+                        self._source_entries[title].append(entries)
+                        if len(entries) > 0:
+                            if title not in self.title_sources:
+                                self.title_sources[title] = set()
+
+                            self.title_sources[title].add(source)
+
+                    if is_new_title:
+                        self._preload_queue.put(title)
+
+                self._resolve(config["plan"].page_queries)
+        except Exception as exception:
+            pywikibot.exception(exception, tb=True)
+        finally:
+            # Titles of sources that failed to be matched are edited with the entries that were found.
+            self._resolve(list(self._pending_sources), force=True)
+            log_feed_cache_results(fetch_results)
+            self._preload_queue.put(None)
+
+    def _resolve(self, titles: Iterable[str], force: bool = False) -> None:
+        pages: List[pywikibot.page.Page] = []
+        with self._lock:
+            for title in titles:
+                if title not in self._pending_sources:
+                    continue
+
+                self._pending_sources[title] -= 1
+                if self._pending_sources[title] > 0 and not force:
+                    continue
+
+                del self._pending_sources[title]
+                if title in self._source_entries:
+                    self._ready_titles.add(title)
+                    page = self._emit(title)
+                    if page is not None:
+                        pages.append(page)
+
+        for page in pages:
+            self._edit_queue.put(page)
+
+    def _preload(self) -> None:
+        try:
+            is_done = False
+            while not is_done:
+                titles: List[str] = []
+                title = self._preload_queue.get()
+                # Wait briefly for more titles to fill the batch.
+                while title is not None:
+                    titles.append(title)
+                    if len(titles) >= self.group:
+                        break
+
+                    try:
+                        title = self._preload_queue.get(timeout=0.5)
+                    except queue.Empty:
+                        break
+
+                is_done = (title is None)
+                if len(titles) > 0:
+                    self._load(titles)
+        finally:
+            self._edit_queue.put(None)
+
+    def _load(self, titles: List[str]) -> None:
+        batch: Dict[str, pywikibot.page.Page] = {title: pywikibot.Page(self.site, title) for title in titles}
+        try:
+            if self.preload:
+                with metrics.span("preload_pages"):
+                    for page in self.site.preloadpages(list(batch.values()), groupsize=self.group):
+                        pass
+        except Exception as exception:
+            # The pages are loaded when they are edited instead.
+            pywikibot.exception(exception)
+
+        pages: List[pywikibot.page.Page] = []
+        with self._lock:
+            for title, page in batch.items():
+                self._loaded_pages[title] = page
+                emitted_page = self._emit(title)
+                if emitted_page is not None:
+                    pages.append(emitted_page)
+
+        for page in pages:
+            self._edit_queue.put(page)
+
+    def generator(self) -> PageEntryGeneratorDataType:
+        """Start the pipeline and yield each page as soon as it can be edited."""
+
+        match_thread = threading.Thread(target=self._match, name="match_entries", daemon=True)
+        preload_thread = threading.Thread(target=self._preload, name="preload_pages", daemon=True)
+        match_thread.start()
+        preload_thread.start()
+
+        while True:
+            page = self._edit_queue.get()
+            if page is None:
+                break
+
+            yield page
+
+        match_thread.join()
+        preload_thread.join()
+
+
 class FeedExternalLinksBot(SingleSiteBot, NoRedirectPageBot):
     """Feed external links bot."""
 
@@ -806,7 +4914,13 @@ class FeedExternalLinksBot(SingleSiteBot, NoRedirectPageBot):
         generator: PageEntryGeneratorDataType,
         title_entries: TitleEntriesDataType,
         page_entries: PageEntriesDataType,
-        history: HistoryDataType,
+        history: HistoryStore,
+        section_edit: bool = False,
+        page_revisions: Optional[Dict[str, PageRevisionTypedDict]] = None,
+        edit_queue: Optional[EditQueue] = None,
+        page_saver: Optional[PageSaver] = None,
+        title_filter: Optional[TitleFilterDataType] = None,
+        retention: Optional[LinkRetention] = None,
         **kwargs: BotOptionTypedDict
     ) -> None:
         """
@@ -816,6 +4930,14 @@ class FeedExternalLinksBot(SingleSiteBot, NoRedirectPageBot):
         :param title_entries: The `title_entries`.
         :param page_entries: The `page_entries`.
         :param history: The `history`.
+        :param section_edit: Whether to edit only the "External links" section.
+        :param page_revisions: The text of each page rewritten in a worker process by title.
+        :param edit_queue: The queue that the entries of the pages saved are removed from.
+        :param page_saver: The saver of the pages. The history of a page is
+            only updated once it is saved.
+        :param title_filter: Whether a page can still be edited when its turn
+            comes, such as while the shard of its title is leased.
+        :param retention: The policy of the links that the bot added to a page before.
         :param kwargs:
         """
 
@@ -824,6 +4946,12 @@ class FeedExternalLinksBot(SingleSiteBot, NoRedirectPageBot):
         self.title_entries = title_entries
         self.page_entries = page_entries
         self.history = history
+        self.section_edit = section_edit
+        self.page_revisions: Dict[str, PageRevisionTypedDict] = (page_revisions if page_revisions is not None else {})
+        self.edit_queue = edit_queue
+        self.page_saver: PageSaver = (page_saver if page_saver is not None else PageSaver())
+        self.title_filter = title_filter
+        self.retention = retention
 
     def run(self) -> None:
         super().run()
@@ -833,15 +4961,420 @@ class FeedExternalLinksBot(SingleSiteBot, NoRedirectPageBot):
         page = self.current_page
         try:
             title = page.title()
+            if self.title_filter is not None and not self.title_filter(title):
+                pywikibot.warning(f"Skipped page \"{title}\" because the lease of its shard was lost.")
+                self.page_saver.add_failure(title)
+                return
+
             page_entries = self.page_entries
             entries = (page_entries[page] if page in page_entries else self.title_entries[title])
-            save_external_links(page, title, entries)
-            update_history(self.history, title, entries)
+            page_revision = self.page_revisions.pop(title, None)
+
+            def on_saved() -> None:
+                update_history(self.history, title, entries)
+                if self.edit_queue is not None:
+                    self.edit_queue.remove(title, entries)
+
+            if self.section_edit:
+                save_external_links_section(page, title, entries, self.page_saver, on_saved, self.retention)
+            else:
+                save_external_links(page, title, entries, page_revision, self.page_saver, on_saved, self.retention)
         except Exception as exception:
+            metrics.increment("pages_failed")
+            self.page_saver.add_failure(page.title(), exception)
             pywikibot.exception(exception, tb=True)
             pywikibot.output("")
 
 
+def get_feed_interval(feed: FeedParserDict) -> Optional[float]:
+    """Get the poll interval in seconds that a feed asks for with its `ttl` or `sy:updatePeriod` elements."""
+
+    intervals: List[float] = []
+    feed_info = feed.get("feed", {})
+    try:
+        if "ttl" in feed_info:
+            intervals.append(float(feed_info["ttl"]) * 60)
+
+        if "sy_updateperiod" in feed_info:
+            update_period = SYNDICATION_UPDATE_PERIODS[feed_info["sy_updateperiod"].lower()]
+            update_frequency = float(feed_info.get("sy_updatefrequency", 1))
+            intervals.append(update_period / max(update_frequency, 1))
+    except (KeyError, ValueError):
+        pass
+
+    intervals = [interval for interval in intervals if interval > 0]
+    return (max(intervals) if len(intervals) > 0 else None)
+
+
+def get_entry_gap(published_times: Iterable[float]) -> Optional[float]:
+    """Get the median gap in seconds between the newest entries."""
+
+    newest_times = sorted(set(published_times), reverse=True)[:POLL_GAP_ENTRIES]
+    gaps = sorted(newer - older for newer, older in zip(newest_times, newest_times[1:]))
+    return (gaps[len(gaps) // 2] if len(gaps) > 0 else None)
+
+
+def create_source_schedule(now: float) -> SourceScheduleTypedDict:
+    return {
+        "interval": POLL_INTERVAL,
+        "next_fetch": now,
+        "failures": 0,
+        "last_published": None
+    }
+
+
+def update_source_schedule(
+    schedule: SourceScheduleTypedDict,
+    config: SourceConfigValueTypedDict,
+    now: float,
+    min_interval: float,
+    max_interval: float
+) -> None:
+    """
+    Schedule the next fetch of a source from the result of its last fetch.
+
+    A feed with new entries is polled at half of the median gap between its
+    newest entries, but not more often than its `ttl` or `sy:updatePeriod`
+    allows. A feed without new entries is polled less often each time, and a
+    feed that fails is backed off exponentially.
+    """
+
+    feed: Optional[FeedParserDict] = config["fetch_result"]["feed"]
+    interval: float = schedule["interval"]
+    delay: float
+    if feed is not None and "bozo_exception" in feed:
+        schedule["failures"] += 1
+        delay = interval * (2 ** schedule["failures"])
+    else:
+        schedule["failures"] = 0
+        published_times: List[float] = config["published"]
+        last_published = schedule["last_published"]
+        newest_published = (max(published_times) if len(published_times) > 0 else None)
+        if newest_published is not None and (last_published is None or newest_published > last_published):
+            if last_published is not None:
+                published_times = published_times + [last_published]
+
+            schedule["last_published"] = newest_published
+            gap = get_entry_gap(published_times)
+            if gap is not None:
+                interval = gap / 2
+        else:
+            interval *= POLL_QUIET_FACTOR
+
+        if feed is not None:
+            feed_interval = get_feed_interval(feed)
+            if feed_interval is not None:
+                interval = max(interval, feed_interval)
+
+        interval = min(max(interval, min_interval), max_interval)
+        schedule["interval"] = interval
+        delay = interval
+
+    delay = min(delay, max_interval)
+    schedule["next_fetch"] = now + delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+
+def compact_history(history: HistoryStore, command_option: CommandOptionTypedDict) -> None:
+    if "history_max_age" in command_option:
+        number_of_links = history.compact(command_option["history_max_age"] * 86400)
+        pywikibot.output(f"Removed the history of {number_of_links} {'link' + ('s' if number_of_links != 1 else '')} older than {command_option['history_max_age']} days.")
+        pywikibot.output("")
+
+
+def run_cycle(
+    command_option: CommandOptionTypedDict,
+    bot_option: BotOptionTypedDict,
+    generator_args: List[str],
+    site: pywikibot.site.APISite,
+    history: HistoryStore,
+    feed_cache: FeedCacheDataType,
+    source_plans: Dict[str, QueryPlan],
+    proxy_router: ProxyRouter,
+    worker_pool: Optional[WorkerPool] = None,
+    shard_leases: Optional[ShardLeases] = None,
+    link_checker: Optional[LinkChecker] = None
+) -> Optional[SourceConfigDataType]:
+    """
+    Fetch the sources of `source_plans`, and add the entries found to the pages.
+
+    :param shard_leases: The leases of the shards of the pages that this
+        instance edits. Only the sources of the pages of the shards claimed
+        for the cycle are fetched.
+    :param link_checker: The checker of the links of the entries found, if
+        the links are checked before they are added.
+    :return: The config of each source fetched, or None if there is no generator.
+    """
+
+    # The entries counted instead of reported with `-quiet` are summarized for each cycle.
+    counters: Dict[str, float] = metrics.get_data()["counters"]
+
+    title_filter: Optional[TitleFilterDataType] = None
+    if shard_leases is not None:
+        owned_shards = shard_leases.acquire()
+        pywikibot.output(f"Leased {len(owned_shards)} of {shard_leases.shards} shards: {sorted(owned_shards)}.")
+        pywikibot.output("")
+        title_filter = shard_leases.owns
+        source_plans = {source: plan for source, plan in source_plans.items() if len(shard_leases.get_source_shards(plan)) > 0}
+        # Other instances may have added links to the pages of the shards claimed.
+        history.clear_cache()
+
+    # Entries are matched as soon as each source is fetched.
+    source_config: SourceConfigDataType = {}
+    source_configs = iter_source_config(command_option, feed_cache, source_config, source_plans, proxy_router, (worker_pool is not None))
+
+    source_marks: Optional[SourceMarkDataType] = None
+    if command_option.get("new_entries_only", False):
+        source_marks = history.get_source_marks()
+        # Several instances read a source for different shards, so each shard has its own mark.
+        if shard_leases is not None:
+            source_marks = shard_leases.get_source_marks(source_marks, source_plans)
+
+    # The marks of the sources of the pages that fail to be saved are kept.
+    previous_source_marks: SourceMarkDataType = (dict(source_marks) if source_marks is not None else {})
+
+    max_entry_age_seconds: Optional[float] = (command_option["max_entry_age"] * 86400 if "max_entry_age" in command_option else None)
+
+    title_entries: TitleEntriesDataType
+    page_entries: PageEntriesDataType
+    title_sources: TitleSourcesDataType
+    page_generator: PageEntryGeneratorDataType
+    # Section edits only load the section, so the page text is not preloaded.
+    section_edit: bool = command_option.get("section_edit", False)
+    edit_queue: Optional[EditQueue] = create_edit_queue(command_option, history, title_filter)
+    if command_option.get("pipeline", False):
+        pipeline = FeedPipeline(
+            site,
+            source_configs,
+            source_plans,
+            history,
+            command_option["max_add"],
+            source_marks,
+            max_entry_age_seconds,
+            command_option["group"],
+            command_option["group"] * 2,
+            not section_edit,
+            worker_pool,
+            edit_queue,
+            title_filter,
+            command_option.get("max_links"),
+            link_checker
+        )
+        title_entries = pipeline.title_entries
+        page_entries = pipeline.page_entries
+        title_sources = pipeline.title_sources
+        page_generator = pipeline.generator()
+        if edit_queue is not None:
+            page_generator = QueuedPageGenerator(page_generator, site, edit_queue, page_entries, (None if section_edit else command_option["group"]))
+    else:
+        title_sources = {}
+        title_entries = get_title_entries(
+            source_configs,
+            history,
+            command_option["max_add"],
+            source_marks,
+            max_entry_age_seconds,
+            worker_pool,
+            title_filter,
+            command_option.get("max_links"),
+            title_sources
+        )
+        # The queued entries were checked when they were found.
+        if link_checker is not None:
+            check_title_entries(title_entries, link_checker, history, command_option["max_add"])
+
+        if edit_queue is not None:
+            edit_queue.take_title_entries(title_entries)
+            title_entries.update(edit_queue.get_due_title_entries())
+
+        page_entries = {}
+        page_generator = PageEntryGenerator(site=site, title_entries=title_entries, page_entries=page_entries)
+        if not section_edit:
+            page_generator = metrics.iterate("preload_pages", pagegenerators.PreloadingGenerator(page_generator, groupsize=command_option["group"]))
+
+    # The text of the preloaded pages is rewritten by the workers ahead of the bot.
+    page_revisions: Dict[str, PageRevisionTypedDict] = {}
+    if worker_pool is not None and not section_edit:
+        def get_entries(page: pywikibot.page.Page) -> EntriesDataType:
+            return (page_entries[page] if page in page_entries else title_entries[page.title()])
+
+        page_generator = worker_pool.rewrite_pages(page_generator, get_entries, page_revisions)
+
+    # A factory combines its generators in place, so each cycle creates its own.
+    generator_factory = pagegenerators.GeneratorFactory()
+    for arg in generator_args:
+        generator_factory.handleArg(arg)
+
+    generator = generator_factory.getCombinedGenerator(page_generator)
+    if generator is None:
+        return None
+
+    page_saver = PageSaver(command_option.get("async_save", False))
+    retention: Optional[LinkRetention] = create_link_retention(command_option, history)
+    bot = FeedExternalLinksBot(
+        site,
+        generator,
+        title_entries,
+        page_entries,
+        history,
+        section_edit,
+        page_revisions,
+        edit_queue,
+        page_saver,
+        title_filter,
+        retention,
+        **bot_option  # type: ignore
+    )
+    try:
+        bot.run()
+    finally:
+        # The history and the marks are only written once the queued saves are done.
+        page_saver.wait()
+
+    output_quiet_summary(counters)
+
+    # The entries found for a page that failed to be saved are read again in the next run.
+    failed_sources: Set[str] = {source for title in page_saver.failed_titles for source in title_sources.get(title, ())}
+    if len(failed_sources) > 0:
+        pywikibot.warning(f"The entries of {len(failed_sources)} {'source' + ('s' if len(failed_sources) != 1 else '')} are read again next time because pages failed to be saved.")
+
+    for source in failed_sources:
+        # The previous cache value is kept, so the feed is not skipped as unchanged.
+        if source in source_config:
+            source_config[source]["fetch_result"]["cache_value"] = None
+
+    if source_marks is not None:
+        for source in failed_sources:
+            if source in previous_source_marks:
+                source_marks[source] = previous_source_marks[source]
+            else:
+                source_marks.pop(source, None)
+
+    # The marks are only moved after the pages are saved, so the entries of a failed run are read again.
+    if source_marks is not None:
+        if shard_leases is not None:
+            source_marks = shard_leases.get_shard_marks(source_marks, source_plans)
+
+        history.set_source_marks(source_marks)
+
+    return source_config
+
+
+def reload_source_plans(
+    command_option: CommandOptionTypedDict,
+    source_plans: Dict[str, QueryPlan],
+    config_cache: Optional[ConfigCacheDataType] = None
+) -> Dict[str, QueryPlan]:
+    """Load the config again, or keep the plans of the previous cycle if it cannot be loaded."""
+
+    try:
+        loaded_source_plans = load_source_plans(command_option, config_cache)
+    except Exception as exception:
+        pywikibot.error("Failed to load the config again, so the config of the previous cycle is used.")
+        pywikibot.exception(exception, tb=True)
+        pywikibot.output("")
+        return source_plans
+
+    metrics.set_gauge("sources", len(loaded_source_plans))
+    return reuse_source_plans(loaded_source_plans, source_plans)
+
+
+def run_daemon(
+    command_option: CommandOptionTypedDict,
+    bot_option: BotOptionTypedDict,
+    generator_args: List[str],
+    site: pywikibot.site.APISite,
+    history: HistoryStore,
+    feed_cache: FeedCacheDataType,
+    source_plans: Dict[str, QueryPlan],
+    proxy_router: ProxyRouter,
+    worker_pool: Optional[WorkerPool] = None,
+    shard_leases: Optional[ShardLeases] = None,
+    link_checker: Optional[LinkChecker] = None,
+    config_cache: Optional[ConfigCacheDataType] = None
+) -> None:
+    """
+    Run cycles until interrupted, and fetch each source when its schedule is due.
+
+    :param config_cache: The compiled config pages by revision. The config is
+        loaded again before each cycle after the first, and only the config
+        pages with a new revision are downloaded and compiled.
+    """
+
+    min_interval: float = command_option["poll_min_interval"] * 60
+    max_interval: float = command_option["poll_max_interval"] * 60
+    has_feed_cache_path: bool = ("feed_cache_path" in command_option)
+    is_simulation: bool = pywikibot.config.simulate
+
+    now = time.time()
+    source_schedule: SourceScheduleDataType = {source: create_source_schedule(now) for source in source_plans}
+    if len(source_schedule) <= 0:
+        pywikibot.error("No sources to poll.")
+        return
+
+    is_first_cycle: bool = True
+    try:
+        while True:
+            if len(source_schedule) > 0:
+                next_fetch = min(schedule["next_fetch"] for schedule in source_schedule.values())
+                delay = next_fetch - time.time()
+                if delay > 0:
+                    pywikibot.output(f"Waiting {delay / 60:.1f} minutes until the next source is due...")
+                    time.sleep(delay)
+            else:
+                pywikibot.output(f"Waiting {min_interval / 60:.1f} minutes until the config is loaded again...")
+                time.sleep(min_interval)
+
+            # The config was loaded by `main` for the first cycle.
+            if not is_first_cycle:
+                source_plans = reload_source_plans(command_option, source_plans, config_cache)
+                now = time.time()
+                for source in source_plans:
+                    if source not in source_schedule:
+                        source_schedule[source] = create_source_schedule(now)
+
+                for source in list(source_schedule):
+                    if source not in source_plans:
+                        del source_schedule[source]
+
+                if len(source_plans) <= 0:
+                    pywikibot.warning("No sources to poll.")
+                    continue
+
+            is_first_cycle = False
+            now = time.time()
+            due_source_plans = {source: plan for source, plan in source_plans.items() if source_schedule[source]["next_fetch"] <= now}
+            pywikibot.output(f"Polling {len(due_source_plans)} of {len(source_plans)} {'source' + ('s' if len(source_plans) != 1 else '')}...")
+            pywikibot.output("")
+
+            compact_history(history, command_option)
+            source_config = run_cycle(command_option, bot_option, generator_args, site, history, feed_cache, due_source_plans, proxy_router, worker_pool, shard_leases, link_checker)
+            if source_config is None:
+                pywikibot.bot.suggest_help(missing_generator=True)
+                return
+
+            now = time.time()
+            for source in due_source_plans:
+                schedule = source_schedule[source]
+                if source in source_config:
+                    update_source_schedule(schedule, source_config[source], now, min_interval, max_interval)
+                else:
+                    schedule["next_fetch"] = now + schedule["interval"]
+
+            if has_feed_cache_path and not is_simulation:
+                update_feed_cache(feed_cache, source_config)
+                write_feed_cache_file(command_option["feed_cache_path"], feed_cache)
+
+            if link_checker is not None and "link_cache_path" in command_option:
+                write_link_cache_file(command_option["link_cache_path"], link_checker.get_link_cache())
+
+            # The metrics are exported after each cycle so that a collector sees them while polling.
+            metrics.increment("cycles")
+            if "metrics_path" in command_option:
+                write_metrics_file(command_option["metrics_path"], command_option["metrics_format"])
+    except KeyboardInterrupt:
+        pywikibot.output("Stopped polling.")
+
+
 def main(*args: Tuple[Any, ...]) -> None:
     command_option: CommandOptionTypedDict = deepcopy(COMMAND_OPTION)
     bot_option: BotOptionTypedDict = {}
@@ -850,7 +5383,7 @@ def main(*args: Tuple[Any, ...]) -> None:
     has_history_path: bool = False
 
     local_args = pywikibot.handle_args(args)
-    generator_factory = pagegenerators.GeneratorFactory()
+    generator_args: List[str] = []
 
     for arg in local_args:
         key, seperator, value = arg.partition(":")
@@ -864,16 +5397,76 @@ def main(*args: Tuple[Any, ...]) -> None:
         elif key == "-config-page-title":
             config_page_title = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter config page title:").strip())
             command_option["config_page_title"] = config_page_title
+        elif key == "-config-page-prefix":
+            config_page_prefix = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter config page prefix:").strip())
+            command_option["config_page_prefix"] = config_page_prefix
+        elif key == "-config-cache-path":
+            config_cache_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter config cache file path:").strip())
+            command_option["config_cache_path"] = config_cache_path
         elif key == "-history-path":
-            history_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter history file path:").strip())
+            history_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter history database path:").strip())
             command_option["history_path"] = history_path
             has_history_path = True
+        elif key == "-import-history-path":
+            import_history_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter history file path to import:").strip())
+            command_option["import_history_path"] = import_history_path
+        elif key == "-new-entries-only":
+            command_option["new_entries_only"] = True
+        elif key == "-max-entry-age":
+            max_entry_age = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter max entry age in days:").strip())
+            command_option["max_entry_age"] = float(max_entry_age)
+        elif key == "-history-max-age":
+            history_max_age = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter history max age in days:").strip())
+            command_option["history_max_age"] = float(history_max_age)
         elif key == "-max-add":
             max_add = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter max add:").strip())
             command_option["max_add"] = int(max_add)
+        elif key == "-max-links-per-page":
+            max_links = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter max links per page:").strip())
+            command_option["max_links"] = int(max_links)
+        elif key == "-queue-min-links":
+            queue_min_links = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter queue min links:").strip())
+            command_option["queue_min_links"] = int(queue_min_links)
+        elif key == "-queue-max-age":
+            queue_max_age = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter queue max age in hours:").strip())
+            command_option["queue_max_age"] = float(queue_max_age)
+        elif key == "-queue-window":
+            queue_window = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter queue window:").strip())
+            command_option["queue_window"] = parse_queue_window(queue_window)
+        elif key == "-flush-queue":
+            command_option["flush_queue"] = True
+        elif key == "-retention-max-links":
+            retention_max_links = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter retention max links:").strip())
+            command_option["retention_max_links"] = int(retention_max_links)
+        elif key == "-retention-max-age":
+            retention_max_age = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter retention max age in days:").strip())
+            command_option["retention_max_age"] = float(retention_max_age)
+        elif key == "-retention-batch":
+            retention_batch = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter retention batch:").strip())
+            command_option["retention_batch"] = int(retention_batch)
+        elif key == "-archive-subpage":
+            archive_subpage = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter archive subpage title:").strip())
+            command_option["archive_subpage"] = archive_subpage
         elif key == "-group":
             group = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter group:").strip())
             command_option["group"] = int(group)
+        elif key == "-workers":
+            workers = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter workers:").strip())
+            command_option["workers"] = int(workers)
+        elif key == "-pipeline":
+            command_option["pipeline"] = True
+        elif key == "-section-edit":
+            command_option["section_edit"] = True
+        elif key == "-async-save":
+            command_option["async_save"] = True
+        elif key == "-daemon":
+            command_option["daemon"] = True
+        elif key == "-poll-min-interval":
+            poll_min_interval = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter poll min interval in minutes:").strip())
+            command_option["poll_min_interval"] = float(poll_min_interval)
+        elif key == "-poll-max-interval":
+            poll_max_interval = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter poll max interval in minutes:").strip())
+            command_option["poll_max_interval"] = float(poll_max_interval)
         elif key == "-proxy":
             proxy = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter proxy:").strip())
             command_option["proxy"] = proxy
@@ -886,33 +5479,140 @@ def main(*args: Tuple[Any, ...]) -> None:
         elif key == "-proxies-path":
             proxies_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter proxies file path:").strip())
             command_option["proxies_path"] = proxies_path
+        elif key == "-proxy-match":
+            proxy_match = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter proxy match:").strip())
+            command_option["proxy_match"] = ProxyMatchMode(proxy_match.lower())
+        elif key == "-feed-cache-path":
+            feed_cache_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter feed cache file path:").strip())
+            command_option["feed_cache_path"] = feed_cache_path
+        elif key == "-fetch-concurrency":
+            fetch_concurrency = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter fetch concurrency:").strip())
+            command_option["fetch_concurrency"] = int(fetch_concurrency)
+        elif key == "-fetch-host-concurrency":
+            fetch_host_concurrency = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter fetch host concurrency:").strip())
+            command_option["fetch_host_concurrency"] = int(fetch_host_concurrency)
+        elif key == "-fetch-timeout":
+            fetch_timeout = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter fetch timeout:").strip())
+            command_option["fetch_timeout"] = float(fetch_timeout)
+        elif key == "-check-links":
+            command_option["check_links"] = True
+        elif key == "-link-cache-path":
+            link_cache_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter link cache file path:").strip())
+            command_option["link_cache_path"] = link_cache_path
+        elif key == "-link-cache-ttl":
+            link_cache_ttl = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter link cache TTL in hours:").strip())
+            command_option["link_cache_ttl"] = float(link_cache_ttl)
+        elif key == "-feed-parser":
+            feed_parser = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter feed parser:").strip())
+            command_option["feed_parser"] = FeedParserType(feed_parser.lower())
+        elif key == "-metrics-path":
+            metrics_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter metrics file path:").strip())
+            command_option["metrics_path"] = metrics_path
+        elif key == "-metrics-format":
+            metrics_format = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter metrics format:").strip())
+            command_option["metrics_format"] = MetricsFormat(metrics_format.lower())
+        elif key == "-shard-path":
+            shard_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter shard database path:").strip())
+            command_option["shard_path"] = shard_path
+        elif key == "-shards":
+            shards = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter shards:").strip())
+            command_option["shards"] = int(shards)
+        elif key == "-shard-lease-time":
+            shard_lease_time = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter shard lease time in minutes:").strip())
+            command_option["shard_lease_time"] = float(shard_lease_time)
+        elif key == "-shard-join-time":
+            shard_join_time = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter shard join time in seconds:").strip())
+            command_option["shard_join_time"] = float(shard_join_time)
+        elif key == "-instance-id":
+            instance_id = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter instance ID:").strip())
+            command_option["instance_id"] = instance_id
+        elif key == "-quiet":
+            command_option["quiet"] = True
+        elif key == "-diff":
+            command_option["diff"] = True
+        elif key == "-summary-log":
+            summary_log_path = (stripped_value if len(stripped_value) > 0 else pywikibot.input("Enter summary log file path:").strip())
+            command_option["summary_log_path"] = summary_log_path
         else:
-            generator_factory.handleArg(arg)
+            generator_args.append(arg)
+
+    output_option["quiet"] = command_option.get("quiet", False)
+    output_option["diff"] = command_option.get("diff", False)
+
+    has_feed_cache_path: bool = ("feed_cache_path" in command_option)
+    feed_cache: FeedCacheDataType = (fetch_feed_cache_file(command_option["feed_cache_path"]) if has_feed_cache_path else {})
+
+    is_simulation: bool = pywikibot.config.simulate
+
+    history = HistoryStore((history_path if has_history_path else ":memory:"), is_simulation)
+    if "import_history_path" in command_option:
+        import_history_path = command_option["import_history_path"]
+        number_of_links = history.import_history(fetch_history_file(import_history_path))
+        pywikibot.output(f"Imported the history of {number_of_links} {'link' + ('s' if number_of_links != 1 else '')} from \"{import_history_path}\".")
+        pywikibot.output("")
 
-    source_config: SourceConfigDataType = get_source_config(command_option)
+    compact_history(history, command_option)
 
-    history: HistoryDataType = (fetch_history_file(history_path) if has_history_path else {})
+    if not has_history_path and create_edit_queue(command_option, history) is not None:
+        pywikibot.warning("The queued links are lost when the script exits unless `-history-path` is specified.")
 
-    title_entries: TitleEntriesDataType = get_title_entries(source_config, history, command_option["max_add"])
-    page_entries: PageEntriesDataType = {}
+    if not has_history_path and create_link_retention(command_option, history) is not None:
+        pywikibot.warning("Only the links added in this run are removed by the retention policy unless `-history-path` is specified.")
 
     site = pywikibot.Site()
-    generator = generator_factory.getCombinedGenerator(
-        pagegenerators.PreloadingGenerator(
-            PageEntryGenerator(site=site, title_entries=title_entries, page_entries=page_entries),
-            groupsize=command_option["group"]
+    # The compiled config pages are kept across the cycles of daemon mode, so only the changed pages are loaded again.
+    config_cache: ConfigCacheDataType = (fetch_config_cache_file(command_option["config_cache_path"]) if "config_cache_path" in command_option else {})
+    source_plans: Dict[str, QueryPlan] = load_source_plans(command_option, config_cache)
+    metrics.set_gauge("sources", len(source_plans))
+    # The routes of the sources are cached across the cycles of daemon mode.
+    proxy_router: ProxyRouter = create_proxy_router(command_option)
+    # The results of the links checked are cached across pages and cycles.
+    link_checker: Optional[LinkChecker] = create_link_checker(command_option, proxy_router)
+    # The workers are forked before any thread is started.
+    worker_pool: Optional[WorkerPool] = create_worker_pool(command_option, source_plans.values())
+    if "summary_log_path" in command_option:
+        summary_log.open(command_option["summary_log_path"])
+
+    shard_leases: Optional[ShardLeases] = None
+    if "shard_path" in command_option:
+        shard_leases = ShardLeases(
+            command_option["shard_path"],
+            command_option.get("instance_id", f"{socket.gethostname()}:{os.getpid()}"),
+            command_option["shards"],
+            command_option["shard_lease_time"] * 60
         )
-    )
-    if generator is None:
-        pywikibot.bot.suggest_help(missing_generator=True)
-        return
+        shard_leases.start()
+        shard_leases.join(command_option["shard_join_time"])
 
-    bot = FeedExternalLinksBot(site, generator, title_entries, page_entries, history, **bot_option)  # type: ignore
-    bot.run()
-
-    is_simulation: bool = pywikibot.config.simulate
-    if has_history_path and not is_simulation:
-        write_history_file(history_path, history)
+    try:
+        if command_option.get("daemon", False):
+            run_daemon(command_option, bot_option, generator_args, site, history, feed_cache, source_plans, proxy_router, worker_pool, shard_leases, link_checker, config_cache)
+        else:
+            source_config = run_cycle(command_option, bot_option, generator_args, site, history, feed_cache, source_plans, proxy_router, worker_pool, shard_leases, link_checker)
+            if source_config is None:
+                pywikibot.bot.suggest_help(missing_generator=True)
+                return
+
+            if has_feed_cache_path and not is_simulation:
+                update_feed_cache(feed_cache, source_config)
+                write_feed_cache_file(command_option["feed_cache_path"], feed_cache)
+
+            if link_checker is not None and "link_cache_path" in command_option:
+                write_link_cache_file(command_option["link_cache_path"], link_checker.get_link_cache())
+    finally:
+        if worker_pool is not None:
+            worker_pool.close()
+
+        if link_checker is not None:
+            link_checker.close()
+
+        if shard_leases is not None:
+            shard_leases.close()
+
+        summary_log.close()
+        history.close()
+        if "metrics_path" in command_option:
+            write_metrics_file(command_option["metrics_path"], command_option["metrics_format"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,607 @@
+#!/usr/bin/env python
+"""test_feed_external_links.py
+
+Unit tests of feed_external_links.py for the parts that do not need a wiki:
+the feed cache, the checks of the links of new entries, the fallback of
+the streaming feed parser, the keyword matcher against the regexes that it replaced, the
+entries read before the marks of the previous run, the lines
+that the link retention policy removes, and the shard leases of several
+instances.
+
+Run them from this directory with `python -m pytest` or
+`python -m unittest test_feed_external_links`.
+"""
+"""
+Copyright 2020 David Wong
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import re
+import time
+import calendar
+import shutil
+import tempfile
+import threading
+import unittest
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import feedparser
+import requests
+
+from feed_external_links import (
+    COMMAND_OPTION,
+    DEAD_LINK_STATUSES,
+    EntriesDataType,
+    EntryIndex,
+    FeedCacheDataType,
+    FeedCacheStatus,
+    FeedFetchResultTypedDict,
+    FeedParserType,
+    HistoryStore,
+    KeywordMatcher,
+    LinkChecker,
+    LinkRetention,
+    MatchesDataType,
+    ProxyRouter,
+    QueryPlan,
+    ShardLeases,
+    SourceMarkTypedDict,
+    check_link,
+    get_untitled_entry_label,
+    iter_source_config,
+    parse_feed,
+    search_entries,
+    update_feed_cache
+)
+
+
+class FeedCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "feed.xml")
+        self.write_feed(["News of day 1"])
+        self.feed_cache: FeedCacheDataType = {}
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def write_feed(self, titles: List[str]) -> None:
+        items = [f"<item><title>{title}</title><link>http://example.org/{i}</link></item>" for i, title in enumerate(titles)]
+        with open(self.path, "wb") as file:
+            file.write(get_rss_content(items))
+
+    def create_plan(self, keywords: List[str]) -> QueryPlan:
+        return QueryPlan({"sources": [self.path], "queries": [{"pages": ["News"], "keywords": keywords}]})
+
+    def fetch(self, plan: QueryPlan, is_saved: bool = True) -> FeedFetchResultTypedDict:
+        """Fetch the feed with the cache, and update the cache with the result unless the page of the source failed to be saved."""
+
+        source_config = dict(iter_source_config(COMMAND_OPTION.copy(), self.feed_cache, None, {self.path: plan}, ProxyRouter({}, [])))
+        fetch_result = source_config[self.path]["fetch_result"]
+        if fetch_result["feed"] is not None:
+            list(fetch_result["feed"].entries)
+
+        if not is_saved:
+            fetch_result["cache_value"] = None
+
+        update_feed_cache(self.feed_cache, source_config)
+        return fetch_result
+
+    def test_same_content_is_not_parsed_again(self) -> None:
+        plan = self.create_plan(["news"])
+        self.assertEqual(self.fetch(plan)["cache_status"], FeedCacheStatus.MISS)
+        self.assertEqual(self.feed_cache[self.path]["config_hash"], plan.config_hash)
+
+        fetch_result = self.fetch(plan)
+        self.assertEqual(fetch_result["cache_status"], FeedCacheStatus.SAME_CONTENT)
+        self.assertIsNone(fetch_result["feed"])
+
+    def test_changed_content_is_parsed(self) -> None:
+        plan = self.create_plan(["news"])
+        self.fetch(plan)
+        self.write_feed(["News of day 2", "News of day 1"])
+        fetch_result = self.fetch(plan)
+        self.assertEqual(fetch_result["cache_status"], FeedCacheStatus.MISS)
+        self.assertIsNotNone(fetch_result["feed"])
+
+    def test_changed_config_is_matched_again(self) -> None:
+        self.fetch(self.create_plan(["news"]))
+        plan = self.create_plan(["news", "day"])
+        self.assertEqual(self.fetch(plan)["cache_status"], FeedCacheStatus.MISS)
+        self.assertEqual(self.feed_cache[self.path]["config_hash"], plan.config_hash)
+        self.assertEqual(self.fetch(plan)["cache_status"], FeedCacheStatus.SAME_CONTENT)
+
+    def test_config_hash(self) -> None:
+        config = {"sources": [self.path], "queries": [{"pages": ["News"], "keywords": ["news"]}]}
+        reordered_config = {"queries": [{"keywords": ["news"], "pages": ["News"]}], "sources": [self.path]}
+        self.assertEqual(QueryPlan(config).config_hash, QueryPlan(reordered_config).config_hash)
+        self.assertNotEqual(QueryPlan(config).config_hash, self.create_plan(["day"]).config_hash)
+
+    def test_failed_source_is_not_cached(self) -> None:
+        plan = self.create_plan(["news"])
+        self.fetch(plan)
+        cache_value = self.feed_cache[self.path]
+
+        self.write_feed(["News of day 2", "News of day 1"])
+        self.assertEqual(self.fetch(plan, is_saved=False)["cache_status"], FeedCacheStatus.MISS)
+        self.assertEqual(self.feed_cache[self.path], cache_value)
+        self.assertEqual(self.fetch(plan)["cache_status"], FeedCacheStatus.MISS)
+
+    def test_bozo_feed_is_not_cached(self) -> None:
+        with open(self.path, "wb") as file:
+            file.write(b"<rss version=\"2.0\"><channel><item><title>A & B</title></item>")
+
+        self.fetch(self.create_plan(["news"]))
+        self.assertNotIn(self.path, self.feed_cache)
+
+
+# The status and the location of each path of the link server.
+LINK_ROUTES: Dict[str, Tuple[int, Optional[str]]] = {
+    "/ok": (200, None),
+    "/gone": (404, None),
+    "/removed": (410, None),
+    "/moved": (301, "/ok"),
+    "/moved-again": (308, "/moved"),
+    "/found": (302, "/ok"),
+    "/moved-then-found": (301, "/found"),
+    "/forbidden": (403, None),
+    "/error": (500, None),
+}
+
+
+class LinkRequestHandler(BaseHTTPRequestHandler):
+    # The method, path and range header of each request received.
+    requests: List[Tuple[str, str, Optional[str]]] = []
+
+    def respond(self, has_body: bool) -> None:
+        self.requests.append((self.command, self.path, self.headers.get("Range")))
+        if self.path == "/no-head":
+            # A server that does not allow HEAD requests.
+            status, location = ((405, None) if self.command == "HEAD" else (206, None))
+        else:
+            status, location = LINK_ROUTES.get(self.path, (404, None))
+
+        body = (b"x" if has_body and status < 300 else b"")
+        self.send_response(status)
+        if location is not None:
+            self.send_header("Location", location)
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self) -> None:
+        self.respond(False)
+
+    def do_GET(self) -> None:
+        self.respond(True)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class LinkServerTestCase(unittest.TestCase):
+    server: ThreadingHTTPServer
+    base_url: str
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), LinkRequestHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        LinkRequestHandler.requests.clear()
+
+    def get_requested_paths(self) -> List[str]:
+        return [path for method, path, range_header in LinkRequestHandler.requests]
+
+
+class CheckLinkTest(LinkServerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.session = requests.Session()
+        self.session.trust_env = False
+
+    def tearDown(self) -> None:
+        self.session.close()
+
+    def check(self, path: str) -> Optional[Dict[str, object]]:
+        cache_value = check_link(self.base_url + path, {}, self.session, 10)
+        return (dict(cache_value) if cache_value is not None else None)
+
+    def test_live_link(self) -> None:
+        cache_value = self.check("/ok")
+        assert cache_value is not None
+        self.assertEqual(cache_value["status"], 200)
+        self.assertNotIn("location", cache_value)
+
+    def test_dead_links(self) -> None:
+        for path in ("/gone", "/removed"):
+            with self.subTest(path=path):
+                cache_value = self.check(path)
+                assert cache_value is not None
+                self.assertIn(cache_value["status"], DEAD_LINK_STATUSES)
+
+    def test_permanent_redirects_are_canonicalized(self) -> None:
+        for path in ("/moved", "/moved-again"):
+            with self.subTest(path=path):
+                cache_value = self.check(path)
+                assert cache_value is not None
+                self.assertEqual(cache_value["status"], 200)
+                self.assertEqual(cache_value["location"], self.base_url + "/ok")
+
+    def test_temporary_redirects_are_not_canonicalized(self) -> None:
+        for path in ("/found", "/moved-then-found"):
+            with self.subTest(path=path):
+                cache_value = self.check(path)
+                assert cache_value is not None
+                self.assertEqual(cache_value["status"], 200)
+                self.assertNotIn("location", cache_value)
+
+    def test_ranged_get_after_failed_head(self) -> None:
+        cache_value = self.check("/no-head")
+        assert cache_value is not None
+        self.assertEqual(cache_value["status"], 206)
+        self.assertEqual(LinkRequestHandler.requests, [("HEAD", "/no-head", None), ("GET", "/no-head", "bytes=0-0")])
+
+    def test_unknown_results(self) -> None:
+        for path in ("/forbidden", "/error"):
+            with self.subTest(path=path):
+                self.assertIsNone(self.check(path))
+
+        self.assertIsNone(check_link("http://127.0.0.1:1/", {}, self.session, 10))
+
+
+class LinkCheckerTest(LinkServerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.link_checker = LinkChecker(ProxyRouter({}, []), {}, ttl=3600, timeout=10)
+
+    def tearDown(self) -> None:
+        self.link_checker.close()
+
+    def check(self, paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        return self.link_checker.check(self.base_url + path for path in paths)
+
+    def test_replacements(self) -> None:
+        checked_links = self.check(["/ok", "/gone", "/moved", "/found", "/error"])
+        self.assertEqual(checked_links, {
+            self.base_url + "/ok": self.base_url + "/ok",
+            self.base_url + "/gone": None,
+            self.base_url + "/moved": self.base_url + "/ok",
+            self.base_url + "/found": self.base_url + "/found",
+            self.base_url + "/error": self.base_url + "/error",
+        })
+
+    def test_unknown_results_are_not_cached(self) -> None:
+        self.check(["/ok", "/gone", "/error"])
+        self.assertEqual(set(self.link_checker.get_link_cache()), {self.base_url + "/ok", self.base_url + "/gone"})
+
+        LinkRequestHandler.requests.clear()
+        self.check(["/ok", "/gone", "/error"])
+        self.assertEqual(set(self.get_requested_paths()), {"/error"})
+
+    def test_expired_results_are_checked_again(self) -> None:
+        self.check(["/ok"])
+        self.link_checker.link_cache[self.base_url + "/ok"]["checked"] = time.time() - 7200
+        self.assertEqual(self.link_checker.get_link_cache(), {})
+
+        LinkRequestHandler.requests.clear()
+        self.check(["/ok"])
+        self.assertEqual(set(self.get_requested_paths()), {"/ok"})
+
+
+def get_rss_content(items: Iterable[str]) -> bytes:
+    return ("<?xml version=\"1.0\"?><rss version=\"2.0\"><channel><title>Feed</title>" + "".join(items) + "</channel></rss>").encode("utf8")
+
+
+def get_rss_item(number: int, title: Optional[str] = None, has_link: bool = True) -> str:
+    title = (title if title is not None else f"Entry {number}")
+    link = (f"<link>http://example.org/{number}</link>" if has_link else f"<guid isPermaLink=\"false\">entry-{number}</guid>")
+    return f"<item><title>{title}</title>{link}</item>"
+
+
+def iter_chunks(content: bytes, size: int = 64) -> Iterable[bytes]:
+    return [content[i:(i + size)] for i in range(0, len(content), size)]
+
+
+class StreamEntriesTest(unittest.TestCase):
+    def parse(self, content: bytes) -> Tuple[feedparser.FeedParserDict, List[feedparser.FeedParserDict]]:
+        feed = parse_feed(lambda: iter_chunks(content), None, FeedParserType.STREAM)
+        return feed, list(feed["entries"])
+
+    def assert_same_entries(self, content: bytes) -> None:
+        feed, entries = self.parse(content)
+        expected_entries = feedparser.parse(content).entries
+        self.assertEqual(feed["bozo"], 0)
+        self.assertEqual([(entry.get("title"), entry.get("link")) for entry in entries], [(entry.get("title"), entry.get("link")) for entry in expected_entries])
+
+    def test_streamed_entries(self) -> None:
+        self.assert_same_entries(get_rss_content(get_rss_item(number) for number in range(5)))
+
+    def test_fallback_after_title_markup(self) -> None:
+        items = [get_rss_item(0), get_rss_item(1), get_rss_item(2, "&lt;b&gt;Bold&lt;/b&gt; entry"), get_rss_item(3)]
+        self.assert_same_entries(get_rss_content(items))
+
+    def test_fallback_after_item_without_link(self) -> None:
+        items = [get_rss_item(0), get_rss_item(1, has_link=False), get_rss_item(2)]
+        self.assert_same_entries(get_rss_content(items))
+
+    def test_fallback_after_malformed_xml(self) -> None:
+        # feedparser cannot parse the feed strictly either, so the entries streamed before the error are kept and the feed is bozo.
+        items = [get_rss_item(0), get_rss_item(1), get_rss_item(2, "Salt & pepper"), get_rss_item(3)]
+        feed, entries = self.parse(get_rss_content(items))
+        self.assertEqual([entry["link"] for entry in entries], ["http://example.org/0", "http://example.org/1"])
+        self.assertEqual(feed["bozo"], 1)
+        self.assertIn("bozo_exception", feed)
+
+
+# Keywords of several queries, with literal words and phrases, and regexes.
+MATCHER_QUERY_KEYWORDS: List[List[str]] = [
+    ["nuclear", "Fusion power", "ITER"],
+    ["fusion", "power plant", "e-mail", "U.S."],
+    ["Café", "zürich", "solar|wind", r"Straße\s+\d+", "mail"],
+]
+
+MATCHER_TITLES: List[str] = [
+    "Nuclear fusion power plant opens",
+    "ITER reaches a milestone",
+    "FUSION POWER for everyone",
+    "Fusion powered cars",
+    "A café in Zürich closes",
+    "Send an e-mail to the U.S. embassy",
+    "Emailing the US",
+    "Solar and wind farms",
+    "Windy day",
+    "Straße 5 closed",
+    "Nuclear &amp; <b>fusion</b> news",
+]
+
+
+def match_keywords_with_regexes(query_keywords: List[List[str]], text: str) -> Dict[int, Set[str]]:
+    """Match each keyword with its own case-insensitive regex, as before the keyword matcher."""
+
+    query_matches: Dict[int, Set[str]] = {}
+    for q, keywords in enumerate(query_keywords):
+        for keyword in keywords:
+            if re.search(r"\b({0})\b".format(keyword), text, flags=re.IGNORECASE) is not None:
+                query_matches.setdefault(q, set()).add(keyword)
+
+    return query_matches
+
+
+class KeywordMatcherTest(unittest.TestCase):
+    def match(self, query_keywords: List[List[str]], title: str) -> Dict[int, Set[str]]:
+        entry_index = EntryIndex(feedparser.FeedParserDict(title=title))
+        return {q: set(keywords) for q, keywords in KeywordMatcher(query_keywords).match(entry_index, "title").items()}
+
+    def test_same_matches_as_regexes(self) -> None:
+        for title in MATCHER_TITLES:
+            with self.subTest(title=title):
+                expected_matches = match_keywords_with_regexes(MATCHER_QUERY_KEYWORDS, EntryIndex(feedparser.FeedParserDict(title=title)).get_text("title"))
+                self.assertEqual(self.match(MATCHER_QUERY_KEYWORDS, title), expected_matches)
+
+    def test_regex_keywords_match_the_text_that_is_not_folded(self) -> None:
+        self.assertEqual(self.match([[r"Straße\s+\d+"]], "Straße 5 closed"), {0: {r"Straße\s+\d+"}})
+        self.assertEqual(self.match([[r"Strasse\s+\d+"]], "Straße 5 closed"), {})
+
+    def test_literal_keywords_are_folded(self) -> None:
+        self.assertEqual(self.match([["istanbul"]], "İstanbul news"), {0: {"istanbul"}})
+        self.assertEqual(self.match([["Strasse"]], "Straße 5 closed"), {0: {"Strasse"}})
+        self.assertEqual(self.match([["fusion power"]], "Fusion\u00a0power"), {0: {"fusion power"}})
+
+
+def get_day_timestamp(day: int) -> float:
+    return float(calendar.timegm((2020, 1, day, 0, 0, 0)))
+
+
+def get_dated_rss_item(day: int) -> str:
+    return f"<item><title>News of day {day}</title><link>http://example.org/{day}</link><pubDate>{formatdate(get_day_timestamp(day), usegmt=True)}</pubDate></item>"
+
+
+class SearchEntriesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.plan = QueryPlan({"sources": ["http://example.org/rss.xml"], "queries": [{"pages": ["News"], "keywords": ["news"]}]})
+
+    def search(
+        self,
+        days: List[int],
+        mark_day: Optional[int] = None,
+        min_published_day: Optional[int] = None
+    ) -> Tuple[List[str], Optional[SourceMarkTypedDict]]:
+        """Search a feed of the entries of `days` in order, and get the links matched and the new mark."""
+
+        feed = feedparser.parse(get_rss_content(get_dated_rss_item(day) for day in days))
+        mark: Optional[SourceMarkTypedDict] = None
+        if mark_day is not None:
+            mark = {"guid": f"http://example.org/{mark_day}", "published": get_day_timestamp(mark_day)}
+
+        min_published = (get_day_timestamp(min_published_day) if min_published_day is not None else None)
+        matches: MatchesDataType = [[] for query in self.plan.queries]
+        keyword_matches, regex_matches, new_mark = search_entries(feed, self.plan, matches, mark, min_published)
+        return [entry.link for entry in matches[0]], new_mark
+
+    def test_date_ordered_feed_stops_at_the_mark(self) -> None:
+        links, new_mark = self.search([30, 25, 20, 10], mark_day=20)
+        self.assertEqual(links, ["http://example.org/30", "http://example.org/25"])
+        self.assertEqual(new_mark, {"guid": "http://example.org/30", "published": get_day_timestamp(30)})
+
+    def test_no_new_entries(self) -> None:
+        links, new_mark = self.search([20, 10], mark_day=20)
+        self.assertEqual(links, [])
+        self.assertEqual(new_mark, {"guid": "http://example.org/20", "published": get_day_timestamp(20)})
+
+    def test_pinned_old_entry_does_not_stop_at_the_mark(self) -> None:
+        links, new_mark = self.search([1, 30, 20, 10], mark_day=20)
+        self.assertIn("http://example.org/30", links)
+        self.assertNotIn("http://example.org/1", links)
+        self.assertEqual(new_mark, {"guid": "http://example.org/30", "published": get_day_timestamp(30)})
+
+    def test_pinned_old_entry_does_not_stop_at_min_published(self) -> None:
+        links, new_mark = self.search([1, 30, 20, 10], min_published_day=15)
+        self.assertEqual(links, ["http://example.org/30", "http://example.org/20"])
+        self.assertEqual(new_mark, {"guid": "http://example.org/30", "published": get_day_timestamp(30)})
+
+    def test_unordered_feed_is_read_completely(self) -> None:
+        links, new_mark = self.search([25, 30, 10], mark_day=20)
+        self.assertEqual(links, ["http://example.org/25", "http://example.org/30", "http://example.org/10"])
+        self.assertEqual(new_mark, {"guid": "http://example.org/30", "published": get_day_timestamp(30)})
+
+
+class UntitledEntriesTest(unittest.TestCase):
+    def search(self, items: List[str]) -> EntriesDataType:
+        plan = QueryPlan({"sources": ["http://example.org/rss.xml"], "fields": ["title", "summary"], "queries": [{"pages": ["News"], "keywords": ["news"]}]})
+        matches: MatchesDataType = [[] for query in plan.queries]
+        search_entries(feedparser.parse(get_rss_content(items)), plan, matches)
+        return matches[0]
+
+    def test_summary_is_the_title(self) -> None:
+        entries = self.search(["<item><description>Breaking &lt;b&gt;news&lt;/b&gt;\n of the day</description><link>http://example.org/1</link></item>"])
+        self.assertEqual([(entry.title, entry.link) for entry in entries], [("Breaking news of the day", "http://example.org/1")])
+
+    def test_long_summary_is_truncated(self) -> None:
+        entries = self.search(["<item><description>News " + ("word " * 50) + "</description><link>http://example.org/1</link></item>"])
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(entries[0].title.startswith("News word word"))
+        self.assertTrue(entries[0].title.endswith("word…"))
+        self.assertLessEqual(len(entries[0].title), 101)
+
+    def test_link_is_the_title_without_a_summary(self) -> None:
+        self.assertEqual(get_untitled_entry_label(feedparser.FeedParserDict(), "http://example.org/1"), "http://example.org/1")
+
+    def test_entry_without_a_link_is_discarded(self) -> None:
+        self.assertEqual(self.search(["<item><title>News of the day</title><description>News</description></item>"]), [])
+
+
+class LinkRetentionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.history = HistoryStore(":memory:", False)
+        self.link_times: Dict[str, float] = {f"http://example.org/{number}": float(number) for number in range(1, 6)}
+
+    def prune(
+        self,
+        section_text: str,
+        now: float = 10,
+        max_links: Optional[int] = None,
+        max_age: Optional[float] = None,
+        batch: int = 1
+    ) -> Tuple[str, List[str]]:
+        link_retention = LinkRetention(self.history, max_links, max_age, batch)
+        return link_retention.prune_section_text(section_text, self.link_times, now)
+
+    def test_oldest_bot_links_are_removed(self) -> None:
+        section_text = "\n* [http://example.org/2 Two]\n* [http://example.org/1 One]\n* [http://example.org/3 Three]\n"
+        revised_section_text, pruned_lines = self.prune(section_text, max_links=1)
+        self.assertEqual(pruned_lines, ["* [http://example.org/2 Two]", "* [http://example.org/1 One]"])
+        self.assertEqual(revised_section_text, "\n* [http://example.org/3 Three]\n")
+
+    def test_lines_not_added_by_the_bot_are_kept(self) -> None:
+        section_text = "\n".join([
+            "",
+            "* [http://example.org/other Not in the history]",
+            "* [http://example.org/1 One] (in German)",
+            "** [http://example.org/2 Two]",
+            "*[http://example.org/3 Three]",
+            "<ref>",
+            "* [http://example.org/4 Four]",
+            "</ref>",
+            "* [http://example.org/5 Five]",
+            "",
+        ])
+        revised_section_text, pruned_lines = self.prune(section_text, max_links=0)
+        self.assertEqual(pruned_lines, ["* [http://example.org/5 Five]"])
+        self.assertEqual(revised_section_text, section_text.replace("* [http://example.org/5 Five]\n", ""))
+
+    def test_max_age(self) -> None:
+        section_text = "\n* [http://example.org/1 One]\n* [http://example.org/4 Four]\n"
+        revised_section_text, pruned_lines = self.prune(section_text, now=6, max_age=3)
+        self.assertEqual(pruned_lines, ["* [http://example.org/1 One]"])
+        self.assertEqual(revised_section_text, "\n* [http://example.org/4 Four]\n")
+
+    def test_batch(self) -> None:
+        section_text = "\n* [http://example.org/1 One]\n* [http://example.org/2 Two]\n* [http://example.org/3 Three]\n"
+        self.assertEqual(self.prune(section_text, max_links=2, batch=2), (section_text, []))
+        self.assertEqual(len(self.prune(section_text, max_links=1, batch=2)[1]), 2)
+
+    def test_only_the_external_links_section_is_pruned(self) -> None:
+        self.history.add("Page", ["http://example.org/1"])
+        text = "Intro\n== See also ==\n* [http://example.org/1 One]\n== External links ==\n* [http://example.org/1 One]\n"
+        revised_text, pruned_lines = LinkRetention(self.history, max_links=0).prune("Page", text, [])
+        self.assertEqual(pruned_lines, ["* [http://example.org/1 One]"])
+        self.assertEqual(revised_text, "Intro\n== See also ==\n* [http://example.org/1 One]\n== External links ==\n")
+
+
+class ShardLeasesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "shards.sqlite")
+        self.shard_leases: List[ShardLeases] = []
+
+    def tearDown(self) -> None:
+        for shard_leases in self.shard_leases:
+            shard_leases.close()
+
+        shutil.rmtree(self.directory)
+
+    def create(self, instance_id: str) -> ShardLeases:
+        shard_leases = ShardLeases(self.path, instance_id, 16, 600)
+        self.shard_leases.append(shard_leases)
+        return shard_leases
+
+    def test_instances_started_together_share_the_shards(self) -> None:
+        first, second = self.create("first"), self.create("second")
+        first.join(0)
+        second.join(0)
+        first_shards, second_shards = first.acquire(), second.acquire()
+        self.assertEqual(len(first_shards), 8)
+        self.assertEqual(len(second_shards), 8)
+        self.assertEqual(first_shards | second_shards, set(range(16)))
+
+        for title in ("A", "B", "C", "Main Page"):
+            self.assertNotEqual(first.owns(title), second.owns(title))
+
+    def test_later_instance_gets_its_share_after_a_release(self) -> None:
+        first = self.create("first")
+        first.join(0)
+        self.assertEqual(first.acquire(), set(range(16)))
+
+        second = self.create("second")
+        second.join(0)
+        self.assertEqual(second.acquire(), set())
+        self.assertEqual(first.acquire(), set(range(8)))
+        self.assertEqual(second.acquire(), set(range(8, 16)))
+
+    def test_closed_instance_releases_its_shards(self) -> None:
+        first, second = self.create("first"), self.create("second")
+        first.join(0)
+        second.join(0)
+        first.acquire()
+        second.acquire()
+
+        self.shard_leases.remove(first)
+        first.close()
+        self.assertEqual(second.acquire(), set(range(16)))
+
+
+if __name__ == "__main__":
+    unittest.main()